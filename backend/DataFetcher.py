@@ -1,25 +1,267 @@
 # backend/DataFetcher.py
+import codecs
 import requests
-from bs4 import BeautifulSoup
-import sqlite3
+from bs4 import BeautifulSoup, SoupStrainer
 import os
+import re
+import time
 import chardet
+from backend import aggregates, analytics
+from backend.db import resolve_path, get_write_connection
+from backend.fetch_meta import FetchMetaStore, hash_bytes, hash_file
+from backend.Listing import to_db_row, listing_key, content_hash
+from backend.metrics import (
+    INGEST_ROWS,
+    INGEST_BATCH_SECONDS,
+    INGEST_ROWS_PER_SECOND)
+from backend.queries import UPSERT_LISTING, BUMP_DATA_VERSION
+from backend.stream_parser import clean_text, iter_listings
+
+# SQLite ограничивает число параметров в одном запросе
+KEY_LOOKUP_CHUNK = 500
+# Для определения кодировки хватает начала файла
+ENCODING_SAMPLE_SIZE = 1 << 16
+# Таймауты (подключение, чтение) для HTTP-запросов, секунды
+DEFAULT_TIMEOUT = (5, 30)
+# На этапе фильтрации SoupStrainer видит class одной строкой
+LISTING_ITEM_CLASS = re.compile(r"(^|\s)listing-item(\s|$)")
+
+
+def sniff_encoding(file_path):
+    """Кодировка файла и уверенность chardet, без вывода.
+
+    ASCII-начало (скрипты, стили, комментарии) о кодировке ничего не
+    говорит, поэтому файл читается кусками до первого куска с не-ASCII
+    байтами. Он строго декодируется как UTF-8, а при ошибке кодировку
+    определяет chardet.
+    """
+    # Инкрементальный декодер не считает ошибкой символ на границе куска
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(file_path, 'rb') as file:
+        while True:
+            sample = file.read(ENCODING_SAMPLE_SIZE)
+            if not sample:
+                # Весь файл в ASCII - он же корректный UTF-8
+                return 'utf-8', 1.0
+            if sample.isascii():
+                continue
+            try:
+                # Большинство страниц в UTF-8; медленный chardet - для остальных
+                decoder.decode(sample)
+                return 'utf-8', 1.0
+            except UnicodeDecodeError:
+                pass
+            # chardet смотрит на текст с первого не-ASCII байта: длинный
+            # ASCII-хвост перед ним сбивает определение
+            start = next(index for index, byte in enumerate(sample)
+                         if byte >= 0x80)
+            sample = sample[start:] + file.read(start)
+            break
+    result = chardet.detect(sample)
+    encoding = result['encoding'] or 'utf-8'
+    if encoding.lower() == 'ascii':
+        # ASCII-начало не гарантирует ASCII-хвост
+        encoding = 'utf-8'
+    return encoding, result['confidence'] or 0.0
+
+
+def parse_file(file_path):
+    """Все объявления локального файла списком; годится для пула процессов"""
+    encoding, _ = sniff_encoding(file_path)
+    with open(file_path, 'r', encoding=encoding, errors='replace') as file:
+        return list(iter_listings(file))
+
+
+def empty_stats():
+    """Счетчики записи: добавлено, обновлено, без изменений"""
+    return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+
+class ListingWriter:
+    """Запись объявлений в базу db_path: UPSERT, сводки и версия данных.
+
+    Ничего не скачивает и не разбирает; годится для любых загрузчиков.
+    """
+
+    def __init__(self, db_path=None, geocoder=None):
+        self.db_path = resolve_path(db_path)
+        # backend.geocoding.Geocoder: координаты для строк без них
+        self.geocoder = geocoder
+
+    def save(self, listings):
+        """Сохраняет данные в SQLite одной транзакцией без дубликатов.
+
+        Возвращает словарь со счетчиками inserted / updated / unchanged.
+        """
+        stats = empty_stats()
+        if not listings:
+            print("Нет данных для сохранения")
+            return stats
+        started = time.perf_counter()
+
+        # Внутри пачки побеждает последняя версия объявления
+        rows = {}
+        for item in listings:
+            row = to_db_row(item)
+            rows[listing_key(row)] = row
+
+        # Соединение писателя живет в пуле потока: WAL и схема уже готовы
+        conn = get_write_connection(self.db_path)
+        if self.geocoder is not None:
+            # До хеширования: координаты входят в хеш содержимого строки
+            self.geocoder.fill_coordinates(conn, rows)
+        # Чтение существующих строк, запись и приращения сводок - одна
+        # транзакция под блокировкой записи: иначе параллельный писатель
+        # между чтением и записью применил бы те же приращения дважды
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            changes = self._diff_rows(conn, rows, stats)
+            if changes is not None:
+                batch, deltas, sketch_deltas = changes
+                conn.executemany(UPSERT_LISTING, batch)
+                aggregates.apply_deltas(conn, deltas)
+                analytics.apply_deltas(conn, sketch_deltas)
+                conn.execute(BUMP_DATA_VERSION)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        elapsed = time.perf_counter() - started
+        INGEST_BATCH_SECONDS.observe(elapsed)
+        INGEST_ROWS_PER_SECOND.set(len(listings) / max(elapsed, 1e-9))
+        for result, count in stats.items():
+            INGEST_ROWS.inc(count, result=result)
+        print(f"База {self.db_path}: добавлено {stats['inserted']}, "
+              f"обновлено {stats['updated']}, без изменений {stats['unchanged']}")
+        return stats
+
+    @staticmethod
+    def _diff_rows(conn, rows, stats):
+        """Сравнивает пачку с базой: (строки для записи, приращения
+        listing_stats, приращения price_sketch) или None, если менять нечего.
+
+        Считает inserted / updated / unchanged в stats.
+        """
+        keys = list(rows)
+        existing = {}
+        for start in range(0, len(keys), KEY_LOOKUP_CHUNK):
+            chunk = keys[start:start + KEY_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            for key, *old in conn.execute(
+                    f"SELECT listing_key, content_hash, district, rooms, "
+                    f"price, area, lat, lon FROM listings "
+                    f"WHERE listing_key IN ({placeholders})", chunk):
+                existing[key] = old
+
+        batch = []
+        deltas = {}
+        sketch_deltas = {}
+        for key, row in rows.items():
+            old = existing.get(key)
+            if (old is not None and row[12] == 0 and row[13] == 0
+                    and (old[5] or old[6])):
+                # Загрузка без геокодера не затирает найденные раньше
+                # координаты: без них страница отличалась бы только нулями
+                row = row[:12] + (old[5], old[6])
+            row_hash = content_hash(row)
+            if old is None:
+                stats["inserted"] += 1
+            elif old[0] != row_hash:
+                stats["updated"] += 1
+                aggregates.add_delta(deltas, old[1], old[2], old[3], -1)
+                analytics.add_delta(sketch_deltas, old[1], old[2], old[3],
+                                    old[4], -1)
+            else:
+                stats["unchanged"] += 1
+                continue
+            aggregates.add_delta(deltas, row[9], row[3], row[1], +1)
+            analytics.add_delta(sketch_deltas, row[9], row[3], row[1], row[2],
+                                +1)
+            batch.append(row + (key, row_hash))
+        if not batch:
+            return None
+        return batch, deltas, sketch_deltas
+
+    def save_batch(self, listings, fetchers=(), totals=None):
+        """Сохраняет объявления нескольких источников одной пачкой.
+
+        Метаданные источников (fetchers) фиксируются только после записи,
+        поэтому прерванная загрузка при повторе прочитает их заново.
+        Счетчики записи прибавляются к totals; возвращает totals.
+        """
+        if totals is None:
+            totals = empty_stats()
+        for key, value in self.save(listings).items():
+            totals[key] += value
+        for fetcher in fetchers:
+            fetcher.commit_fetch_meta()
+        return totals
 
 
 class DataFetcher:
-    def __init__(self, source, db_path="data.db"):
+    def __init__(self, source, db_path=None, batch_size=1000,
+                 session=None, timeout=DEFAULT_TIMEOUT, use_meta=True,
+                 geocoder=None):
         self.source = source
-        self.db_path = db_path
+        self.db_path = resolve_path(db_path)
+        self.batch_size = batch_size
+        self.session = session
+        self.timeout = timeout
         self.is_local_file = os.path.isfile(source)
+        self.meta_store = FetchMetaStore(db_path) if use_meta else None
+        self.not_modified = False
+        # Запись в базу; geocoder (backend.geocoding.Geocoder) дает
+        # координаты строкам без них
+        self.writer = ListingWriter(db_path, geocoder)
+        # Фоновая загрузка фиксирует метаданные сама, из потока-писателя
+        self.defer_meta = False
+        self._pending_meta = None
+
+    @property
+    def meta_key(self):
+        return os.path.abspath(self.source) if self.is_local_file else self.source
+
+    def _stored_meta(self):
+        if not self.meta_store:
+            return None
+        return self.meta_store.get(self.meta_key)
+
+    def commit_fetch_meta(self):
+        """Запоминает метаданные источника после успешной записи в базу"""
+        if self.meta_store and self._pending_meta:
+            self.meta_store.save(self.meta_key, self._pending_meta)
+        self._pending_meta = None
+
+    def _unchanged_meta(self):
+        """Метаданные неизменившегося источника: сразу или позже, писателем"""
+        if not self.defer_meta:
+            self.commit_fetch_meta()
+
+    def local_file_unchanged(self):
+        """Сравнивает файл с прошлым запуском: сначала размер и mtime, затем хеш"""
+        stat = os.stat(self.source)
+        meta = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        old = self._stored_meta()
+        if old and (old["size"], old["mtime_ns"]) == (meta["size"],
+                                                      meta["mtime_ns"]):
+            return True
+        if not self.meta_store:
+            return False
+        meta["content_hash"] = hash_file(self.source)
+        self._pending_meta = meta
+        if old and old["content_hash"] == meta["content_hash"]:
+            # Файл перезаписан тем же содержимым - обновляем только mtime
+            self._unchanged_meta()
+            return True
+        return False
 
     def detect_encoding(self, file_path):
-        """Определяет кодировку файла"""
-        with open(file_path, 'rb') as file:
-            result = chardet.detect(file.read())
-            encoding = result['encoding'] or 'utf-8'
-            print(
-                f"Определена кодировка: {encoding} (уверенность: {result['confidence']:.2f})")
-            return encoding
+        """Определяет кодировку файла по его началу"""
+        encoding, confidence = sniff_encoding(file_path)
+        print(
+            f"Определена кодировка: {encoding} (уверенность: {confidence:.2f})")
+        return encoding
 
     def fetch(self):
         """Читает локальный файл или скачивает страницу"""
@@ -37,10 +279,33 @@ class DataFetcher:
                 return None
         else:
             print(f"Загружаю страницу: {self.source}")
+            self.not_modified = False
+            old = self._stored_meta()
+            headers = {"User-Agent": "Mozilla/5.0"}
+            if old and old["etag"]:
+                headers["If-None-Match"] = old["etag"]
+            if old and old["last_modified"]:
+                headers["If-Modified-Since"] = old["last_modified"]
             try:
-                response = requests.get(self.source,
-                                        headers={"User-Agent": "Mozilla/5.0"})
+                http = self.session or requests
+                response = http.get(self.source, headers=headers,
+                                    timeout=self.timeout)
+                if response.status_code == 304:
+                    print("Страница не изменилась (304)")
+                    self.not_modified = True
+                    return None
                 if response.status_code == 200:
+                    self._pending_meta = {
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "content_hash": hash_bytes(response.content),
+                    }
+                    if old and old["content_hash"] == self._pending_meta[
+                            "content_hash"]:
+                        print("Содержимое страницы не изменилось")
+                        self.not_modified = True
+                        self._unchanged_meta()
+                        return None
                     print(
                         f"Страница загружена, размер: {len(response.text)} символов")
                     return response.text
@@ -51,7 +316,8 @@ class DataFetcher:
 
     def parse(self, html):
         """Извлекает данные из HTML"""
-        soup = BeautifulSoup(html, "html.parser")
+        only_items = SoupStrainer("div", class_=LISTING_ITEM_CLASS)
+        soup = BeautifulSoup(html, "html.parser", parse_only=only_items)
         listings = []
 
         for item in soup.find_all("div", class_="listing-item"):
@@ -65,72 +331,74 @@ class DataFetcher:
         print(f"Всего найдено {len(listings)} объявлений")
         return listings
 
+    def iter_listings(self):
+        """Потоково читает локальный файл и отдает объявления по одному"""
+        encoding = self.detect_encoding(self.source)
+        with open(self.source, 'r', encoding=encoding,
+                  errors='replace') as file:
+            yield from iter_listings(file)
+
     @staticmethod
     def clean_text(text):
         """Очищает текст от лишних пробелов и символов"""
-        return ' '.join(text.split()).strip() if text else ""
+        return clean_text(text)
 
     def save_to_db(self, listings):
-        """Сохраняет данные в SQLite с поддержкой всех полей"""
-        if not listings:
-            print("Нет данных для сохранения")
-            return
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS listings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                address TEXT,
-                price TEXT,
-                rooms INTEGER DEFAULT 0,
-                district TEXT DEFAULT 'Неизвестный',
-                lat REAL DEFAULT 0.0,
-                lon REAL DEFAULT 0.0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        for item in listings:
-            cur.execute(
-                """INSERT INTO listings (address, price, rooms, district, lat, lon)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (
-                    item.get("address", ""),
-                    item.get("price", ""),
-                    item.get("rooms", 0),
-                    item.get("district", "Неизвестный"),
-                    item.get("lat", 0.0),
-                    item.get("lon", 0.0)
-                )
-            )
-        conn.commit()
-        conn.close()
-        print(f"Сохранено {len(listings)} записей в базу {self.db_path}")
+        """Сохраняет данные в SQLite одной транзакцией без дубликатов.
+
+        Возвращает словарь со счетчиками inserted / updated / unchanged.
+        """
+        return self.writer.save(listings)
+
+    def run_streaming(self):
+        """Потоковый цикл для локальных файлов: память не зависит от размера"""
+        totals = empty_stats()
+        if self.local_file_unchanged():
+            print(f"Файл не изменился с прошлой загрузки: {self.source}")
+            self.not_modified = True
+            return totals
+        print(f"Читаю локальный файл потоково: {self.source}")
+        batch = []
+        found = 0
+        for item in self.iter_listings():
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                found += len(batch)
+                self.writer.save_batch(batch, (), totals)
+                batch = []
+        if batch:
+            found += len(batch)
+            self.writer.save_batch(batch, (), totals)
+        print(f"Всего найдено {found} объявлений")
+        if not found:
+            print("Не найдено данных для сохранения.")
+        self.commit_fetch_meta()
+        return totals
 
     def run(self):
         """Полный цикл: скачать - распарсить - сохранить"""
+        if self.is_local_file:
+            return self.run_streaming()
         html = self.fetch()
+        if self.not_modified:
+            return empty_stats()
         if html:
             data = self.parse(html)
-            if data:
-                self.save_to_db(data)
-            else:
+            stats = self.save_to_db(data)
+            if not data:
                 print("Не найдено данных для сохранения.")
-        else:
-            print("Не удалось получить HTML-контент")
+            self.commit_fetch_meta()
+            return stats
+        print("Не удалось получить HTML-контент")
+        return None
 
 
 if __name__ == "__main__":
-    file_path = r"C:\Users\alikh\OneDrive\Desktop\Текстовый документ (2).txt"
-    if os.path.exists(file_path):
-        print(f"Файл найден: {file_path}")
-        print(f"Размер файла: {os.path.getsize(file_path)} байт")
-        fetcher = DataFetcher(file_path)
-        fetcher.run()
-
-        print("\nСодержимое базы данных:")
-        conn = sqlite3.connect("data.db")
-        for row in conn.execute("SELECT * FROM listings"):
-            print(f"  ID: {row[0]}, Адрес: {row[1]}, Цена: {row[2]}")
-        conn.close()
-    else:
-        print(f"Файл не найден: {file_path}")
+    import sys
+    if len(sys.argv) < 2:
+        print("Использование: python -m backend.DataFetcher <файл или URL> "
+              "[путь к базе]")
+        print("Каталоги и шаблоны файлов: python -m backend.bulk_import")
+        sys.exit(1)
+    DataFetcher(sys.argv[1],
+                db_path=sys.argv[2] if len(sys.argv) > 2 else None).run()
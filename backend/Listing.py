@@ -1,9 +1,15 @@
 # backend/Listing.py
 
+import hashlib
 import re
 
+_NON_NUMERIC = re.compile(r'[^\d.,]')
+
 
 class Listing:
+    __slots__ = ("id", "address", "price", "coords", "rooms", "area",
+                 "source")
+
     def __init__(self, id=None, address="", price="", coords=None, rooms=0,
                  area="", source=""):
         self.id = id
@@ -14,20 +20,24 @@ class Listing:
         self.area = self._clean_area(area)
         self.source = source.strip()
 
-    def _clean_price(self, price_str):
+    @staticmethod
+    def _clean_price(price_str):
         if not price_str:
             return 0.0
-        cleaned = re.sub(r'[^\d.,]', '', price_str.replace(' ', ''))
+        if isinstance(price_str, (int, float)):
+            return float(price_str)
+        cleaned = _NON_NUMERIC.sub('', price_str.replace(' ', ''))
         cleaned = cleaned.replace(',', '.')
         try:
             return float(cleaned)
         except ValueError:
             return 0.0
 
-    def _clean_area(self, area_input):
+    @staticmethod
+    def _clean_area(area_input):
         if not area_input:
             return 0.0
-        cleaned = re.sub(r'[^\d.,]', '', str(area_input).replace(' ', ''))
+        cleaned = _NON_NUMERIC.sub('', str(area_input).replace(' ', ''))
         cleaned = cleaned.replace(',', '.')
         try:
             return float(cleaned)
@@ -54,3 +64,57 @@ class Listing:
 
     def __repr__(self):
         return f"<Listing(id={self.id}, address='{self.address}', price={self.price})>"
+
+
+def _clean_int(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(Listing._clean_area(value))
+    except (ValueError, OverflowError):
+        return None
+
+
+def _clean_float(value, default=0.0):
+    try:
+        return float(value) if value not in (None, "") else default
+    except (ValueError, TypeError):
+        return default
+
+
+def to_db_row(item):
+    """Приводит словарь объявления к типам канонической схемы listings"""
+    rooms = item.get("rooms", item.get("rooms_count"))
+    area = item.get("area", item.get("total_meters"))
+    return (
+        (item.get("address") or "").strip(),
+        int(round(Listing._clean_price(item.get("price")))),
+        Listing._clean_area(area),
+        _clean_int(rooms) or 0,
+        _clean_int(item.get("floor")),
+        _clean_int(item.get("floors_count")),
+        item.get("object_type"),
+        item.get("house_material_type"),
+        _clean_int(item.get("year_of_construction")),
+        (item.get("district") or "Неизвестный").strip().capitalize(),
+        item.get("underground"),
+        item.get("url"),
+        _clean_float(item.get("lat")),
+        _clean_float(item.get("lon")),
+    )
+
+
+def listing_key(row):
+    """Естественный ключ строки: URL, а без него хеш адреса, цены и комнат"""
+    address, price, _, rooms = row[:4]
+    url = row[11]
+    if url:
+        return url
+    raw = f"{(address or '').lower()}|{price}|{rooms}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def content_hash(row):
+    """Хеш всех полей строки, чтобы не перезаписывать неизмененные"""
+    raw = "|".join("" if value is None else str(value) for value in row)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
@@ -0,0 +1,190 @@
+# backend/aggregates.py
+from backend.filter_sql import build_where, filter_clauses
+from backend.queries import (
+    UPSERT_LISTING_STATS,
+    DELETE_EMPTY_LISTING_STATS)
+
+# Ширина ценового интервала сводки, руб.
+PRICE_BUCKET_SIZE = 100000
+
+# Колонка группировки -> (выражение по сводке, выражение по объявлениям)
+GROUP_COLUMNS = {
+    "district": ("district", "district"),
+    "rooms": ("rooms", "rooms"),
+    "price_bucket": ("price_bucket", f"price / {PRICE_BUCKET_SIZE}"),
+}
+
+# Сколько точек рисует линейная диаграмма при любом объеме выборки
+LINE_CHART_POINTS = 100
+
+
+def bucket_of(price):
+    return int(price) // PRICE_BUCKET_SIZE
+
+
+def add_delta(deltas, district, rooms, price, sign):
+    """Копит изменение сводки для одной строки: sign = +1 или -1"""
+    key = (district, rooms, bucket_of(price))
+    count, price_sum = deltas.get(key, (0, 0))
+    deltas[key] = (count + sign, price_sum + sign * price)
+
+
+def apply_deltas(conn, deltas):
+    """Применяет накопленные приращения к listing_stats"""
+    rows = [key + value for key, value in deltas.items() if value != (0, 0)]
+    if rows:
+        conn.executemany(UPSERT_LISTING_STATS, rows)
+        conn.execute(DELETE_EMPTY_LISTING_STATS)
+
+
+def rebuild_stats(conn):
+    """Полностью пересчитывает сводку по таблице listings"""
+    conn.execute("DELETE FROM listing_stats")
+    conn.execute(f"""
+        INSERT INTO listing_stats (district, rooms, price_bucket, count,
+                                   price_sum)
+        SELECT district, rooms, price / {PRICE_BUCKET_SIZE}, COUNT(*),
+               SUM(price)
+        FROM listings
+        GROUP BY district, rooms, price / {PRICE_BUCKET_SIZE}
+    """)
+
+
+def _group_listings(conn, column, price_lo, price_hi, rooms, district, counts):
+    """GROUP BY по самим объявлениям в диапазоне [price_lo, price_hi)"""
+    column = GROUP_COLUMNS[column][1]
+    clauses, params = filter_clauses(rooms=rooms, district=district)
+    clauses.append("price >= ?")
+    params.append(price_lo)
+    if price_hi is not None:
+        clauses.append("price < ?")
+        params.append(price_hi)
+    sql = (f"SELECT {column}, COUNT(*) FROM listings "
+           f"WHERE {' AND '.join(clauses)} GROUP BY {column}")
+    for value, count in conn.execute(sql, params):
+        counts[value] = counts.get(value, 0) + count
+
+
+def count_by(conn, column, price_range=None, rooms=None, district=None,
+             q=None):
+    """Число объявлений по значениям column (ключ GROUP_COLUMNS).
+
+    Интервалы цен, целиком попадающие в фильтр, берутся из listing_stats;
+    по самим объявлениям считаются только неполные крайние интервалы.
+    Адресов в сводке нет, поэтому с поиском q считаются сами объявления.
+    """
+    if column not in GROUP_COLUMNS:
+        raise ValueError(f"Нельзя группировать по {column}")
+    if q:
+        where, params = build_where(price_range, rooms, district, q)
+        listing_column = GROUP_COLUMNS[column][1]
+        return dict(conn.execute(
+            f"SELECT {listing_column}, COUNT(*) FROM listings{where} "
+            f"GROUP BY {listing_column}", params))
+    price_lo, price_hi = price_range or (None, None)
+    price_lo = max(price_lo or 0, 0)
+    # Верхняя граница фильтра включительная, здесь - исключающая
+    price_end = price_hi + 1 if price_hi is not None else None
+
+    first_bucket = -(-price_lo // PRICE_BUCKET_SIZE)
+    last_bucket = (price_end // PRICE_BUCKET_SIZE - 1
+                   if price_end is not None else None)
+
+    counts = {}
+    if last_bucket is not None and first_bucket > last_bucket:
+        _group_listings(conn, column, price_lo, price_end, rooms, district,
+                        counts)
+        return counts
+
+    summary_column = GROUP_COLUMNS[column][0]
+    clauses, params = filter_clauses(rooms=rooms, district=district)
+    clauses.append("price_bucket >= ?")
+    params.append(first_bucket)
+    if last_bucket is not None:
+        clauses.append("price_bucket <= ?")
+        params.append(last_bucket)
+    sql = (f"SELECT {summary_column}, SUM(count) FROM listing_stats "
+           f"WHERE {' AND '.join(clauses)} GROUP BY {summary_column}")
+    for value, count in conn.execute(sql, params):
+        counts[value] = counts.get(value, 0) + count
+
+    full_lo = first_bucket * PRICE_BUCKET_SIZE
+    if price_lo < full_lo:
+        _group_listings(conn, column, price_lo, full_lo, rooms, district,
+                        counts)
+    if last_bucket is not None:
+        full_hi = (last_bucket + 1) * PRICE_BUCKET_SIZE
+        if full_hi < price_end:
+            _group_listings(conn, column, full_hi, price_end, rooms, district,
+                            counts)
+    return counts
+
+
+def _price_edge(conn, price_range, rooms, district, descending):
+    where, params = build_where(price_range, rooms, district)
+    order = "DESC" if descending else "ASC"
+    row = conn.execute(f"SELECT price FROM listings{where} "
+                       f"ORDER BY price {order} LIMIT 1", params).fetchone()
+    return row[0] if row else None
+
+
+def price_histogram(conn, price_range=None, rooms=None, district=None,
+                    bins=LINE_CHART_POINTS):
+    """Гистограмма цен: список (нижняя цена, верхняя цена, количество).
+
+    Широкие диапазоны считаются по интервалам сводки listing_stats, узкие -
+    одним GROUP BY по объявлениям с шагом (max - min) / bins.
+    """
+    low = _price_edge(conn, price_range, rooms, district, descending=False)
+    if low is None:
+        return []
+    high = _price_edge(conn, price_range, rooms, district, descending=True)
+
+    if (high - low) // PRICE_BUCKET_SIZE >= bins:
+        counts = count_by(conn, "price_bucket", (low, high), rooms, district)
+        return [(max(bucket * PRICE_BUCKET_SIZE, low),
+                 min((bucket + 1) * PRICE_BUCKET_SIZE - 1, high), count)
+                for bucket, count in sorted(counts.items())]
+
+    width = max(1, -(-(high - low + 1) // bins))
+    where, params = build_where((low, high), rooms, district)
+    sql = (f"SELECT (price - ?) / ?, COUNT(*) FROM listings{where} "
+           f"GROUP BY 1 ORDER BY 1")
+    return [(low + index * width, min(low + (index + 1) * width - 1, high),
+             count)
+            for index, count in conn.execute(sql, [low, width] + params)]
+
+
+def quantile_curve(histogram, points=LINE_CHART_POINTS):
+    """Кривая отсортированных цен из points точек по гистограмме.
+
+    Точка j - приближенная цена объявления с рангом j * (n - 1) / (points - 1);
+    внутри интервала цена интерполируется линейно.
+    """
+    total = sum(count for _, _, count in histogram)
+    if not total:
+        return []
+    points = min(points, total)
+    curve = []
+    bin_index = 0
+    before = 0
+    for j in range(points):
+        rank = j * (total - 1) / (points - 1) if points > 1 else 0
+        while before + histogram[bin_index][2] <= rank:
+            before += histogram[bin_index][2]
+            bin_index += 1
+        low, high, count = histogram[bin_index]
+        share = (rank - before + 0.5) / count
+        curve.append(int(round(low + (high - low) * share)))
+    # Крайние точки - точные минимум и максимум выборки
+    curve[0] = histogram[0][0]
+    curve[-1] = histogram[-1][1]
+    return curve
+
+
+def downsample_sorted(values, points=LINE_CHART_POINTS):
+    """Равномерная по рангу выборка points значений из отсортированного списка"""
+    if len(values) <= points:
+        return list(values)
+    step = (len(values) - 1) / (points - 1)
+    return [values[int(round(j * step))] for j in range(points)]
@@ -0,0 +1,173 @@
+# backend/analytics.py
+"""Медиана, p10/p90 и средняя цена и цена за м² по районам и комнатам.
+
+Распределения хранятся в таблице price_sketch как скетч с логарифмическими
+корзинами (как в DDSketch): значение v попадает в корзину
+ceil(log(v) / log(GAMMA)), и любой квантиль восстанавливается с
+относительной ошибкой не больше RELATIVE_ACCURACY. Скетчи складываются
+корзина к корзине, поэтому районы и комнаты объединяются без пересчета, а
+в отличие от KLL и t-digest из них можно вычитать - обновленное объявление
+просто переезжает в другую корзину. Сводка ведется приращениями при записи,
+как listing_stats, и запрос не зависит от числа объявлений.
+"""
+import math
+
+from backend.filter_sql import filter_clauses
+from backend.queries import (
+    UPSERT_PRICE_SKETCH,
+    DELETE_EMPTY_PRICE_SKETCH)
+
+# Относительная ошибка квантилей: 1% - около 350 корзин на цены 1e5..1e8
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+METRICS = ("price", "price_m2")
+QUANTILES = (("p10", 0.1), ("median", 0.5), ("p90", 0.9))
+# Колонки price_sketch, по которым группируется сводка
+STATS_GROUPS = ("district", "rooms")
+
+REBUILD_BATCH_SIZE = 5000
+
+
+def bucket_of(value):
+    return math.ceil(math.log(value) / _LOG_GAMMA)
+
+
+def bucket_value(bucket):
+    """Представитель корзины: ошибка не больше RELATIVE_ACCURACY по краям"""
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+class QuantileSketch:
+    """Скетч одной группы: корзина -> число значений и их сумма"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value, weight=1):
+        """Добавляет значение; weight = -1 убирает ранее добавленное"""
+        if value is None or value <= 0:
+            return
+        self.add_bucket(bucket_of(value), weight, weight * value)
+
+    def add_bucket(self, bucket, count, total):
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += count
+        self.total += total
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def quantile(self, q):
+        """Значение с рангом q * (count - 1) или None для пустого скетча"""
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                return bucket_value(bucket)
+        return bucket_value(max(self.buckets))
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count > 0 else None
+
+    def summary(self):
+        """Словарь count, mean и квантилей QUANTILES, округленных до рубля"""
+        result = {"count": self.count}
+        mean = self.mean
+        result["mean"] = int(round(mean)) if mean is not None else None
+        for name, q in QUANTILES:
+            value = self.quantile(q)
+            result[name] = int(round(value)) if value is not None else None
+        return result
+
+
+def _metric_values(price, area):
+    """Значения метрик METRICS для одного объявления"""
+    if not price or price <= 0:
+        return ()
+    if area and area > 0:
+        return (("price", price), ("price_m2", price / area))
+    return (("price", price),)
+
+
+def add_delta(deltas, district, rooms, price, area, sign):
+    """Копит изменение скетчей для одной строки: sign = +1 или -1"""
+    for metric, value in _metric_values(price, area):
+        key = (district, rooms, metric, bucket_of(value))
+        count, total = deltas.get(key, (0, 0.0))
+        deltas[key] = (count + sign, total + sign * value)
+
+
+def apply_deltas(conn, deltas):
+    """Применяет накопленные приращения к price_sketch"""
+    rows = [key + value for key, value in deltas.items()
+            if value != (0, 0)]
+    if rows:
+        conn.executemany(UPSERT_PRICE_SKETCH, rows)
+        conn.execute(DELETE_EMPTY_PRICE_SKETCH)
+
+
+def rebuild_sketches(conn):
+    """Полностью пересчитывает price_sketch по таблице listings"""
+    conn.execute("DELETE FROM price_sketch")
+    deltas = {}
+    cur = conn.execute("SELECT district, rooms, price, area FROM listings")
+    while True:
+        rows = cur.fetchmany(REBUILD_BATCH_SIZE)
+        if not rows:
+            break
+        for district, rooms, price, area in rows:
+            add_delta(deltas, district, rooms, price, area, +1)
+    apply_deltas(conn, deltas)
+
+
+def load_sketches(conn, group="district", rooms=None, district=None):
+    """Скетчи по значениям group: {значение: {метрика: QuantileSketch}}.
+
+    Остальные измерения складываются; rooms и district сужают выборку.
+    """
+    if group not in STATS_GROUPS:
+        raise ValueError(f"Нельзя группировать по {group}")
+    clauses, params = filter_clauses(rooms=rooms, district=district)
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    sql = (f"SELECT {group}, metric, bucket, SUM(count), SUM(total) "
+           f"FROM price_sketch {where}GROUP BY {group}, metric, bucket")
+    sketches = {}
+    for key, metric, bucket, count, total in conn.execute(sql, params):
+        group_sketches = sketches.setdefault(
+            key, {name: QuantileSketch() for name in METRICS})
+        group_sketches[metric].add_bucket(bucket, count, total)
+    return sketches
+
+
+def price_stats(conn, group="district", rooms=None, district=None):
+    """Сводка по группам, упорядоченная по значению группы.
+
+    Каждый элемент: {"key": значение, "price": {...}, "price_m2": {...}},
+    где вложенные словари - QuantileSketch.summary(). Последний элемент с
+    ключом None - итог по всем группам.
+    """
+    sketches = load_sketches(conn, group, rooms, district)
+    result = []
+    overall = {name: QuantileSketch() for name in METRICS}
+    for key in sorted(sketches, key=lambda value: (value is None, value)):
+        row = {"key": key}
+        for name in METRICS:
+            overall[name].merge(sketches[key][name])
+            row[name] = sketches[key][name].summary()
+        result.append(row)
+    if result:
+        result.append({"key": None, **{name: overall[name].summary()
+                                       for name in METRICS}})
+    return result
@@ -0,0 +1,152 @@
+# backend/bulk_import.py
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait)
+
+from backend.DataFetcher import (
+    DataFetcher,
+    ListingWriter,
+    empty_stats,
+    parse_file)
+from backend.db import DB_PATH_HELP, prepare_database
+from backend.geocoding import GEOCODER_HELP, Geocoder
+
+# Какие файлы из каталога считаются сохраненными страницами выдачи
+PAGE_EXTENSIONS = (".html", ".htm", ".txt")
+# Сколько файлов держать в работе на один процесс пула
+IN_FLIGHT_PER_WORKER = 4
+
+
+def collect_files(paths):
+    """Файлы страниц по списку каталогов, шаблонов glob и отдельных файлов"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names
+                             if name.lower().endswith(PAGE_EXTENSIONS))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            files.extend(name for name in glob.glob(path, recursive=True)
+                         if os.path.isfile(name))
+    # Один файл, указанный дважды, разбираем один раз
+    return sorted(set(os.path.abspath(name) for name in files))
+
+
+class BulkImporter:
+    """Загружает каталог сохраненных страниц в базу.
+
+    Разбор HTML идет в пуле процессов, запись в SQLite - только в
+    вызывающем процессе, пачками. Метаданные файла (размер, mtime, хеш)
+    сохраняются после записи его объявлений, поэтому при перезапуске уже
+    загруженные файлы пропускаются.
+    """
+
+    def __init__(self, files, db_path=None, workers=None, batch_size=5000,
+                 report_every=2.0, geocoder=None):
+        self.files = list(files)
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.report_every = report_every
+        self.geocoder = geocoder
+
+    def run(self):
+        """Разбирает и сохраняет все файлы; возвращает суммарную статистику"""
+        prepare_database(self.db_path)
+        writer = ListingWriter(self.db_path, self.geocoder)
+        totals = {"files": 0, "failed": 0, "skipped": 0, "listings": 0,
+                  **empty_stats()}
+        batch = []
+        pending = []
+        started = last_report = time.monotonic()
+        queue = iter(self.files)
+        max_in_flight = self.workers * IN_FLIGHT_PER_WORKER
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+            while True:
+                while len(running) < max_in_flight:
+                    fetcher = self._next_changed(queue, totals)
+                    if fetcher is None:
+                        break
+                    running[pool.submit(parse_file, fetcher.source)] = fetcher
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    fetcher = running.pop(future)
+                    try:
+                        listings = future.result()
+                    except Exception as e:
+                        print(f"Ошибка при разборе {fetcher.source}: {e}")
+                        totals["failed"] += 1
+                        continue
+                    totals["files"] += 1
+                    totals["listings"] += len(listings)
+                    batch.extend(listings)
+                    pending.append(fetcher)
+                if len(batch) >= self.batch_size:
+                    writer.save_batch(batch, pending, totals)
+                    batch, pending = [], []
+                if time.monotonic() - last_report >= self.report_every:
+                    self._report(totals, started)
+                    last_report = time.monotonic()
+        if batch or pending:
+            writer.save_batch(batch, pending, totals)
+        self._report(totals, started)
+        print(f"Импорт завершен: файлов {totals['files']}, пропущено "
+              f"{totals['skipped']}, ошибок {totals['failed']}; добавлено "
+              f"{totals['inserted']}, обновлено {totals['updated']}")
+        return totals
+
+    def _next_changed(self, queue, totals):
+        """Следующий файл, изменившийся с прошлого импорта, или None"""
+        for path in queue:
+            fetcher = DataFetcher(path, db_path=self.db_path)
+            if fetcher.local_file_unchanged():
+                totals["skipped"] += 1
+                continue
+            return fetcher
+        return None
+
+    def _report(self, totals, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        handled = totals["files"] + totals["skipped"] + totals["failed"]
+        print(f"[{handled}/{len(self.files)}] файлов, "
+              f"{totals['listings']} объявлений за {elapsed:.1f} с: "
+              f"{totals['files'] / elapsed:.1f} файлов/с, "
+              f"{totals['listings'] / elapsed:.0f} объявлений/с")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Импорт сохраненных страниц выдачи из каталогов и файлов")
+    parser.add_argument("paths", nargs="+",
+                        help="каталоги, файлы или шаблоны вида 'pages/**/*.html'")
+    parser.add_argument("--db", default=None, help=DB_PATH_HELP)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число процессов разбора, по умолчанию - все ядра")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="объявлений в одной транзакции записи")
+    parser.add_argument("--geocoder", default=None, help=GEOCODER_HELP)
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.paths)
+    if not files:
+        print("Не найдено файлов для импорта")
+        return None
+    print(f"Найдено файлов: {len(files)}")
+    return BulkImporter(files, db_path=args.db, workers=args.workers,
+                        batch_size=args.batch_size,
+                        geocoder=Geocoder.from_spec(args.geocoder)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# backend/crawler.py
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.DataFetcher import (
+    DEFAULT_TIMEOUT,
+    DataFetcher,
+    ListingWriter,
+    empty_stats)
+from backend.db import DB_PATH_HELP, prepare_database
+from backend.geocoding import GEOCODER_HELP, Geocoder
+
+
+class HostLimiter:
+    """Ограничивает число одновременных запросов и их частоту для хоста"""
+
+    def __init__(self, concurrency=4, rate=5.0):
+        self._semaphore = threading.Semaphore(concurrency)
+        self._interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    @contextmanager
+    def slot(self):
+        with self._semaphore:
+            if self._interval:
+                with self._lock:
+                    now = time.monotonic()
+                    wait = self._next_time - now
+                    self._next_time = max(now, self._next_time) + self._interval
+                if wait > 0:
+                    time.sleep(wait)
+            yield
+
+
+def make_session(pool_size=16, retries=3, backoff=0.5):
+    """Сессия с keep-alive пулом соединений и повторами с экспонентой"""
+    retry = Retry(total=retries, backoff_factor=backoff,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET", "HEAD"),
+                  respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "Mozilla/5.0"
+    return session
+
+
+def expand_urls(pattern, pages):
+    """Раскрывает шаблон вида 'https://site/?p={page}' по номерам страниц"""
+    return [pattern.format(page=page) for page in pages]
+
+
+class Crawler:
+    """Параллельно скачивает страницы выдачи и сохраняет их по мере загрузки.
+
+    Загрузка и разбор идут в пуле потоков через общую сессию, запись в
+    SQLite - только в вызывающем потоке, пачками.
+    """
+
+    def __init__(self, urls, db_path=None, max_workers=8, per_host=4,
+                 rate=5.0, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5,
+                 batch_size=1000, geocoder=None):
+        self.urls = list(urls)
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.rate = rate
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.geocoder = geocoder
+        self.session = make_session(max_workers, retries, backoff)
+        self._limiters = {}
+        self._limiters_lock = threading.Lock()
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        with self._limiters_lock:
+            if host not in self._limiters:
+                self._limiters[host] = HostLimiter(self.per_host, self.rate)
+            return self._limiters[host]
+
+    def _fetcher(self, url):
+        fetcher = DataFetcher(url, db_path=self.db_path,
+                              batch_size=self.batch_size,
+                              session=self.session, timeout=self.timeout)
+        # Метаданные пишет только run() в вызывающем потоке
+        fetcher.defer_meta = True
+        return fetcher
+
+    def fetch_and_parse(self, url):
+        fetcher = self._fetcher(url)
+        with self._limiter(url).slot():
+            html = fetcher.fetch()
+        return fetcher, fetcher.parse(html) if html else None
+
+    def run(self):
+        """Обходит все URL; возвращает суммарную статистику записи"""
+        writer = ListingWriter(self.db_path, self.geocoder)
+        # Схему готовим заранее, чтобы потоки не мигрировали базу наперегонки
+        prepare_database(self.db_path)
+        totals = {"pages": 0, "failed": 0, "skipped": 0, **empty_stats()}
+        batch = []
+        # Метаданные страниц фиксируются только после записи их объявлений
+        pending = []
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch_and_parse, url): url
+                       for url in self.urls}
+            for future in as_completed(futures):
+                try:
+                    fetcher, listings = future.result()
+                except Exception as e:
+                    print(f"Ошибка при обработке {futures[future]}: {e}")
+                    totals["failed"] += 1
+                    continue
+                if fetcher.not_modified:
+                    # Совпавший хеш содержимого все равно обновляет ETag
+                    totals["skipped"] += 1
+                    pending.append(fetcher)
+                    continue
+                if listings is None:
+                    totals["failed"] += 1
+                    continue
+                totals["pages"] += 1
+                batch.extend(listings)
+                pending.append(fetcher)
+                if len(batch) >= self.batch_size:
+                    writer.save_batch(batch, pending, totals)
+                    batch, pending = [], []
+        if batch or pending:
+            writer.save_batch(batch, pending, totals)
+        self.session.close()
+        print(f"Обход завершен за {time.monotonic() - started:.1f} с: "
+              f"страниц {totals['pages']}, без изменений {totals['skipped']}, "
+              f"ошибок {totals['failed']}")
+        return totals
+
+
+def _parse_pages(value):
+    start, _, end = value.partition("-")
+    return range(int(start), int(end or start) + 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Параллельная загрузка страниц выдачи объявлений")
+    parser.add_argument("urls", nargs="+",
+                        help="URL страниц или шаблон с {page}")
+    parser.add_argument("--pages", type=_parse_pages,
+                        help="диапазон страниц для шаблона, например 1-20")
+    parser.add_argument("--db", default=None, help=DB_PATH_HELP)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=5.0,
+                        help="запросов в секунду на хост, 0 - без ограничения")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--geocoder", default=None, help=GEOCODER_HELP)
+    args = parser.parse_args(argv)
+
+    urls = []
+    for url in args.urls:
+        if "{page}" in url and args.pages:
+            urls.extend(expand_urls(url, args.pages))
+        else:
+            urls.append(url)
+    Crawler(urls, db_path=args.db, max_workers=args.workers,
+            per_host=args.per_host, rate=args.rate,
+            retries=args.retries,
+            geocoder=Geocoder.from_spec(args.geocoder)).run()
+
+
+if __name__ == "__main__":
+    main()
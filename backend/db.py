@@ -0,0 +1,123 @@
+# backend/db.py
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+from backend.migrations import migrate
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# База по умолчанию лежит в корне проекта, а не в текущем каталоге
+DEFAULT_DB_PATH = os.environ.get("DATA_DB_PATH",
+                                 os.path.join(PROJECT_DIR, "data.db"))
+# Подсказка к параметру --db утилит командной строки
+DB_PATH_HELP = "путь к базе, по умолчанию data.db в корне проекта"
+
+# Скомпилированные запросы из queries.py и построителя фильтров живут в
+# кэше соединения и переиспользуются, пока соединение открыто
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+READ_PRAGMAS = (
+    "PRAGMA query_only = 1",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+)
+
+WRITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
+
+_local = threading.local()
+_prepared_paths = set()
+_prepare_lock = threading.Lock()
+
+
+def resolve_path(db_path=None):
+    return os.path.abspath(db_path or DEFAULT_DB_PATH)
+
+
+def _pool(name):
+    pool = getattr(_local, name, None)
+    if pool is None:
+        pool = {}
+        setattr(_local, name, pool)
+    return pool
+
+
+def _configure(conn, pragmas):
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    for pragma in pragmas:
+        conn.execute(pragma)
+
+
+def get_write_connection(db_path=None):
+    """Соединение на запись для текущего потока: WAL, схема актуальна"""
+    path = resolve_path(db_path)
+    pool = _pool("writers")
+    conn = pool.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+        _configure(conn, WRITE_PRAGMAS)
+        migrate(conn)
+        with _prepare_lock:
+            _prepared_paths.add(path)
+        pool[path] = conn
+    return conn
+
+
+def prepare_database(db_path=None):
+    """Один раз на процесс переводит базу в WAL и применяет миграции"""
+    path = resolve_path(db_path)
+    with _prepare_lock:
+        if path in _prepared_paths:
+            return
+        conn = sqlite3.connect(path)
+        try:
+            _configure(conn, WRITE_PRAGMAS)
+            migrate(conn)
+        finally:
+            conn.close()
+        _prepared_paths.add(path)
+
+
+def get_read_connection(db_path=None):
+    """Соединение только на чтение для текущего потока.
+
+    Открывается в режиме URI mode=ro поверх WAL, поэтому чтение не ждет
+    записи загрузчика. Соединение живет столько же, сколько поток.
+    """
+    path = resolve_path(db_path)
+    pool = _pool("readers")
+    conn = pool.get(path)
+    if conn is None:
+        conn = pool[path] = open_read_connection(path)
+    return conn
+
+
+def open_read_connection(db_path=None, check_same_thread=True):
+    """Отдельное соединение только на чтение вне пула; закрывает вызывающий.
+
+    Нужно для долгих потоковых выборок, которые держат курсор открытым.
+    """
+    path = resolve_path(db_path)
+    prepare_database(path)
+    conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True,
+                           cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    _configure(conn, READ_PRAGMAS)
+    return conn
+
+
+def close_thread_connections():
+    """Закрывает соединения текущего потока"""
+    for name in ("readers", "writers"):
+        pool = _pool(name)
+        for conn in pool.values():
+            conn.close()
+        pool.clear()
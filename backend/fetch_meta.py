@@ -0,0 +1,43 @@
+# backend/fetch_meta.py
+import hashlib
+
+from backend.db import get_read_connection, get_write_connection
+from backend.queries import SELECT_FETCH_META, UPSERT_FETCH_META
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def hash_file(path):
+    """SHA-256 файла, читаемого кусками"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class FetchMetaStore:
+    """ETag, Last-Modified и хеш содержимого по каждому источнику.
+
+    Хранится в таблице fetch_meta рядом с объявлениями в той же базе.
+    """
+
+    FIELDS = ("etag", "last_modified", "content_hash", "size", "mtime_ns")
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+
+    def get(self, source):
+        conn = get_read_connection(self.db_path)
+        row = conn.execute(SELECT_FETCH_META, (source,)).fetchone()
+        return dict(zip(self.FIELDS, row)) if row else None
+
+    def save(self, source, meta):
+        conn = get_write_connection(self.db_path)
+        with conn:
+            conn.execute(UPSERT_FETCH_META, (source,) + tuple(
+                meta.get(field) for field in self.FIELDS))
@@ -0,0 +1,58 @@
+# backend/filter_sql.py
+import re
+
+from backend.queries import MATCH_LISTINGS_FTS
+
+# Длинные строки поиска обрезаются, чтобы запрос к индексу оставался дешевым
+MAX_TERMS = 8
+
+_TERM = re.compile(r"\w+")
+
+
+def match_expression(query):
+    """Строка поиска -> выражение MATCH: все слова как префиксы, через И.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 из ввода не действуют.
+    None, если в строке нет ни одного слова.
+    """
+    terms = _TERM.findall((query or "").lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def filter_clauses(price_range=None, rooms=None, district=None, q=None,
+                   prefix=""):
+    """Условия и параметры по критериям фильтра для WHERE ... AND ...
+
+    Годится для listings и сводок с колонками rooms и district. prefix -
+    псевдоним таблицы вида "l.", если запрос соединяет несколько таблиц.
+    """
+    clauses = []
+    params = []
+    if price_range:
+        price_min, price_max = price_range
+        if price_min is not None:
+            clauses.append(f"{prefix}price >= ?")
+            params.append(price_min)
+        if price_max is not None:
+            clauses.append(f"{prefix}price <= ?")
+            params.append(price_max)
+    if rooms is not None:
+        clauses.append(f"{prefix}rooms = ?")
+        params.append(rooms)
+    if district is not None:
+        clauses.append(f"{prefix}district = ?")
+        params.append(district)
+    expression = match_expression(q)
+    if expression is not None:
+        clauses.append(MATCH_LISTINGS_FTS)
+        params.append(expression)
+    return clauses, params
+
+
+def build_where(price_range=None, rooms=None, district=None, q=None):
+    """Собирает условие WHERE и список параметров по критериям фильтра"""
+    clauses, params = filter_clauses(price_range, rooms, district, q)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
@@ -0,0 +1,325 @@
+# backend/geocoding.py
+"""Геокодирование адресов при загрузке и догеокодирование базы.
+
+Адрес нормализуется (регистр, сокращения, без номера квартиры), затем ищется
+в памяти процесса, в таблице geocode_cache и только потом отправляется
+резолверу - пачками. Резолвер локальный: файл-справочник (GazetteerResolver)
+или заглушка-сервис в локальной сети (HttpResolver). Ненайденные адреса тоже
+кэшируются и повторно запрашиваются не раньше, чем через NEGATIVE_TTL.
+
+    python -m backend.geocoding gazetteer:addresses.csv [--db data.db]
+"""
+import argparse
+import csv
+import re
+import time
+
+import requests
+
+from backend.DataFetcher import DEFAULT_TIMEOUT, KEY_LOOKUP_CHUNK
+from backend.db import DB_PATH_HELP, get_write_connection, prepare_database
+from backend.Listing import content_hash
+from backend.metrics import GEOCODE_LOOKUPS, GEOCODE_BATCH_SECONDS
+from backend.queries import (
+    BUMP_DATA_VERSION,
+    SELECT_LISTINGS_WITHOUT_COORDS,
+    UPDATE_LISTING_COORDS,
+    UPSERT_GEOCODE_CACHE)
+
+# Адресов в одном обращении к резолверу
+DEFAULT_BATCH_SIZE = 500
+# Через сколько секунд снова спрашивать резолвер о ненайденном адресе
+NEGATIVE_TTL = 7 * 24 * 3600
+# Сколько адресов помнить в памяти процесса между пачками
+MEMORY_CACHE_SIZE = 200000
+
+# Подсказка к параметрам --geocoder утилит загрузки
+GEOCODER_HELP = ("координаты по адресам: 'gazetteer:путь.csv' или URL "
+                 "локального сервиса")
+
+# Позиции адреса и координат в строке to_db_row
+ADDRESS_INDEX = 0
+LAT_INDEX = 12
+LON_INDEX = 13
+
+_APARTMENT = re.compile(
+    r"\b(кв|квартира|оф|офис|пом|помещение)\b\.?\s*№?\s*[\w/-]+")
+_PUNCTUATION = re.compile(r"[^\w\s/-]+")
+_SPACES = re.compile(r"\s+")
+# "7 к 2" и "7к2" - один дом
+_BUILDING = re.compile(r"\b(\d+[а-я]?) (к|стр) (\d+)\b")
+
+# Варианты написания -> одно сокращение; "д" перед номером дома не нужен
+_ABBREVIATIONS = {
+    "улица": "ул",
+    "проспект": "пр-т", "просп": "пр-т", "пр": "пр-т", "пркт": "пр-т",
+    "переулок": "пер",
+    "бульвар": "б-р", "бул": "б-р",
+    "шоссе": "ш",
+    "площадь": "пл",
+    "набережная": "наб",
+    "проезд": "пр-д",
+    "корпус": "к", "корп": "к",
+    "строение": "стр",
+    "город": "г",
+    "дом": None, "д": None,
+}
+
+
+def normalize_address(address):
+    """Ключ кэша для адреса: одинаков для разных написаний одного дома"""
+    if not address:
+        return ""
+    text = address.lower().replace("ё", "е")
+    text = _APARTMENT.sub(" ", text)
+    text = _PUNCTUATION.sub(" ", text)
+    tokens = []
+    for token in _SPACES.split(text):
+        if not token:
+            continue
+        token = _ABBREVIATIONS.get(token, token)
+        if token:
+            tokens.append(token)
+    return _BUILDING.sub(r"\1\2\3", " ".join(tokens))
+
+
+class GazetteerResolver:
+    """Справочник адресов из CSV с колонками address, lat, lon"""
+    name = "gazetteer"
+
+    def __init__(self, path):
+        self.path = path
+        self.points = {}
+        with open(path, encoding="utf-8", newline="") as file:
+            header = file.readline()
+            delimiter = ";" if header.count(";") > header.count(",") else ","
+            file.seek(0)
+            for record in csv.DictReader(file, delimiter=delimiter):
+                address = normalize_address(record.get("address"))
+                try:
+                    point = (float(record["lat"]), float(record["lon"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if address:
+                    self.points[address] = point
+        print(f"Справочник адресов {path}: {len(self.points)} записей")
+
+    def resolve_many(self, addresses):
+        return {address: self.points.get(address) for address in addresses}
+
+
+class HttpResolver:
+    """Локальный сервис-заглушка геокодирования.
+
+    POST {"addresses": [...]} -> {"results": {адрес: [lat, lon] или null}}.
+    Адреса, которых нет в ответе, не кэшируются и будут запрошены снова.
+    """
+    name = "http"
+
+    def __init__(self, url, session=None, timeout=DEFAULT_TIMEOUT):
+        self.url = url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def resolve_many(self, addresses):
+        response = self.session.post(self.url,
+                                     json={"addresses": list(addresses)},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        results = response.json().get("results", {})
+        resolved = {}
+        for address in addresses:
+            if address not in results:
+                continue
+            point = results[address]
+            resolved[address] = (float(point[0]), float(point[1])) if point \
+                else None
+        return resolved
+
+
+def make_resolver(spec, session=None, timeout=DEFAULT_TIMEOUT):
+    """Резолвер по строке настройки: 'gazetteer:путь.csv', путь или URL"""
+    if not spec:
+        return None
+    if spec.startswith(("http://", "https://")):
+        return HttpResolver(spec, session=session, timeout=timeout)
+    if spec.startswith("gazetteer:"):
+        spec = spec[len("gazetteer:"):]
+    return GazetteerResolver(spec)
+
+
+class Geocoder:
+    """Координаты для адресов через кэш в памяти, geocode_cache и резолвер.
+
+    Один экземпляр используется одним писателем: кэш в памяти не
+    защищен блокировкой.
+    """
+
+    def __init__(self, resolver, batch_size=DEFAULT_BATCH_SIZE,
+                 negative_ttl=NEGATIVE_TTL, memory_size=MEMORY_CACHE_SIZE):
+        self.resolver = resolver
+        self.batch_size = batch_size
+        self.negative_ttl = negative_ttl
+        self.memory_size = memory_size
+        # нормализованный адрес -> (координаты или None, время ответа)
+        self._memory = {}
+
+    @classmethod
+    def from_spec(cls, spec, **kwargs):
+        """Геокодер для строки настройки резолвера или None, если ее нет"""
+        resolver = make_resolver(spec)
+        return cls(resolver, **kwargs) if resolver is not None else None
+
+    def _fresh(self, point, resolved_at, now):
+        return point is not None or now - resolved_at < self.negative_ttl
+
+    def _remember(self, address, point, resolved_at):
+        if len(self._memory) >= self.memory_size:
+            # Вытесняем самые старые записи: dict хранит порядок вставки
+            for old in list(self._memory)[:self.memory_size // 10 or 1]:
+                del self._memory[old]
+        self._memory[address] = (point, resolved_at)
+
+    def _load(self, conn, addresses, now, result):
+        """Берет из geocode_cache свежие записи; возвращает ненайденные"""
+        missing = set(addresses)
+        addresses = list(addresses)
+        for start in range(0, len(addresses), KEY_LOOKUP_CHUNK):
+            chunk = addresses[start:start + KEY_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            for address, lat, lon, resolved_at in conn.execute(
+                    f"SELECT address, lat, lon, resolved_at FROM geocode_cache "
+                    f"WHERE address IN ({placeholders})", chunk):
+                point = (lat, lon) if lat is not None else None
+                if self._fresh(point, resolved_at, now):
+                    result[address] = point
+                    missing.discard(address)
+                    self._remember(address, point, resolved_at)
+        return missing
+
+    def _resolve(self, conn, addresses, now, result):
+        addresses = sorted(addresses)
+        for start in range(0, len(addresses), self.batch_size):
+            chunk = addresses[start:start + self.batch_size]
+            try:
+                with GEOCODE_BATCH_SECONDS.time(resolver=self.resolver.name):
+                    resolved = self.resolver.resolve_many(chunk)
+            except Exception as e:
+                # Временная ошибка: адреса не кэшируются и будут запрошены позже
+                print(f"Ошибка геокодирования ({self.resolver.name}): {e}")
+                GEOCODE_LOOKUPS.inc(len(chunk), result="error")
+                continue
+            entries = []
+            for address, point in resolved.items():
+                result[address] = point
+                self._remember(address, point, now)
+                entries.append((address, point[0] if point else None,
+                                point[1] if point else None,
+                                self.resolver.name, now))
+            found = sum(1 for point in resolved.values() if point)
+            GEOCODE_LOOKUPS.inc(found, result="found")
+            GEOCODE_LOOKUPS.inc(len(resolved) - found, result="not_found")
+            if entries:
+                with conn:
+                    conn.executemany(UPSERT_GEOCODE_CACHE, entries)
+
+    def lookup(self, conn, addresses):
+        """{нормализованный адрес: (lat, lon) или None} для набора адресов"""
+        now = time.time()
+        result = {}
+        missing = []
+        for address in set(addresses):
+            cached = self._memory.get(address)
+            if cached is not None and self._fresh(cached[0], cached[1], now):
+                result[address] = cached[0]
+            else:
+                missing.append(address)
+        GEOCODE_LOOKUPS.inc(len(result), result="memory")
+        if missing:
+            loaded = len(missing)
+            missing = self._load(conn, missing, now, result)
+            GEOCODE_LOOKUPS.inc(loaded - len(missing), result="cache")
+        if missing:
+            self._resolve(conn, missing, now, result)
+        return result
+
+    def fill_coordinates(self, conn, rows):
+        """Проставляет координаты строкам to_db_row, где их нет.
+
+        rows - словарь {ключ: строка}, меняется на месте. Возвращает число
+        строк, получивших координаты.
+        """
+        wanted = {}
+        for key, row in rows.items():
+            if row[LAT_INDEX] == 0 and row[LON_INDEX] == 0:
+                address = normalize_address(row[ADDRESS_INDEX])
+                if address:
+                    wanted[key] = address
+        if not wanted:
+            return 0
+        points = self.lookup(conn, wanted.values())
+        filled = 0
+        for key, address in wanted.items():
+            point = points.get(address)
+            if point:
+                row = rows[key]
+                rows[key] = (row[:LAT_INDEX] + point + row[LON_INDEX + 1:])
+                filled += 1
+        return filled
+
+
+def backfill(geocoder, db_path=None, batch_size=5000):
+    """Проставляет координаты уже загруженным объявлениям без них.
+
+    Объявления читаются по возрастанию id пачками; каждая пачка - своя
+    транзакция с обновлением хеша содержимого и версии данных, поэтому
+    прерванный запуск можно просто повторить.
+    """
+    conn = get_write_connection(db_path)
+    totals = {"checked": 0, "filled": 0}
+    last_id = 0
+    started = time.monotonic()
+    while True:
+        rows = conn.execute(SELECT_LISTINGS_WITHOUT_COORDS,
+                            (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        by_id = {row[0]: tuple(row[1:]) for row in rows}
+        geocoder.fill_coordinates(conn, by_id)
+        updates = [(row[LAT_INDEX], row[LON_INDEX], content_hash(row),
+                    listing_id) for listing_id, row in by_id.items()
+                   if row[LAT_INDEX] != 0 or row[LON_INDEX] != 0]
+        if updates:
+            with conn:
+                conn.executemany(UPDATE_LISTING_COORDS, updates)
+                conn.execute(BUMP_DATA_VERSION)
+        totals["checked"] += len(rows)
+        totals["filled"] += len(updates)
+        elapsed = max(time.monotonic() - started, 1e-9)
+        print(f"Проверено {totals['checked']}, найдены координаты "
+              f"{totals['filled']} ({totals['checked'] / elapsed:.0f} "
+              f"объявлений/с)")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Координаты для объявлений, загруженных без них")
+    parser.add_argument("resolver",
+                        help="'gazetteer:путь.csv' или URL локального сервиса")
+    parser.add_argument("--db", default=None, help=DB_PATH_HELP)
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="объявлений в одной транзакции")
+    args = parser.parse_args(argv)
+
+    prepare_database(args.db)
+    totals = backfill(Geocoder.from_spec(args.resolver), args.db,
+                      args.batch_size)
+    print(f"Готово: проверено {totals['checked']}, "
+          f"с координатами {totals['filled']}")
+    return totals
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# backend/listing_store.py
+from array import array
+from bisect import bisect_left, bisect_right
+
+from backend.aggregates import bucket_of
+
+LOAD_COLUMNS = ("id", "price", "rooms", "district", "lat", "lon", "area")
+FETCH_CHUNK = 10000
+
+
+def _bitmap(positions, size):
+    """Битовая маска (int) из списка номеров строк"""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+class ListingStore:
+    """Объявления в типизированных колонках array для фильтрации в памяти.
+
+    Строки упорядочены по (price, id), поэтому колонка цен сама служит
+    отсортированным индексом: диапазон цен - два bisect. Районы и комнаты
+    хранятся битовыми масками (int, бит i - строка i), и фильтр сводится к
+    побитовому И масок. Адреса в памяти не держатся: строки страницы
+    дочитываются из базы по id.
+    """
+
+    def __init__(self, version=None):
+        # Версия данных базы, из которой собраны колонки
+        self.version = version
+        self.ids = array("q")
+        self.prices = array("q")
+        self.rooms = array("h")
+        self.districts = array("I")
+        self.lat = array("d")
+        self.lon = array("d")
+        self.area = array("d")
+        self.district_names = []
+        self.district_bits = {}
+        self.rooms_bits = {}
+        self.all_bits = 0
+
+    @classmethod
+    def from_connection(cls, conn, version=None):
+        store = cls(version)
+        codes = {}
+        district_rows = []
+        rooms_rows = {}
+        cursor = conn.execute(f"SELECT {', '.join(LOAD_COLUMNS)} "
+                              f"FROM listings ORDER BY price, id")
+        position = 0
+        while True:
+            chunk = cursor.fetchmany(FETCH_CHUNK)
+            if not chunk:
+                break
+            for listing_id, price, rooms, district, lat, lon, area in chunk:
+                code = codes.get(district)
+                if code is None:
+                    code = codes[district] = len(store.district_names)
+                    store.district_names.append(district)
+                    district_rows.append([])
+                rooms = rooms or 0
+                store.ids.append(listing_id)
+                store.prices.append(price or 0)
+                store.rooms.append(rooms)
+                store.districts.append(code)
+                store.lat.append(lat or 0.0)
+                store.lon.append(lon or 0.0)
+                store.area.append(area or 0.0)
+                district_rows[code].append(position)
+                rooms_rows.setdefault(rooms, []).append(position)
+                position += 1
+
+        size = len(store.ids)
+        store.all_bits = (1 << size) - 1
+        store.district_bits = {
+            name: _bitmap(district_rows[code], size)
+            for code, name in enumerate(store.district_names)}
+        store.rooms_bits = {value: _bitmap(positions, size)
+                            for value, positions in rooms_rows.items()}
+        return store
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Примерный объем колонок и масок в байтах"""
+        columns = (self.ids, self.prices, self.rooms, self.districts,
+                   self.lat, self.lon, self.area)
+        masks = list(self.district_bits.values()) + list(
+            self.rooms_bits.values())
+        return (sum(column.itemsize * len(column) for column in columns) +
+                sum((bits.bit_length() + 7) // 8 for bits in masks))
+
+    def price_mask(self, price_range=None):
+        """Маска строк с ценой в диапазоне [min, max] включительно"""
+        price_lo, price_hi = price_range or (None, None)
+        start = (bisect_left(self.prices, price_lo)
+                 if price_lo is not None else 0)
+        end = (bisect_right(self.prices, price_hi)
+               if price_hi is not None else len(self.prices))
+        if start >= end:
+            return 0
+        return ((1 << end) - 1) ^ ((1 << start) - 1)
+
+    def mask(self, price_range=None, rooms=None, district=None, after=None):
+        """Маска строк под фильтр; after - курсор (price, id) страницы"""
+        bits = self.price_mask(price_range)
+        if rooms is not None:
+            bits &= self.rooms_bits.get(rooms, 0)
+        if district is not None:
+            bits &= self.district_bits.get(district, 0)
+        if after is not None:
+            bits &= (1 << self.position(*after)) - 1
+        return bits
+
+    def position(self, price, listing_id):
+        """Номер строки (price, id) или место, куда бы она встала"""
+        start = bisect_left(self.prices, price)
+        end = bisect_right(self.prices, price)
+        # Внутри одной цены id идут по возрастанию
+        return bisect_left(self.ids, listing_id, start, end)
+
+    def keys_mask(self, keys):
+        """Маска строк по списку пар (price, id), например из поиска"""
+        positions = []
+        for price, listing_id in keys:
+            position = self.position(price, listing_id)
+            if (position < len(self.ids) and
+                    self.ids[position] == listing_id):
+                positions.append(position)
+        return _bitmap(positions, len(self.ids))
+
+    def positions(self, bits):
+        """Номера строк маски по возрастанию цены"""
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        for index, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                yield index * 8 + low.bit_length() - 1
+                byte ^= low
+
+    def prices_of(self, bits):
+        """Цены строк маски, отсортированные по возрастанию"""
+        return [self.prices[position] for position in self.positions(bits)]
+
+    @staticmethod
+    def count(bits):
+        return bits.bit_count()
+
+    def top_ids(self, bits, limit):
+        """id первых limit строк маски от дорогих к дешевым"""
+        ids = []
+        while bits and len(ids) < limit:
+            position = bits.bit_length() - 1
+            ids.append(self.ids[position])
+            bits ^= 1 << position
+        return ids
+
+    def count_by(self, column, bits):
+        """Число строк маски по районам, комнатам или интервалам цен"""
+        if column == "price_bucket":
+            counts = {}
+            for position in self.positions(bits):
+                bucket = bucket_of(self.prices[position])
+                counts[bucket] = counts.get(bucket, 0) + 1
+            return counts
+        if column == "district":
+            groups = self.district_bits
+        elif column == "rooms":
+            groups = self.rooms_bits
+        else:
+            raise ValueError(f"Нельзя группировать по {column}")
+        counts = {}
+        for value, group_bits in groups.items():
+            count = (group_bits & bits).bit_count()
+            if count:
+                counts[value] = count
+        return counts
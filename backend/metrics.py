@@ -0,0 +1,189 @@
+# backend/metrics.py
+"""Счетчики, гистограммы и значения в текстовом формате Prometheus.
+
+Метрики живут в памяти процесса: веб-сервер видит запросы и записи,
+сделанные им самим (например, фоновой загрузкой), но не отдельные запуски
+CLI.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + inner + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} "
+                             f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, registry=REGISTRY):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value)
+                    for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Значение, заданное явно или вычисляемое при чтении (func).
+
+    С labels func возвращает словарь {кортеж значений меток: значение}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help_text, func=None, labels=(),
+                 registry=REGISTRY):
+        super().__init__(name, help_text, registry)
+        self._func = func
+        self._labels = tuple(labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self._func is not None:
+            value = self._func()
+            if not self._labels:
+                return [(self.name, (), value)]
+            return [(self.name, tuple(zip(self._labels, key)), item)
+                    for key, item in sorted(value.items())]
+        with self._lock:
+            return [(self.name, key, value)
+                    for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        super().__init__(name, help_text, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2]))
+                           for key, state in self._values.items())
+        for key, (counts, count, total) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket",
+                                key + (("le", _format_value(float(bound))),),
+                                bucket_count))
+            samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),),
+                            count))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+# Загрузка данных: DataFetcher.save_to_db, в процессе, который пишет в базу.
+# Фоновая загрузка идет отдельным процессом, поэтому веб-часть отдает ее
+# журнал ingest_jobs (main/instrumentation.py)
+INGEST_ROWS = Counter("ingest_rows_total",
+                      "Обработанные при загрузке строки по результату")
+INGEST_BATCH_SECONDS = Histogram("ingest_batch_seconds",
+                                 "Время записи одной пачки объявлений")
+INGEST_ROWS_PER_SECOND = Gauge("ingest_rows_per_second",
+                               "Скорость записи последней пачки, строк/с")
+
+# Геокодирование адресов: backend/geocoding.py
+GEOCODE_LOOKUPS = Counter("geocode_lookups_total",
+                          "Адреса по источнику ответа: memory, cache, found, "
+                          "not_found, error")
+GEOCODE_BATCH_SECONDS = Histogram("geocode_batch_seconds",
+                                  "Время одного обращения к резолверу")
+
+# Выборки веб-части
+ROWS_SCANNED = Counter("listing_rows_scanned_total",
+                       "Строки, подходящие под фильтр, из которых "
+                       "выбиралась выдача")
+ROWS_RETURNED = Counter("listing_rows_returned_total",
+                        "Строки, отданные в выдачу")
@@ -0,0 +1,332 @@
+# backend/migrations.py
+import hashlib
+import math
+import re
+import sqlite3
+import sys
+
+from backend.search import create_search_index
+from backend.spatial import create_spatial_index
+from backend.queries import (
+    CREATE_TABLE_LISTINGS,
+    CREATE_TABLE_META,
+    CREATE_INDEX_LISTING_KEY,
+    CREATE_TABLE_FETCH_META,
+    CREATE_TABLE_LISTING_STATS,
+    CREATE_TABLE_PRICE_SKETCH,
+    CREATE_TABLE_GEOCODE_CACHE,
+    CREATE_TABLE_INGEST_JOBS,
+    CREATE_INDEX_INGEST_JOBS_SOURCE,
+    CREATE_INDEX_INGEST_JOBS_STARTED,
+    CREATE_TABLE_INGEST_TOTALS,
+    INIT_DATA_VERSION,
+    LISTING_FIELDS,
+    LISTING_INDEXES)
+
+BATCH_SIZE = 5000
+
+# Примененная миграция не должна менять результат вместе с живым кодом,
+# поэтому преобразования данных в миграциях - их собственные копии на
+# момент написания, а не функции из Listing, aggregates или analytics
+
+_V1_NON_NUMERIC = re.compile(r'[^\d.,]')
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _v1_price(value):
+    if not value:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    cleaned = _V1_NON_NUMERIC.sub('', value.replace(' ', ''))
+    try:
+        return float(cleaned.replace(',', '.'))
+    except ValueError:
+        return 0.0
+
+
+def _v1_area(value):
+    if not value:
+        return 0.0
+    cleaned = _V1_NON_NUMERIC.sub('', str(value).replace(' ', ''))
+    try:
+        return float(cleaned.replace(',', '.'))
+    except ValueError:
+        return 0.0
+
+
+def _v1_int(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(_v1_area(value))
+    except (ValueError, OverflowError):
+        return None
+
+
+def _v1_float(value):
+    try:
+        return float(value) if value not in (None, "") else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _v1_db_row(item):
+    """Строка старой таблицы -> значения LISTING_FIELDS, как при миграции 1"""
+    rooms = item.get("rooms", item.get("rooms_count"))
+    area = item.get("area", item.get("total_meters"))
+    return (
+        (item.get("address") or "").strip(),
+        int(round(_v1_price(item.get("price")))),
+        _v1_area(area),
+        _v1_int(rooms) or 0,
+        _v1_int(item.get("floor")),
+        _v1_int(item.get("floors_count")),
+        item.get("object_type"),
+        item.get("house_material_type"),
+        _v1_int(item.get("year_of_construction")),
+        (item.get("district") or "Неизвестный").strip().capitalize(),
+        item.get("underground"),
+        item.get("url"),
+        _v1_float(item.get("lat")),
+        _v1_float(item.get("lon")),
+    )
+
+
+def _migration_1_typed_schema(conn):
+    """Переводит listings на типизированную схему и переносит старые строки"""
+    columns = _table_columns(conn, "listings")
+    if not columns:
+        conn.execute(CREATE_TABLE_LISTINGS)
+    else:
+        conn.execute("ALTER TABLE listings RENAME TO listings_old")
+        conn.execute(CREATE_TABLE_LISTINGS)
+
+        keep = [name for name in ("id", "created_at") if name in columns]
+        fields = keep + list(LISTING_FIELDS)
+        insert = (f"INSERT INTO listings ({', '.join(fields)}) "
+                  f"VALUES ({', '.join('?' * len(fields))})")
+
+        cur = conn.execute("SELECT * FROM listings_old")
+        while True:
+            rows = cur.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                item = dict(zip(columns, row))
+                batch.append(tuple(item[name] for name in keep) +
+                             _v1_db_row(item))
+            conn.executemany(insert, batch)
+        conn.execute("DROP TABLE listings_old")
+
+    for ddl in LISTING_INDEXES:
+        conn.execute(ddl)
+
+
+def _migration_2_data_version(conn):
+    """Добавляет счетчик версии данных для инвалидации кэшей"""
+    conn.execute(CREATE_TABLE_META)
+    conn.execute(INIT_DATA_VERSION)
+
+
+def _v3_listing_key(row):
+    """Ключ на момент миграции 3: URL, а без него хеш адреса, цены и комнат"""
+    address, price, _, rooms = row[:4]
+    if row[11]:
+        return row[11]
+    raw = f"{(address or '').lower()}|{price}|{rooms}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _v3_content_hash(row):
+    raw = "|".join("" if value is None else str(value) for value in row)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _migration_3_natural_key(conn):
+    """Добавляет естественный ключ и хеш содержимого, убирает дубликаты"""
+    conn.execute("ALTER TABLE listings ADD COLUMN listing_key TEXT")
+    conn.execute("ALTER TABLE listings ADD COLUMN content_hash TEXT")
+
+    select = f"SELECT id, {', '.join(LISTING_FIELDS)} FROM listings ORDER BY id"
+    seen = set()
+    duplicates = []
+    updates = []
+    cur = conn.execute(select)
+    while True:
+        rows = cur.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            values = tuple(row[1:])
+            key = _v3_listing_key(values)
+            if key in seen:
+                duplicates.append((row[0],))
+                continue
+            seen.add(key)
+            updates.append((key, _v3_content_hash(values), row[0]))
+
+    conn.executemany("DELETE FROM listings WHERE id = ?", duplicates)
+    conn.executemany(
+        "UPDATE listings SET listing_key = ?, content_hash = ? WHERE id = ?",
+        updates)
+    conn.execute(CREATE_INDEX_LISTING_KEY)
+
+
+def _migration_4_fetch_meta(conn):
+    """Добавляет таблицу метаданных загрузки источников"""
+    conn.execute(CREATE_TABLE_FETCH_META)
+
+
+def _migration_5_listing_stats(conn):
+    """Добавляет сводку для диаграмм и заполняет ее по текущим данным"""
+    conn.execute(CREATE_TABLE_LISTING_STATS)
+    # Интервалы цен по 100 000 руб., как в aggregates на момент миграции
+    conn.execute("""
+        INSERT INTO listing_stats (district, rooms, price_bucket, count,
+                                   price_sum)
+        SELECT district, rooms, price / 100000, COUNT(*), SUM(price)
+        FROM listings
+        GROUP BY district, rooms, price / 100000
+    """)
+
+
+def _migration_6_spatial_index(conn):
+    """Добавляет пространственный индекс координат объявлений"""
+    create_spatial_index(conn)
+
+
+def _migration_7_address_search(conn):
+    """Добавляет полнотекстовый индекс адресов и заполняет его"""
+    create_search_index(conn)
+
+
+def _migration_8_ingest_jobs(conn):
+    """Добавляет журнал запусков фоновой загрузки"""
+    conn.execute(CREATE_TABLE_INGEST_JOBS)
+    conn.execute(CREATE_INDEX_INGEST_JOBS_SOURCE)
+
+
+def _migration_9_price_sketch(conn):
+    """Добавляет скетчи распределения цен и заполняет их по текущим данным"""
+    conn.execute(CREATE_TABLE_PRICE_SKETCH)
+    # Логарифмические корзины с относительной ошибкой 1%, как в analytics
+    # на момент миграции
+    log_gamma = math.log(1.01 / 0.99)
+    sketches = {}
+    cur = conn.execute("SELECT district, rooms, price, area FROM listings "
+                       "WHERE price > 0")
+    while True:
+        rows = cur.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        for district, rooms, price, area in rows:
+            values = [("price", price)]
+            if area and area > 0:
+                values.append(("price_m2", price / area))
+            for metric, value in values:
+                key = (district, rooms, metric,
+                       math.ceil(math.log(value) / log_gamma))
+                count, total = sketches.get(key, (0, 0.0))
+                sketches[key] = (count + 1, total + value)
+    conn.executemany(
+        "INSERT INTO price_sketch (district, rooms, metric, bucket, count, "
+        "total) VALUES (?, ?, ?, ?, ?, ?)",
+        [key + value for key, value in sketches.items()])
+
+
+def _migration_10_geocode_cache(conn):
+    """Добавляет кэш геокодирования адресов"""
+    conn.execute(CREATE_TABLE_GEOCODE_CACHE)
+
+
+def _migration_11_ingest_totals(conn):
+    """Добавляет итоги фоновой загрузки по статусам и индекс для очистки
+    журнала.
+
+    Итоги заполняются по уже накопленным строкам ingest_jobs.
+    """
+    conn.execute(CREATE_TABLE_INGEST_TOTALS)
+    conn.execute(CREATE_INDEX_INGEST_JOBS_STARTED)
+    conn.execute("""
+        INSERT INTO ingest_totals (status, jobs, inserted, updated, unchanged,
+                                   write_seconds)
+        SELECT status, COUNT(*), COALESCE(SUM(inserted), 0),
+               COALESCE(SUM(updated), 0), COALESCE(SUM(unchanged), 0),
+               COALESCE(SUM(write_seconds), 0)
+        FROM ingest_jobs GROUP BY status
+    """)
+    conn.execute("""
+        UPDATE ingest_totals
+        SET (last_finished_at, last_found, last_write_seconds) = (
+            SELECT finished_at, found, write_seconds FROM ingest_jobs
+            WHERE ingest_jobs.status = ingest_totals.status
+            ORDER BY id DESC LIMIT 1)
+    """)
+
+
+# Список миграций по порядку; номер версии = позиция в списке + 1
+MIGRATIONS = [
+    _migration_1_typed_schema,
+    _migration_2_data_version,
+    _migration_3_natural_key,
+    _migration_4_fetch_meta,
+    _migration_5_listing_stats,
+    _migration_6_spatial_index,
+    _migration_7_address_search,
+    _migration_8_ingest_jobs,
+    _migration_9_price_sketch,
+    _migration_10_geocode_cache,
+    _migration_11_ingest_totals,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def needs_migration(conn):
+    return get_version(conn) < SCHEMA_VERSION
+
+
+def migrate(conn):
+    """Применяет недостающие миграции, каждую в своей транзакции"""
+    applied = 0
+    while needs_migration(conn):
+        # executescript/ALTER в sqlite3 требуют явного управления транзакцией
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Версию перечитываем под блокировкой: параллельный процесс
+            # мог уже применить эту миграцию
+            version = get_version(conn)
+            if version >= SCHEMA_VERSION:
+                conn.commit()
+                break
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied += 1
+    return applied
+
+
+if __name__ == "__main__":
+    from backend.db import DEFAULT_DB_PATH
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH
+    connection = sqlite3.connect(db_path)
+    try:
+        before = get_version(connection)
+        count = migrate(connection)
+        print(f"База {db_path}: версия схемы {before} -> "
+              f"{get_version(connection)}, применено миграций: {count}")
+    finally:
+        connection.close()
@@ -1,49 +1,440 @@
-# backend/queries.py
-# создание таблицы объявлений
-CREATE_TABLE_LISTINGS = """
-CREATE TABLE IF NOT EXISTS listings (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    address TEXT,
-    price TEXT,
-    total_meters TEXT,
-    rooms_count TEXT,
-    floor TEXT,
-    floors_count TEXT,
-    object_type TEXT,
-    house_material_type TEXT,
-    year_of_construction TEXT,
-    district TEXT,
-    underground TEXT,
-    url TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-"""
-
-# вставка нового объявления
-INSERT_LISTING = """
-INSERT INTO listings 
-(address, price, total_meters, rooms_count, floor, floors_count, 
- object_type, house_material_type, year_of_construction, district, 
- underground, url) 
-VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-"""
-
-# выбрать все объявления
-SELECT_ALL_LISTINGS = """
-SELECT id, address, price, total_meters, rooms_count, floor, floors_count, 
-       object_type, house_material_type, year_of_construction, district, underground, url, created_at 
-FROM listings;
-"""
-
-# выбрать объявления с фильтрацией по району
-SELECT_BY_DISTRICT = """
-SELECT id, address, price, total_meters, rooms_count, floor, floors_count, 
-       object_type, house_material_type, year_of_construction, district, underground, url, created_at 
-FROM listings 
-WHERE district = ?;
-"""
-
-# удаление таблицы (для тестирования)
-DROP_TABLE_LISTINGS = """
-DROP TABLE IF EXISTS listings;
-"""
+# backend/queries.py
+# создание таблицы объявлений (каноническая типизированная схема)
+CREATE_TABLE_LISTINGS = """
+CREATE TABLE IF NOT EXISTS listings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT,
+    price INTEGER DEFAULT 0,
+    area REAL DEFAULT 0.0,
+    rooms INTEGER DEFAULT 0,
+    floor INTEGER,
+    floors_count INTEGER,
+    object_type TEXT,
+    house_material_type TEXT,
+    year_of_construction INTEGER,
+    district TEXT DEFAULT 'Неизвестный',
+    underground TEXT,
+    url TEXT,
+    lat REAL DEFAULT 0.0,
+    lon REAL DEFAULT 0.0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+LISTING_FIELDS = (
+    "address", "price", "area", "rooms", "floor", "floors_count",
+    "object_type", "house_material_type", "year_of_construction",
+    "district", "underground", "url", "lat", "lon",
+)
+
+# вставка нового объявления
+INSERT_LISTING = """
+INSERT INTO listings
+(address, price, area, rooms, floor, floors_count,
+ object_type, house_material_type, year_of_construction, district,
+ underground, url, lat, lon)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+# вставка или обновление по естественному ключу; неизмененные строки
+# не перезаписываются
+UPSERT_LISTING = """
+INSERT INTO listings
+(address, price, area, rooms, floor, floors_count,
+ object_type, house_material_type, year_of_construction, district,
+ underground, url, lat, lon, listing_key, content_hash)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (listing_key) DO UPDATE SET
+    address = excluded.address,
+    price = excluded.price,
+    area = excluded.area,
+    rooms = excluded.rooms,
+    floor = excluded.floor,
+    floors_count = excluded.floors_count,
+    object_type = excluded.object_type,
+    house_material_type = excluded.house_material_type,
+    year_of_construction = excluded.year_of_construction,
+    district = excluded.district,
+    underground = excluded.underground,
+    url = excluded.url,
+    lat = excluded.lat,
+    lon = excluded.lon,
+    content_hash = excluded.content_hash
+WHERE listings.content_hash IS NOT excluded.content_hash;
+"""
+
+# уникальный естественный ключ объявления
+CREATE_INDEX_LISTING_KEY = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_listings_listing_key
+ON listings (listing_key);
+"""
+
+# выбрать все объявления
+SELECT_ALL_LISTINGS = """
+SELECT id, address, price, area, rooms, floor, floors_count,
+       object_type, house_material_type, year_of_construction, district,
+       underground, url, lat, lon, created_at
+FROM listings;
+"""
+
+# выбрать объявления с фильтрацией по району
+SELECT_BY_DISTRICT = """
+SELECT id, address, price, area, rooms, floor, floors_count,
+       object_type, house_material_type, year_of_construction, district,
+       underground, url, lat, lon, created_at
+FROM listings
+WHERE district = ?;
+"""
+
+# удаление таблицы (для тестирования)
+DROP_TABLE_LISTINGS = """
+DROP TABLE IF EXISTS listings;
+"""
+
+# индексы для фильтрации и сортировки по цене
+CREATE_INDEX_DISTRICT_ROOMS_PRICE = """
+CREATE INDEX IF NOT EXISTS idx_listings_district_rooms_price
+ON listings (district, rooms, price);
+"""
+
+CREATE_INDEX_DISTRICT_PRICE = """
+CREATE INDEX IF NOT EXISTS idx_listings_district_price
+ON listings (district, price);
+"""
+
+CREATE_INDEX_ROOMS_PRICE = """
+CREATE INDEX IF NOT EXISTS idx_listings_rooms_price
+ON listings (rooms, price);
+"""
+
+CREATE_INDEX_PRICE = """
+CREATE INDEX IF NOT EXISTS idx_listings_price
+ON listings (price);
+"""
+
+LISTING_INDEXES = (
+    CREATE_INDEX_DISTRICT_ROOMS_PRICE,
+    CREATE_INDEX_DISTRICT_PRICE,
+    CREATE_INDEX_ROOMS_PRICE,
+    CREATE_INDEX_PRICE,
+)
+
+# служебная таблица со счетчиком версии данных
+CREATE_TABLE_META = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+INIT_DATA_VERSION = """
+INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0);
+"""
+
+# увеличивается после каждой записи данных
+BUMP_DATA_VERSION = """
+UPDATE meta SET value = value + 1 WHERE key = 'data_version';
+"""
+
+SELECT_DATA_VERSION = """
+SELECT value FROM meta WHERE key = 'data_version';
+"""
+
+# метаданные загрузки источников для условных запросов
+CREATE_TABLE_FETCH_META = """
+CREATE TABLE IF NOT EXISTS fetch_meta (
+    source TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+SELECT_FETCH_META = """
+SELECT etag, last_modified, content_hash, size, mtime_ns
+FROM fetch_meta WHERE source = ?;
+"""
+
+UPSERT_FETCH_META = """
+INSERT INTO fetch_meta (source, etag, last_modified, content_hash, size,
+                        mtime_ns, fetched_at)
+VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT (source) DO UPDATE SET
+    etag = excluded.etag,
+    last_modified = excluded.last_modified,
+    content_hash = excluded.content_hash,
+    size = excluded.size,
+    mtime_ns = excluded.mtime_ns,
+    fetched_at = excluded.fetched_at;
+"""
+
+# предагрегированная сводка для диаграмм: район x комнаты x ценовой интервал
+CREATE_TABLE_LISTING_STATS = """
+CREATE TABLE IF NOT EXISTS listing_stats (
+    district TEXT NOT NULL,
+    rooms INTEGER NOT NULL,
+    price_bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    price_sum INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (district, rooms, price_bucket)
+);
+"""
+
+# изменение счетчиков сводки на приращения, посчитанные при записи
+UPSERT_LISTING_STATS = """
+INSERT INTO listing_stats (district, rooms, price_bucket, count, price_sum)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (district, rooms, price_bucket) DO UPDATE SET
+    count = count + excluded.count,
+    price_sum = price_sum + excluded.price_sum;
+"""
+
+DELETE_EMPTY_LISTING_STATS = """
+DELETE FROM listing_stats WHERE count <= 0;
+"""
+
+# скетчи распределения цены и цены за м² (корзины backend/analytics.py)
+CREATE_TABLE_PRICE_SKETCH = """
+CREATE TABLE IF NOT EXISTS price_sketch (
+    district TEXT NOT NULL,
+    rooms INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (district, rooms, metric, bucket)
+);
+"""
+
+UPSERT_PRICE_SKETCH = """
+INSERT INTO price_sketch (district, rooms, metric, bucket, count, total)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (district, rooms, metric, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    total = total + excluded.total;
+"""
+
+DELETE_EMPTY_PRICE_SKETCH = """
+DELETE FROM price_sketch WHERE count <= 0;
+"""
+
+# пространственный индекс координат объявлений (R*Tree)
+CREATE_LISTINGS_RTREE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS listings_rtree USING rtree (
+    id, min_lat, max_lat, min_lon, max_lon
+);
+"""
+
+# объявления без координат (0, 0) в индекс не попадают
+LISTINGS_RTREE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_rtree_insert
+    AFTER INSERT ON listings
+    WHEN NEW.lat != 0 OR NEW.lon != 0
+    BEGIN
+        INSERT OR REPLACE INTO listings_rtree
+        VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_rtree_update
+    AFTER UPDATE OF lat, lon ON listings
+    BEGIN
+        DELETE FROM listings_rtree WHERE id = OLD.id;
+        INSERT INTO listings_rtree
+        SELECT NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon
+        WHERE NEW.lat != 0 OR NEW.lon != 0;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_rtree_delete
+    AFTER DELETE ON listings
+    BEGIN
+        DELETE FROM listings_rtree WHERE id = OLD.id;
+    END;
+    """,
+)
+
+FILL_LISTINGS_RTREE = """
+INSERT OR REPLACE INTO listings_rtree
+SELECT id, lat, lat, lon, lon FROM listings WHERE lat != 0 OR lon != 0;
+"""
+
+# запасной вариант, если SQLite собран без R*Tree
+CREATE_INDEX_LAT_LON = """
+CREATE INDEX IF NOT EXISTS idx_listings_lat_lon ON listings (lat, lon);
+"""
+
+# Полнотекстовый индекс адресов; содержимое берется из listings по id
+CREATE_LISTINGS_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5 (
+    address, district, underground,
+    content = 'listings', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+LISTINGS_FTS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_insert
+    AFTER INSERT ON listings
+    BEGIN
+        INSERT INTO listings_fts (rowid, address, district, underground)
+        VALUES (NEW.id, NEW.address, NEW.district, NEW.underground);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_update
+    AFTER UPDATE OF address, district, underground ON listings
+    BEGIN
+        INSERT INTO listings_fts (listings_fts, rowid, address, district,
+                                  underground)
+        VALUES ('delete', OLD.id, OLD.address, OLD.district, OLD.underground);
+        INSERT INTO listings_fts (rowid, address, district, underground)
+        VALUES (NEW.id, NEW.address, NEW.district, NEW.underground);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_delete
+    AFTER DELETE ON listings
+    BEGIN
+        INSERT INTO listings_fts (listings_fts, rowid, address, district,
+                                  underground)
+        VALUES ('delete', OLD.id, OLD.address, OLD.district, OLD.underground);
+    END;
+    """,
+)
+
+REBUILD_LISTINGS_FTS = """
+INSERT INTO listings_fts (listings_fts) VALUES ('rebuild');
+"""
+
+# условие фильтра по строке поиска для WHERE по listings
+MATCH_LISTINGS_FTS = ("id IN (SELECT rowid FROM listings_fts "
+                      "WHERE listings_fts MATCH ?)")
+
+# История запусков фоновой загрузки
+CREATE_TABLE_INGEST_JOBS = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    fetch_seconds REAL,
+    write_seconds REAL,
+    found INTEGER DEFAULT 0,
+    inserted INTEGER DEFAULT 0,
+    updated INTEGER DEFAULT 0,
+    unchanged INTEGER DEFAULT 0,
+    error TEXT
+);
+"""
+
+CREATE_INDEX_INGEST_JOBS_SOURCE = """
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_source
+ON ingest_jobs (source, started_at);
+"""
+
+INSERT_INGEST_JOB = """
+INSERT INTO ingest_jobs (source, status, started_at, finished_at,
+                         fetch_seconds, write_seconds, found, inserted,
+                         updated, unchanged, error)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+CREATE_INDEX_INGEST_JOBS_STARTED = """
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_started
+ON ingest_jobs (started_at);
+"""
+
+# старые строки журнала удаляются, итоги по статусам копятся отдельно
+PRUNE_INGEST_JOBS = """
+DELETE FROM ingest_jobs WHERE started_at < ?;
+"""
+
+CREATE_TABLE_INGEST_TOTALS = """
+CREATE TABLE IF NOT EXISTS ingest_totals (
+    status TEXT PRIMARY KEY,
+    jobs INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL DEFAULT 0,
+    unchanged INTEGER NOT NULL DEFAULT 0,
+    write_seconds REAL NOT NULL DEFAULT 0,
+    last_finished_at REAL,
+    last_found INTEGER,
+    last_write_seconds REAL
+);
+"""
+
+UPSERT_INGEST_TOTALS = """
+INSERT INTO ingest_totals (status, jobs, inserted, updated, unchanged,
+                           write_seconds, last_finished_at, last_found,
+                           last_write_seconds)
+VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (status) DO UPDATE SET
+    jobs = jobs + 1,
+    inserted = inserted + excluded.inserted,
+    updated = updated + excluded.updated,
+    unchanged = unchanged + excluded.unchanged,
+    write_seconds = write_seconds + excluded.write_seconds,
+    last_finished_at = excluded.last_finished_at,
+    last_found = excluded.last_found,
+    last_write_seconds = excluded.last_write_seconds;
+"""
+
+SELECT_RECENT_INGEST_JOBS = """
+SELECT source, status, started_at, finished_at, fetch_seconds, write_seconds,
+       found, inserted, updated, unchanged, error
+FROM ingest_jobs ORDER BY id DESC LIMIT ?;
+"""
+
+SELECT_INGEST_JOB_TOTALS = """
+SELECT status, jobs, inserted, updated, unchanged, write_seconds
+FROM ingest_totals;
+"""
+
+SELECT_LAST_INGEST_JOB = """
+SELECT last_finished_at, last_found, last_write_seconds
+FROM ingest_totals WHERE status = 'ok';
+"""
+
+# кэш геокодирования: нормализованный адрес -> координаты; адреса, которые
+# не нашлись, тоже запоминаются (lat и lon - NULL)
+CREATE_TABLE_GEOCODE_CACHE = """
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    address TEXT PRIMARY KEY,
+    lat REAL,
+    lon REAL,
+    resolver TEXT,
+    resolved_at REAL NOT NULL
+);
+"""
+
+UPSERT_GEOCODE_CACHE = """
+INSERT INTO geocode_cache (address, lat, lon, resolver, resolved_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (address) DO UPDATE SET
+    lat = excluded.lat,
+    lon = excluded.lon,
+    resolver = excluded.resolver,
+    resolved_at = excluded.resolved_at;
+"""
+
+# объявления без координат для догеокодирования, по возрастанию id
+SELECT_LISTINGS_WITHOUT_COORDS = """
+SELECT id, address, price, area, rooms, floor, floors_count,
+       object_type, house_material_type, year_of_construction, district,
+       underground, url, lat, lon
+FROM listings
+WHERE lat = 0 AND lon = 0 AND id > ?
+ORDER BY id LIMIT ?;
+"""
+
+UPDATE_LISTING_COORDS = """
+UPDATE listings SET lat = ?, lon = ?, content_hash = ? WHERE id = ?;
+"""
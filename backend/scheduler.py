@@ -0,0 +1,316 @@
+# backend/scheduler.py
+import argparse
+import heapq
+import json
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.crawler import make_session
+from backend.DataFetcher import (
+    DEFAULT_TIMEOUT,
+    DataFetcher,
+    ListingWriter,
+    empty_stats)
+from backend.db import (
+    DB_PATH_HELP,
+    get_read_connection,
+    get_write_connection,
+    prepare_database)
+from backend.geocoding import GEOCODER_HELP, Geocoder
+from backend.queries import (
+    INSERT_INGEST_JOB,
+    PRUNE_INGEST_JOBS,
+    UPSERT_INGEST_TOTALS,
+    SELECT_INGEST_JOB_TOTALS,
+    SELECT_LAST_INGEST_JOB,
+    SELECT_RECENT_INGEST_JOBS)
+
+DEFAULT_INTERVAL = 3600
+DEFAULT_JITTER = 0.1
+# Сколько готовых к записи результатов может ждать писателя
+QUEUE_SIZE = 16
+# Сколько хранить строки журнала ingest_jobs, секунды; итоги по статусам
+# для метрик ведутся в ingest_totals и при очистке не теряются
+JOB_RETENTION = 30 * 24 * 3600
+
+
+class SourceJob:
+    """Источник данных и его расписание"""
+
+    def __init__(self, source, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER):
+        self.source = source
+        self.interval = float(interval)
+        self.jitter = float(jitter)
+        self.running = False
+        self.last_status = None
+        self.last_finished = None
+
+    def next_delay(self):
+        """Интервал до следующего запуска с разбросом ±jitter"""
+        spread = self.interval * self.jitter
+        return max(0.0, self.interval + random.uniform(-spread, spread))
+
+    @classmethod
+    def from_config(cls, entry):
+        if isinstance(entry, str):
+            return cls(entry)
+        return cls(entry["source"], entry.get("interval", DEFAULT_INTERVAL),
+                   entry.get("jitter", DEFAULT_JITTER))
+
+
+def load_config(path):
+    """Источники из JSON: {"sources": [...], "workers": N} или просто список.
+
+    Элемент списка - строка источника или объект
+    {"source": ..., "interval": секунды, "jitter": доля}. Необязательный
+    ключ "geocoder" - резолвер координат, как у backend.geocoding.
+    """
+    with open(path, encoding="utf-8") as file:
+        config = json.load(file)
+    if isinstance(config, list):
+        config = {"sources": config}
+    config["sources"] = [SourceJob.from_config(entry)
+                         for entry in config.get("sources", [])]
+    return config
+
+
+class IngestScheduler:
+    """Периодически загружает источники в фоне, не мешая веб-части.
+
+    Скачивание и разбор идут в пуле потоков, а все записи в SQLite - в
+    одном потоке-писателе через очередь: в базу пишет только он, веб читает
+    в режиме WAL без блокировок. Каждый запуск записывается в ingest_jobs
+    и ingest_totals, строки журнала старше job_retention удаляются;
+    если данные изменились, ListingWriter поднимает версию данных и кэши
+    веб-части сбрасываются.
+    """
+
+    def __init__(self, jobs, db_path=None, workers=4, batch_size=1000,
+                 timeout=DEFAULT_TIMEOUT, geocoder=None,
+                 job_retention=JOB_RETENTION):
+        self.jobs = list(jobs)
+        self.db_path = db_path
+        self.job_retention = job_retention
+        self.workers = workers
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = make_session(workers)
+        # Пишет только поток-писатель; геокодер вызывается при записи
+        self.listing_writer = ListingWriter(db_path, geocoder)
+        self._results = queue.Queue(maxsize=QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._pool = None
+        self._writer = None
+        self._scheduler = None
+
+    def start(self):
+        """Запускает планировщик и писателя в фоновых потоках"""
+        prepare_database(self.db_path)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                        thread_name_prefix="ingest")
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name="ingest-writer", daemon=True)
+        self._scheduler = threading.Thread(target=self._schedule_loop,
+                                           name="ingest-scheduler",
+                                           daemon=True)
+        self._writer.start()
+        self._scheduler.start()
+        print(f"Фоновая загрузка: источников {len(self.jobs)}, "
+              f"потоков {self.workers}")
+        return self
+
+    def stop(self, timeout=None):
+        """Останавливает расписание, дожидается текущих задач и записи"""
+        self._stop.set()
+        self._scheduler.join(timeout)
+        self._pool.shutdown(wait=True)
+        self._results.put(None)
+        self._writer.join(timeout)
+        self.session.close()
+
+    def run_forever(self):
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            print("Остановка фоновой загрузки...")
+        finally:
+            self.stop()
+
+    def _schedule_loop(self):
+        # Первые запуски разносятся по времени, чтобы не стартовать разом
+        due = [(time.monotonic() + random.uniform(0, job.interval * job.jitter),
+                index) for index, job in enumerate(self.jobs)]
+        heapq.heapify(due)
+        while due and not self._stop.is_set():
+            run_at, index = due[0]
+            if self._stop.wait(max(0.0, run_at - time.monotonic())):
+                break
+            heapq.heappop(due)
+            job = self.jobs[index]
+            if not job.running:
+                job.running = True
+                self._pool.submit(self._fetch, job)
+            heapq.heappush(due, (time.monotonic() + job.next_delay(), index))
+
+    def _fetch(self, job):
+        """Скачивает и разбирает источник; результат уходит писателю"""
+        started = time.time()
+        fetcher = DataFetcher(job.source, db_path=self.db_path,
+                              batch_size=self.batch_size,
+                              session=self.session, timeout=self.timeout)
+        fetcher.defer_meta = True
+        listings = None
+        error = None
+        try:
+            if fetcher.is_local_file:
+                if fetcher.local_file_unchanged():
+                    fetcher.not_modified = True
+                else:
+                    listings = list(fetcher.iter_listings())
+            else:
+                html = fetcher.fetch()
+                if html:
+                    listings = fetcher.parse(html)
+                elif not fetcher.not_modified:
+                    error = "не удалось получить данные"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        fetch_seconds = time.time() - started
+        self._results.put((job, fetcher, listings, error, started,
+                           fetch_seconds))
+
+    def _write_loop(self):
+        while True:
+            item = self._results.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                print(f"Ошибка записи результата {item[0].source}: {e}")
+                item[0].running = False
+
+    def _write(self, job, fetcher, listings, error, started, fetch_seconds):
+        totals = empty_stats()
+        write_started = time.time()
+        if error:
+            status = "failed"
+        elif fetcher.not_modified:
+            status = "not_modified"
+            fetcher.commit_fetch_meta()
+        else:
+            status = "ok"
+            for start in range(0, len(listings), self.batch_size):
+                self.listing_writer.save_batch(
+                    listings[start:start + self.batch_size], (), totals)
+            fetcher.commit_fetch_meta()
+        finished = time.time()
+        write_seconds = finished - write_started
+        found = len(listings or ())
+
+        conn = get_write_connection(self.db_path)
+        with conn:
+            conn.execute(INSERT_INGEST_JOB, (
+                job.source, status, started, finished, fetch_seconds,
+                write_seconds, found, totals["inserted"], totals["updated"],
+                totals["unchanged"], error))
+            conn.execute(UPSERT_INGEST_TOTALS, (
+                status, totals["inserted"], totals["updated"],
+                totals["unchanged"], write_seconds, finished, found,
+                write_seconds))
+            conn.execute(PRUNE_INGEST_JOBS, (finished - self.job_retention,))
+        job.last_status = status
+        job.last_finished = finished
+        job.running = False
+        print(f"Загрузка {job.source}: {status}, добавлено "
+              f"{totals['inserted']}, обновлено {totals['updated']}"
+              + (f", ошибка: {error}" if error else ""))
+
+    def status(self):
+        """Состояние источников для отображения или мониторинга"""
+        return [{"source": job.source, "running": job.running,
+                 "last_status": job.last_status,
+                 "last_finished": job.last_finished} for job in self.jobs]
+
+
+def recent_jobs(db_path=None, limit=20):
+    """Последние запуски из журнала ingest_jobs, новые первыми"""
+    columns = ("source", "status", "started_at", "finished_at",
+               "fetch_seconds", "write_seconds", "found", "inserted",
+               "updated", "unchanged", "error")
+    conn = get_read_connection(db_path)
+    return [dict(zip(columns, row))
+            for row in conn.execute(SELECT_RECENT_INGEST_JOBS, (limit,))]
+
+
+def job_totals(db_path=None):
+    """Итоги фоновой загрузки для метрик процессов, которые сами не пишут.
+
+    Читаются из ingest_totals: несколько строк по статусам, а не весь
+    журнал на каждый опрос /metrics.
+
+    {"jobs": {статус: запусков}, "rows": {результат: строк},
+    "write_seconds": время записи, "last_finished": время последней
+    успешной загрузки, "last_rows_per_second": ее скорость записи}
+    """
+    totals = {"jobs": {}, "rows": empty_stats(), "write_seconds": 0.0,
+              "last_finished": None, "last_rows_per_second": None}
+    conn = get_read_connection(db_path)
+    for status, jobs, inserted, updated, unchanged, write_seconds in \
+            conn.execute(SELECT_INGEST_JOB_TOTALS):
+        totals["jobs"][status] = jobs
+        totals["rows"]["inserted"] += inserted or 0
+        totals["rows"]["updated"] += updated or 0
+        totals["rows"]["unchanged"] += unchanged or 0
+        totals["write_seconds"] += write_seconds or 0.0
+    last = conn.execute(SELECT_LAST_INGEST_JOB).fetchone()
+    if last is not None:
+        finished, found, write_seconds = last
+        totals["last_finished"] = finished
+        if write_seconds:
+            totals["last_rows_per_second"] = (found or 0) / write_seconds
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Фоновая загрузка источников по расписанию")
+    parser.add_argument("config", nargs="?",
+                        help="JSON со списком источников и интервалов")
+    parser.add_argument("--db", default=None, help=DB_PATH_HELP)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--geocoder", default=None, help=GEOCODER_HELP)
+    parser.add_argument("--status", action="store_true",
+                        help="показать последние запуски и выйти")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        prepare_database(args.db)
+        for job in recent_jobs(args.db):
+            finished = time.strftime("%Y-%m-%d %H:%M:%S",
+                                     time.localtime(job["finished_at"]))
+            print(f"{finished} {job['status']:<12} {job['source']} "
+                  f"+{job['inserted']} ~{job['updated']} "
+                  f"({job['fetch_seconds']:.1f} + {job['write_seconds']:.1f} с)"
+                  + (f" {job['error']}" if job["error"] else ""))
+        return
+    if not args.config:
+        parser.error("нужен файл с источниками")
+
+    config = load_config(args.config)
+    if not config["sources"]:
+        print("В конфигурации нет источников")
+        return
+    geocoder = Geocoder.from_spec(args.geocoder or config.get("geocoder"))
+    IngestScheduler(config["sources"], db_path=args.db,
+                    workers=args.workers or config.get("workers", 4),
+                    geocoder=geocoder).run_forever()
+
+
+if __name__ == "__main__":
+    main()
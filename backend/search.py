@@ -0,0 +1,62 @@
+# backend/search.py
+import sqlite3
+
+from backend.filter_sql import filter_clauses, match_expression
+from backend.queries import (
+    CREATE_LISTINGS_FTS,
+    LISTINGS_FTS_TRIGGERS,
+    REBUILD_LISTINGS_FTS,
+    MATCH_LISTINGS_FTS)
+
+SUGGEST_LIMIT = 10
+
+
+def create_search_index(conn):
+    """Создает FTS5-индекс адресов и триггеры синхронизации с listings.
+
+    Возвращает False, если SQLite собран без FTS5: тогда поиск по адресу
+    не работает, остальные фильтры - как прежде.
+    """
+    try:
+        conn.execute(CREATE_LISTINGS_FTS)
+    except sqlite3.OperationalError:
+        return False
+    for ddl in LISTINGS_FTS_TRIGGERS:
+        conn.execute(ddl)
+    conn.execute(REBUILD_LISTINGS_FTS)
+    return True
+
+
+def search_keys(conn, query):
+    """(price, id) объявлений, подходящих под строку поиска"""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    return conn.execute(f"SELECT price, id FROM listings "
+                        f"WHERE {MATCH_LISTINGS_FTS}",
+                        (expression,)).fetchall()
+
+
+def suggest(conn, query, limit=SUGGEST_LIMIT, price_range=None, rooms=None,
+            district=None):
+    """Адреса для автодополнения: лучшие совпадения по префиксу с учетом
+    остальных критериев фильтра, без повторов"""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    clauses, params = filter_clauses(price_range, rooms, district,
+                                     prefix="l.")
+    clauses.insert(0, "listings_fts MATCH ?")
+    params.insert(0, expression)
+    # С запасом: у одного адреса бывает несколько объявлений
+    params.append(limit * 4)
+    sql = (f"SELECT l.address FROM listings_fts "
+           f"JOIN listings AS l ON l.id = listings_fts.rowid "
+           f"WHERE {' AND '.join(clauses)} ORDER BY rank LIMIT ?")
+    addresses = []
+    for (address,) in conn.execute(sql, params):
+        if address and address not in addresses:
+            addresses.append(address)
+            if len(addresses) == limit:
+                break
+    return addresses
@@ -0,0 +1,103 @@
+# backend/spatial.py
+import sqlite3
+
+from backend.filter_sql import filter_clauses
+from backend.queries import (
+    CREATE_LISTINGS_RTREE,
+    LISTINGS_RTREE_TRIGGERS,
+    FILL_LISTINGS_RTREE,
+    CREATE_INDEX_LAT_LON)
+
+# Весь мир; используется, если область карты не задана
+WORLD_BBOX = (-90.0, -180.0, 90.0, 180.0)
+# Ячеек кластеризации на сторону тайла карты (256 px / 64 px)
+CELLS_PER_TILE = 4
+MIN_ZOOM = 0
+MAX_ZOOM = 20
+
+
+def create_spatial_index(conn):
+    """Создает R*Tree по координатам и триггеры синхронизации.
+
+    Возвращает False, если SQLite собран без R*Tree: тогда запросы идут
+    по обычному индексу (lat, lon).
+    """
+    conn.execute(CREATE_INDEX_LAT_LON)
+    try:
+        conn.execute(CREATE_LISTINGS_RTREE)
+    except sqlite3.OperationalError:
+        return False
+    for ddl in LISTINGS_RTREE_TRIGGERS:
+        conn.execute(ddl)
+    conn.execute(FILL_LISTINGS_RTREE)
+    return True
+
+
+def has_rtree(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master "
+                       "WHERE name = 'listings_rtree'").fetchone()
+    return row is not None
+
+
+def cell_size(zoom):
+    """Размер ячейки кластера в градусах для уровня масштаба"""
+    zoom = min(max(int(zoom), MIN_ZOOM), MAX_ZOOM)
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def parse_bbox(value):
+    """Область карты из строки 'south,west,north,east'"""
+    if not value:
+        return None
+    try:
+        south, west, north, east = (float(part) for part in value.split(","))
+    except ValueError:
+        return None
+    if south > north or west > east:
+        return None
+    return south, west, north, east
+
+
+def cluster_markers(conn, bbox=None, zoom=10, price_range=None, rooms=None,
+                    district=None, q=None):
+    """Кластеры объявлений в области карты по сетке текущего масштаба.
+
+    Возвращает список словарей: центр кластера, число объявлений, средняя
+    цена и id объявления, если оно в кластере одно. Размер ответа зависит
+    от области и масштаба, а не от числа объявлений.
+    """
+    south, west, north, east = bbox or WORLD_BBOX
+    size = cell_size(zoom)
+
+    if has_rtree(conn):
+        clauses = ["id IN (SELECT id FROM listings_rtree WHERE "
+                   "max_lat >= ? AND min_lat <= ? AND "
+                   "max_lon >= ? AND min_lon <= ?)"]
+    else:
+        clauses = ["lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?",
+                   "(lat != 0 OR lon != 0)"]
+    params = [south, north, west, east]
+    filters, filter_params = filter_clauses(price_range, rooms, district, q)
+    clauses.extend(filters)
+    params.extend(filter_params)
+
+    sql = f"""
+        SELECT CAST((lat - ?) / ? AS INTEGER) AS cell_y,
+               CAST((lon - ?) / ? AS INTEGER) AS cell_x,
+               COUNT(*), AVG(price), AVG(lat), AVG(lon), MIN(id)
+        FROM listings
+        WHERE {' AND '.join(clauses)}
+        GROUP BY cell_y, cell_x
+    """
+    clusters = []
+    for _, _, count, avg_price, lat, lon, first_id in conn.execute(
+            sql, [south, size, west, size] + params):
+        clusters.append({
+            "lat": lat,
+            "lon": lon,
+            "count": count,
+            "avg_price": int(round(avg_price or 0)),
+            "id": first_id if count == 1 else None,
+        })
+    clusters.sort(key=lambda cluster: cluster["count"], reverse=True)
+    return clusters
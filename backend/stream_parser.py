@@ -0,0 +1,111 @@
+# backend/stream_parser.py
+from html.parser import HTMLParser
+
+
+def _classes(attrs):
+    for name, value in attrs:
+        if name == "class" and value:
+            return value.split()
+    return []
+
+
+class ListingStreamParser(HTMLParser):
+    """Потоковый разбор div.listing-item без построения дерева документа.
+
+    Данные подаются кусками через feed(), готовые объявления копятся в
+    self.listings и забираются вызывающим кодом через pop_listings().
+    В памяти держится только текущее объявление.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.listings = []
+        self._div_depth = 0
+        self._field = None
+        self._span_depth = 0
+        # Глубина div, в котором открыт span текущего поля
+        self._field_div = 0
+        self._current = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "div":
+            if "listing-item" in _classes(attrs):
+                # Незакрытый div внутри объявления не должен поглощать
+                # следующие: новое объявление завершает текущее
+                if self._current is not None:
+                    self._finish_item()
+                self._div_depth = 1
+                self._current = {}
+            elif self._div_depth:
+                self._div_depth += 1
+        elif tag == "span" and self._div_depth:
+            if self._field:
+                self._span_depth += 1
+                return
+            classes = _classes(attrs)
+            for field in ("price", "address"):
+                if field in classes and field not in self._current:
+                    self._field = field
+                    self._span_depth = 1
+                    self._field_div = self._div_depth
+                    self._current[field] = []
+                    break
+
+    def handle_endtag(self, tag):
+        if tag == "span" and self._field:
+            self._span_depth -= 1
+            if self._span_depth == 0:
+                self._field = None
+        elif tag == "div" and self._div_depth:
+            # Незакрытый span заканчивается вместе с div, где он открыт
+            if self._field and self._div_depth <= self._field_div:
+                self._field = None
+                self._span_depth = 0
+            self._div_depth -= 1
+            if self._div_depth == 0:
+                self._finish_item()
+
+    def handle_data(self, data):
+        if self._field:
+            self._current[self._field].append(data)
+
+    def _finish_item(self):
+        item = self._current
+        self._current = None
+        self._field = None
+        self._span_depth = 0
+        self._div_depth = 0
+        if "price" in item and "address" in item:
+            self.listings.append({
+                "price": clean_text("".join(item["price"])),
+                "address": clean_text("".join(item["address"])),
+            })
+
+    def close(self):
+        super().close()
+        # Объявление, не закрытое до конца документа, тоже отдается
+        if self._current is not None:
+            self._finish_item()
+
+    def pop_listings(self):
+        listings = self.listings
+        self.listings = []
+        return listings
+
+
+def clean_text(text):
+    """Очищает текст от лишних пробелов и символов"""
+    return ' '.join(text.split()).strip() if text else ""
+
+
+def iter_listings(file, chunk_size=1 << 16):
+    """Генератор объявлений из открытого текстового файла, кусок за куском"""
+    parser = ListingStreamParser()
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        yield from parser.pop_listings()
+    parser.close()
+    yield from parser.pop_listings()
@@ -0,0 +1,168 @@
+# benchmarks/generate.py
+"""Воспроизводимые синтетические объявления для замеров.
+
+При одном и том же seed генератор выдает одни и те же объявления, страницы
+и базы, поэтому замеры разных версий кода сравнимы между собой.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+DATA_DIR = os.path.join(PROJECT_DIR, "benchmarks", "data")
+DEFAULT_SEED = 7
+SIZES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+LISTINGS_PER_PAGE = 50
+WRITE_BATCH = 10000
+
+DISTRICTS = ("Центральный", "Северный", "Южный", "Западный", "Восточный",
+             "Приморский", "Заречный", "Ленинский")
+STREETS = ("Ленина", "Мира", "Гагарина", "Садовая", "Советская", "Лесная",
+           "Пушкина", "Школьная", "Набережная", "Молодежная", "Полевая",
+           "Заводская", "Строителей", "Победы", "Космонавтов")
+STREET_TYPES = ("ул.", "пр-т", "пер.", "бульвар")
+UNDERGROUND = ("Пушкинская", "Площадь Революции", "Парк культуры",
+               "Спортивная", "Речной вокзал", None)
+# Центр города и разброс координат, градусы
+CENTER = (55.75, 37.62)
+SPREAD = 0.2
+
+
+def size_of(name):
+    """Размер из строки вида '1k', '100k', '1m' или числа"""
+    if name in SIZES:
+        return SIZES[name]
+    return int(name)
+
+
+def generate_listings(count, seed=DEFAULT_SEED):
+    """count объявлений-словарей в формате, который понимает to_db_row"""
+    rng = random.Random(seed)
+    for index in range(count):
+        rooms = rng.choices((1, 2, 3, 4, 5), weights=(35, 35, 20, 8, 2))[0]
+        area = round(rng.uniform(18, 30) * rooms + rng.uniform(0, 15), 1)
+        district = rng.choice(DISTRICTS)
+        price = int(area * rng.lognormvariate(11.7, 0.35)) // 1000 * 1000
+        yield {
+            "address": (f"{rng.choice(STREET_TYPES)} {rng.choice(STREETS)}, "
+                        f"д. {rng.randint(1, 150)}, кв. {rng.randint(1, 300)}"),
+            "price": f"{price:,}".replace(",", " ") + " ₽",
+            "area": area,
+            "rooms": rooms,
+            "floor": rng.randint(1, 25),
+            "floors_count": 25,
+            "district": district,
+            "underground": rng.choice(UNDERGROUND),
+            "url": f"https://example.org/flat/{seed}/{index}",
+            "lat": round(CENTER[0] + rng.uniform(-SPREAD, SPREAD), 6),
+            "lon": round(CENTER[1] + rng.uniform(-SPREAD, SPREAD) * 1.8, 6),
+        }
+
+
+def render_page(listings):
+    """HTML страницы выдачи в формате div.listing-item"""
+    items = []
+    for item in listings:
+        items.append(
+            f'<div class="listing-item card">'
+            f'<a href="{item["url"]}"><h3>{item["rooms"]}-комн. квартира, '
+            f'{item["area"]} м²</h3></a>'
+            f'<span class="price">{item["price"]}</span>'
+            f'<span class="address">{item["address"]}</span>'
+            f'<span class="district">{item["district"]}</span>'
+            f'</div>')
+    return ("<!DOCTYPE html><html lang=\"ru\"><head><meta charset=\"UTF-8\">"
+            "<title>Объявления</title></head><body><div class=\"listings\">"
+            + "\n".join(items) + "</div></body></html>")
+
+
+def write_pages(directory, count, seed=DEFAULT_SEED,
+                per_page=LISTINGS_PER_PAGE):
+    """Раскладывает count объявлений по HTML-файлам; возвращает их пути"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    page = []
+    for item in generate_listings(count, seed):
+        page.append(item)
+        if len(page) == per_page:
+            paths.append(_write_page(directory, len(paths), page))
+            page = []
+    if page:
+        paths.append(_write_page(directory, len(paths), page))
+    return paths
+
+
+def _write_page(directory, number, listings):
+    path = os.path.join(directory, f"page-{number:06d}.html")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(render_page(listings))
+    return path
+
+
+def build_db(path, count, seed=DEFAULT_SEED):
+    """Заполняет базу через обычный путь записи ListingWriter"""
+    from backend.DataFetcher import ListingWriter
+
+    writer = ListingWriter(path)
+    batch = []
+    for item in generate_listings(count, seed):
+        batch.append(item)
+        if len(batch) == WRITE_BATCH:
+            writer.save(batch)
+            batch = []
+    if batch:
+        writer.save(batch)
+    return path
+
+
+def db_path_for(size_name, seed=DEFAULT_SEED):
+    return os.path.join(DATA_DIR, f"listings-{size_name}-{seed}.db")
+
+
+def pages_dir_for(size_name, seed=DEFAULT_SEED):
+    return os.path.join(DATA_DIR, f"pages-{size_name}-{seed}")
+
+
+def ensure_db(size_name, seed=DEFAULT_SEED):
+    """Путь к готовой базе размера size_name; создает ее при первом вызове"""
+    path = db_path_for(size_name, seed)
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        partial = path + ".partial"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(partial + suffix):
+                os.remove(partial + suffix)
+        started = time.monotonic()
+        build_db(partial, size_of(size_name), seed)
+        from backend.db import close_thread_connections
+        close_thread_connections()
+        os.replace(partial, path)
+        print(f"База {path} создана за {time.monotonic() - started:.1f} с")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Генерация синтетических страниц и баз для замеров")
+    parser.add_argument("--sizes", default="1k,100k",
+                        help="размеры через запятую: 1k, 100k, 1m или число")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--pages", action="store_true",
+                        help="также сохранить HTML-страницы выдачи")
+    args = parser.parse_args(argv)
+
+    for size_name in args.sizes.split(","):
+        ensure_db(size_name, args.seed)
+        if args.pages:
+            paths = write_pages(pages_dir_for(size_name, args.seed),
+                                size_of(size_name), args.seed)
+            print(f"Страниц для {size_name}: {len(paths)}")
+
+
+if __name__ == "__main__":
+    main()
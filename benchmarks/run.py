@@ -0,0 +1,274 @@
+# benchmarks/run.py
+"""Замеры горячих путей с JSON-результатом и сравнением с базовой линией.
+
+    python -m benchmarks.run --sizes 1k,100k --output results.json
+    python -m benchmarks.run --baseline baseline.json --threshold 0.2
+
+Каждый размер замеряется в отдельном процессе: пути к базе по умолчанию
+во frontend фиксируются при импорте из переменной DATA_DB_PATH.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (PROJECT_DIR, os.path.join(PROJECT_DIR, "main")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from benchmarks.generate import (  # noqa: E402
+    DEFAULT_SEED,
+    ensure_db,
+    generate_listings,
+    render_page,
+    size_of)
+
+DEFAULT_OUTPUT = os.path.join(PROJECT_DIR, "benchmarks", "results.json")
+# Объявлений на одной странице для замера разбора и пачка для записи
+PARSE_LISTINGS = 2000
+SAVE_LISTINGS = 10000
+# Разница меньше этой считается шумом, секунды
+MIN_REGRESSION = 0.0005
+# Диапазон цен диаграмм и страницы: фильтр по умолчанию (до 1 млн) не
+# находит ни одного сгенерированного объявления
+CHART_PRICE_RANGE = (0, 1000000000)
+
+
+class Benchmark:
+    """Замер: setup() перед каждым повтором, run(state) - измеряемая часть"""
+
+    def __init__(self, name, run, setup=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda: None)
+
+    def measure(self, repeat):
+        timings = []
+        for _ in range(repeat):
+            state = self.setup()
+            started = time.perf_counter()
+            self.run(state)
+            timings.append(time.perf_counter() - started)
+        return {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.fmean(timings),
+            "runs": repeat,
+        }
+
+
+def make_benchmarks(size_name, seed, scratch):
+    """Набор замеров для базы размера size_name (DATA_DB_PATH уже задан).
+
+    Базы замера записи создаются в каталоге scratch.
+    """
+    from backend.DataFetcher import DataFetcher, ListingWriter
+    from backend.db import prepare_database
+    from frontend.cache import chart_cache, fragment_cache, listings_cache
+    from frontend.filters import (
+        CHART_TYPES,
+        ChartView,
+        FilterPanel,
+        ListingFilter,
+        load_data_from_db,
+        reset_caches)
+    from frontend.html_renderer import render_map
+    from app import app
+
+    size = size_of(size_name)
+    parser = DataFetcher("", use_meta=False)
+    html = render_page(generate_listings(min(size, PARSE_LISTINGS), seed))
+    rows = list(generate_listings(min(size, SAVE_LISTINGS), seed + 1))
+
+    def fresh_db():
+        path = os.path.join(scratch, f"save-{time.perf_counter_ns()}.db")
+        prepare_database(path)
+        return ListingWriter(path)
+
+    panel = FilterPanel(ListingFilter(price_min=3000000, price_max=8000000,
+                                      rooms=2))
+    page_rows, _ = panel.get_page()
+    chart_view = ChartView()
+    client = app.test_client()
+
+    def clear_caches():
+        # Холодный запрос: ни выборок, ни HTML, ни хранилища в памяти
+        reset_caches()
+        chart_cache.clear()
+        fragment_cache.clear()
+
+    benchmarks = [
+        Benchmark("DataFetcher.parse", lambda _: parser.parse(html)),
+        Benchmark("ListingWriter.save",
+                  lambda writer: writer.save(rows), fresh_db),
+        Benchmark("load_data_from_db", lambda _: load_data_from_db(),
+                  listings_cache.clear),
+        Benchmark("FilterPanel.get_filtered_data",
+                  lambda _: panel.get_filtered_data(), listings_cache.clear),
+        Benchmark("FilterPanel.get_page", lambda _: panel.get_page(),
+                  listings_cache.clear),
+        Benchmark("render_map", lambda _: render_map(page_rows)),
+        Benchmark("render_map:fragments",
+                  lambda _: render_map(page_rows, version=0)),
+    ]
+    for chart_type in CHART_TYPES:
+        chart_filter = ListingFilter(price_min=CHART_PRICE_RANGE[0],
+                                     price_max=CHART_PRICE_RANGE[1],
+                                     chart_type=chart_type)
+        chart_panel = FilterPanel(chart_filter)
+        data = chart_panel.get_chart_data(page_rows)
+        # Без очистки кэша диаграмм замер покажет только поиск в нем
+        benchmarks.append(Benchmark(
+            f"ChartView.draw_chart:{chart_type}",
+            lambda _, data=data, chart_type=chart_type:
+                chart_view.draw_chart(data, chart_type), chart_cache.clear))
+        url = f"/?{urlencode(chart_filter.to_args())}"
+        benchmarks.append(Benchmark(
+            f"GET /:{chart_type}:cold",
+            lambda _, url=url: client.get(url).get_data(), clear_caches))
+        benchmarks.append(Benchmark(
+            f"GET /:{chart_type}:warm",
+            lambda _, url=url: client.get(url).get_data()))
+    return benchmarks
+
+
+def run_size(size_name, seed, repeat):
+    """Все замеры одного размера в текущем процессе"""
+    from backend.db import close_thread_connections
+
+    results = {}
+    # Сообщения кода о ходе работы в замерах не нужны
+    with contextlib.redirect_stdout(io.StringIO()), \
+            tempfile.TemporaryDirectory(prefix="bench-") as scratch:
+        benchmarks = make_benchmarks(size_name, seed, scratch)
+        try:
+            for benchmark in benchmarks:
+                # Первый прогон греет кэши, шаблоны и хранилище в памяти
+                benchmark.measure(1)
+                results[benchmark.name] = benchmark.measure(repeat)
+        finally:
+            # Соединения держат файлы баз и WAL в каталоге замера
+            close_thread_connections()
+    return results
+
+
+def run_in_subprocess(size_name, seed, repeat):
+    db_path = ensure_db(size_name, seed)
+    env = dict(os.environ, DATA_DB_PATH=db_path)
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "results.json")
+        subprocess.run([sys.executable, "-m", "benchmarks.run",
+                        "--worker", size_name, "--seed", str(seed),
+                        "--repeat", str(repeat), "--output", output],
+                       cwd=PROJECT_DIR, env=env, check=True)
+        with open(output, encoding="utf-8") as file:
+            return json.load(file)
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=PROJECT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Список регрессий: медиана выросла больше чем на threshold"""
+    regressions = []
+    for size_name, benchmarks in results["results"].items():
+        base_size = baseline.get("results", {}).get(size_name, {})
+        for name, current in benchmarks.items():
+            base = base_size.get(name)
+            if not base:
+                continue
+            ratio = current["median"] / max(base["median"], 1e-9)
+            if (ratio > 1 + threshold and
+                    current["median"] - base["median"] > MIN_REGRESSION):
+                regressions.append((size_name, name, base["median"],
+                                    current["median"], ratio))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    base_results = (baseline or {}).get("results", {})
+    for size_name, benchmarks in results["results"].items():
+        print(f"\n== {size_name} ==")
+        for name, current in benchmarks.items():
+            line = f"{name:<36} {current['median'] * 1000:10.2f} мс"
+            base = base_results.get(size_name, {}).get(name)
+            if base:
+                ratio = current["median"] / max(base["median"], 1e-9)
+                line += f"   x{ratio:.2f} к базовой"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Замеры производительности на синтетических данных")
+    parser.add_argument("--sizes", default="1k,100k",
+                        help="размеры через запятую: 1k, 100k, 1m или число")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline",
+                        help="JSON прошлых замеров для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="допустимый рост медианы, доля (0.2 = 20%%)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        results = run_size(args.worker, args.seed, args.repeat)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file)
+        return 0
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for size_name in args.sizes.split(","):
+        print(f"Замеры для {size_name}...")
+        results["results"][size_name] = run_in_subprocess(
+            size_name, args.seed, args.repeat)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    print(f"\nРезультаты: {args.output}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for size_name, name, before, after, ratio in regressions:
+            print(f"РЕГРЕССИЯ {size_name} {name}: {before * 1000:.2f} -> "
+                  f"{after * 1000:.2f} мс (x{ratio:.2f})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
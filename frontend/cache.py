@@ -0,0 +1,114 @@
+# frontend/cache.py
+import threading
+from collections import OrderedDict
+
+
+class ListingsCache:
+    """LRU-кэш результатов выборки, привязанный к версии данных.
+
+    Ключ записи - (путь к базе, версия данных, ключ запроса). Как только
+    версия данных в базе меняется, все записи старой версии удаляются.
+    Память ограничена числом записей и суммарным числом строк.
+    """
+
+    def __init__(self, max_entries=128, max_rows=200000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _size(value):
+        return len(value) if isinstance(value, list) else 1
+
+    def _check_version(self, db_path, version):
+        if self._versions.get(db_path) == version:
+            return
+        self._versions[db_path] = version
+        for key in [key for key in self._entries if key[0] == db_path]:
+            self._rows -= self._size(self._entries.pop(key))
+
+    def get(self, db_path, version, key):
+        with self._lock:
+            self._check_version(db_path, version)
+            full_key = (db_path, version, key)
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key]
+            self.misses += 1
+            return None
+
+    def put(self, db_path, version, key, value):
+        size = self._size(value)
+        if size > self.max_rows:
+            return value
+        with self._lock:
+            self._check_version(db_path, version)
+            full_key = (db_path, version, key)
+            if full_key in self._entries:
+                self._rows -= self._size(self._entries.pop(full_key))
+            self._entries[full_key] = value
+            self._rows += size
+            while (len(self._entries) > self.max_entries or
+                   self._rows > self.max_rows):
+                _, evicted = self._entries.popitem(last=False)
+                self._rows -= self._size(evicted)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._rows = 0
+
+
+class FragmentCache:
+    """LRU-кэш готовых HTML-фрагментов.
+
+    Запись хранит версию данных, с которой фрагмент отрисован; при другой
+    версии это промах, и новый фрагмент заменяет старый. Фрагменты,
+    ключ которых - хеш самих данных, кладутся с версией None и не
+    устаревают.
+    """
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, version=None):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Общий кэш процесса
+listings_cache = ListingsCache()
+# Строки таблицы и маркеры карты по (вид, id объявления) и версии данных
+fragment_cache = FragmentCache(max_entries=20000)
+# Диаграммы целиком по хешу их данных
+chart_cache = FragmentCache(max_entries=256)
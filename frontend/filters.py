@@ -1,84 +1,376 @@
 # frontend/filters.py
 import sqlite3
 import os
+import threading
+from dataclasses import dataclass, asdict
+from typing import Optional
+from backend.aggregates import (
+    LINE_CHART_POINTS,
+    count_by,
+    downsample_sorted,
+    price_histogram,
+    quantile_curve)
+from backend.analytics import price_stats as sketch_price_stats
+from backend.db import DEFAULT_DB_PATH, get_read_connection
+from backend.listing_store import ListingStore
+from backend.metrics import ROWS_SCANNED, ROWS_RETURNED
+from backend.search import search_keys, suggest
+from backend.spatial import cluster_markers
+from backend.queries import SELECT_DATA_VERSION
+from frontend.cache import listings_cache
+from frontend.query_builder import (
+    LISTING_COLUMNS,
+    build_filter_query,
+    build_count_query,
+    make_cursor)
 from frontend.html_renderer import (
-    render_bar_chart,
-    render_pie_chart,
-    render_line_chart,
-    render_table,
+    iter_bar_chart,
+    iter_pie_chart,
+    iter_line_chart,
+    iter_table,
+    iter_stats_table,
+    iter_map,
+    iter_map_clusters,
     render_map)
 
 
-def load_data_from_db(db_path="../data.db"):
+DB_PATH = DEFAULT_DB_PATH
+
+# db_path -> ListingStore последней собранной версии
+_stores = {}
+# Базы, для которых новое хранилище уже собирается в фоне
+_refreshing = set()
+_store_lock = threading.Lock()
+# Сборки идут по одной: параллельные копии только тратили бы память
+_build_lock = threading.Lock()
+
+
+def _row_to_item(row):
+    # Типы уже приведены при записи, здесь только значения по умолчанию
+    item = dict(row)
+    item["district"] = item["district"] or "Неизвестный"
+    item["address"] = item["address"] or "Адрес не указан"
+    return item
+
+
+def _connect(db_path):
+    # Соединение только на чтение из пула потока; не закрывается
+    return get_read_connection(db_path)
+
+
+def get_data_version(conn):
+    """Текущая версия данных; меняется после каждой записи в базу"""
+    try:
+        row = conn.execute(SELECT_DATA_VERSION).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def _cached(db_path, key, compute, default):
+    """Результат compute(conn) из кэша текущей версии данных или из базы"""
+    conn = _connect(db_path)
+    version = get_data_version(conn)
+    if version is not None:
+        cached = listings_cache.get(db_path, version, key)
+        if cached is not None:
+            return cached
+    try:
+        result = compute(conn)
+    except sqlite3.OperationalError:
+        return default
+    if version is None:
+        # Без счетчика версии нельзя понять, когда кэш устарел
+        return result
+    return listings_cache.put(db_path, version, key, result)
+
+
+def _cached_query(db_path, key, sql, params, convert):
+    return _cached(db_path, key,
+                   lambda conn: convert(conn.execute(sql, params)),
+                   convert(None))
+
+
+def _rows_to_items(cursor):
+    return [_row_to_item(row) for row in cursor] if cursor else []
+
+
+def _first_value(cursor):
+    return cursor.fetchone()[0] if cursor else 0
+
+
+def load_data_from_db(db_path=DB_PATH):
     if not os.path.exists(db_path):
         return []
+    sql = f"SELECT {', '.join(LISTING_COLUMNS)} FROM listings"
+    rows = _cached_query(db_path, ("all",), sql, [], _rows_to_items)
+    ROWS_SCANNED.inc(len(rows), source="all")
+    ROWS_RETURNED.inc(len(rows), source="all")
+    return rows
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM listings")
-    rows = cur.fetchall()
-    conn.close()
-
-    data = []
-    for row in rows:
-        # Безопасное извлечение значений из sqlite3.Row
-        def safe_get(key, default=""):
-            try:
-                val = row[key]
-                return val if val else default
-            except (KeyError, IndexError):
-                return default
 
-        try:
-            price = int(''.join(safe_get("price").split())) if safe_get(
-                "price") else 0
-        except (ValueError, TypeError):
-            price = 0
+def query_listings(price_range=None, rooms=None, district=None, limit=None,
+                   offset=0, after=None, q=None, db_path=DB_PATH):
+    """Выбирает объявления по фильтру силами SQLite"""
+    if not os.path.exists(db_path):
+        return []
+    sql, params = build_filter_query(price_range, rooms, district,
+                                     limit, offset, after, q)
+    return _cached_query(db_path, ("rows", sql, tuple(params)), sql, params,
+                         _rows_to_items)
 
-        # Для числовых полей используем 0 по умолчанию
-        rooms = safe_get("rooms_count", 0)
-        lat = safe_get("lat", 0.0)
-        lon = safe_get("lon", 0.0)
 
-        # Приведение типов
-        try:
-            rooms = int(rooms)
-        except (ValueError, TypeError):
-            rooms = 0
+def count_listings(price_range=None, rooms=None, district=None, q=None,
+                   db_path=DB_PATH):
+    """Считает объявления, подходящие под фильтр"""
+    if not os.path.exists(db_path):
+        return 0
+    sql, params = build_count_query(price_range, rooms, district, q)
+    return _cached_query(db_path, ("count", sql, tuple(params)), sql, params,
+                         _first_value)
 
-        try:
-            lat = float(lat)
-        except (ValueError, TypeError):
-            lat = 0.0
 
+def count_groups(column, price_range=None, rooms=None, district=None,
+                 q=None, db_path=DB_PATH):
+    """Число объявлений по районам, комнатам или интервалам цен.
+
+    Без поиска по адресу считается по сводной таблице, с поиском - по
+    самим объявлениям.
+    """
+    if not os.path.exists(db_path):
+        return {}
+    key = ("groups", column, tuple(price_range or ()), rooms, district, q)
+    return _cached(db_path, key,
+                   lambda conn: count_by(conn, column, price_range, rooms,
+                                         district, q),
+                   {})
+
+
+def price_curve(price_range=None, rooms=None, district=None,
+                points=LINE_CHART_POINTS, db_path=DB_PATH):
+    """Кривая цен из points точек для линейной диаграммы"""
+    if not os.path.exists(db_path):
+        return {"prices": []}
+    key = ("curve", tuple(price_range or ()), rooms, district, points)
+
+    def compute(conn):
+        histogram = price_histogram(conn, price_range, rooms, district,
+                                    points)
+        return {"prices": quantile_curve(histogram, points)}
+
+    return _cached(db_path, key, compute, {"prices": []})
+
+
+def price_stats(group="district", rooms=None, district=None, db_path=DB_PATH):
+    """Медиана, p10/p90 и средние цены по группам из скетчей price_sketch"""
+    if not os.path.exists(db_path):
+        return []
+    key = ("stats", group, rooms, district)
+    return _cached(db_path, key,
+                   lambda conn: sketch_price_stats(conn, group, rooms,
+                                                   district),
+                   [])
+
+
+def map_clusters(bbox=None, zoom=10, price_range=None, rooms=None,
+                 district=None, q=None, db_path=DB_PATH):
+    """Кластеры маркеров для области карты и масштаба"""
+    if not os.path.exists(db_path):
+        return []
+    key = ("clusters", bbox, zoom, tuple(price_range or ()), rooms, district,
+           q)
+    return _cached(db_path, key,
+                   lambda conn: cluster_markers(conn, bbox, zoom, price_range,
+                                                rooms, district, q),
+                   [])
+
+
+def search_mask(store, q, db_path=DB_PATH):
+    """Маска строк хранилища, подходящих под строку поиска по адресу"""
+    if not q or not os.path.exists(db_path):
+        return 0
+    return _cached(db_path, ("search", store.version, q),
+                   lambda conn: store.keys_mask(search_keys(conn, q)), 0)
+
+
+def suggest_addresses(q, limit=10, price_range=None, rooms=None,
+                      district=None, db_path=DB_PATH):
+    """Адреса для автодополнения строки поиска"""
+    if not q or not os.path.exists(db_path):
+        return []
+    key = ("suggest", q, limit, tuple(price_range or ()), rooms, district)
+    return _cached(db_path, key,
+                   lambda conn: suggest(conn, q, limit, price_range, rooms,
+                                        district),
+                   [])
+
+
+def listings_by_ids(ids, db_path=DB_PATH):
+    """Строки объявлений по списку id в том же порядке"""
+    if not ids:
+        return []
+    placeholders = ", ".join("?" * len(ids))
+    cursor = _connect(db_path).execute(
+        f"SELECT {', '.join(LISTING_COLUMNS)} FROM listings "
+        f"WHERE id IN ({placeholders})", ids)
+    rows = {row["id"]: _row_to_item(row) for row in cursor}
+    return [rows[listing_id] for listing_id in ids if listing_id in rows]
+
+
+def _build_store(db_path):
+    """Собирает хранилище по снимку базы; None при ошибке.
+
+    Версия и строки читаются в одной транзакции, поэтому store.version
+    точно соответствует данным хранилища.
+    """
+    with _build_lock:
+        conn = _connect(db_path)
         try:
-            lon = float(lon)
-        except (ValueError, TypeError):
-            lon = 0.0
-
-        item = {
-            "id": row["id"],
-            "price": price,
-            "rooms": rooms,
-            "district": safe_get("district", "Неизвестный").capitalize(),
-            "lat": lat,
-            "lon": lon,
-            "address": safe_get("address", "Адрес не указан"),
-        }
-        data.append(item)
-    return data
+            conn.execute("BEGIN")
+            try:
+                version = get_data_version(conn)
+                cached = _stores.get(db_path)
+                if cached is not None and cached.version == version:
+                    return cached
+                store = ListingStore.from_connection(conn, version)
+            finally:
+                conn.execute("COMMIT")
+        except sqlite3.OperationalError:
+            return None
+        with _store_lock:
+            _stores[db_path] = store
+    return store
+
+
+def _refresh_store(db_path):
+    try:
+        _build_store(db_path)
+    finally:
+        with _store_lock:
+            _refreshing.discard(db_path)
+
+
+def get_listing_store(db_path=DB_PATH):
+    """Колоночное хранилище объявлений текущей версии данных.
+
+    Хранилище отдается, только если его версия совпадает с версией базы.
+    После загрузки новое собирается в фоновом потоке, а до его готовности
+    возвращается None и запросы отвечают из SQLite, не дожидаясь сборки.
+    Синхронно, один раз на процесс, строится только самое первое. None
+    также, если базы или счетчика версии еще нет.
+    """
+    if not os.path.exists(db_path):
+        return None
+    version = get_data_version(_connect(db_path))
+    if version is None:
+        return None
+    store = _stores.get(db_path)
+    if store is None:
+        store = _build_store(db_path)
+    elif store.version != version:
+        with _store_lock:
+            start = db_path not in _refreshing
+            _refreshing.add(db_path)
+        if start:
+            threading.Thread(target=_refresh_store, args=(db_path,),
+                             name="listing-store", daemon=True).start()
+        return None
+    if store is None or store.version != version:
+        return None
+    return store
+
+
+def reset_caches():
+    """Сбрасывает кэш выборок и хранилища в памяти: холодный старт"""
+    listings_cache.clear()
+    with _store_lock:
+        _stores.clear()
+
+
+def current_data_version(db_path=DB_PATH):
+    """Версия данных базы для ключей кэша и ETag"""
+    if not os.path.exists(db_path):
+        return None
+    return get_data_version(_connect(db_path))
+
+
+PAGE_SIZES = (20, 50, 100, 200)
+DEFAULT_PAGE_SIZE = 50
+CHART_TYPES = ("bar", "pie", "line", "table", "stats")
+# Районы в форме, пока в базе нет объявлений
+DEFAULT_DISTRICTS = ("Центральный", "Северный", "Южный", "Западный",
+                     "Восточный")
+MAX_QUERY_LENGTH = 100
+
+
+@dataclass(frozen=True)
+class ListingFilter:
+    """Неизменяемые критерии фильтра одного запроса; годятся как ключ кэша"""
+    price_min: int = 0
+    price_max: int = 1000000
+    rooms: Optional[int] = None
+    district: Optional[str] = None
+    chart_type: str = "bar"
+    page_size: int = DEFAULT_PAGE_SIZE
+    q: Optional[str] = None
+
+    @classmethod
+    def from_args(cls, args):
+        """Фильтр из параметров GET-запроса; некорректные значения - по умолчанию"""
+        defaults = cls()
+        price_min = args.get("price_min", type=int)
+        price_max = args.get("price_max", type=int)
+        rooms = args.get("rooms", type=int)
+        chart_type = args.get("chart_type")
+        page_size = args.get("page_size", type=int)
+        q = (args.get("q") or "").strip()[:MAX_QUERY_LENGTH]
+        return cls(
+            price_min=price_min if price_min is not None else defaults.price_min,
+            price_max=price_max if price_max is not None else defaults.price_max,
+            rooms=rooms or None,
+            district=args.get("district") or None,
+            chart_type=(chart_type if chart_type in CHART_TYPES
+                        else defaults.chart_type),
+            page_size=(page_size if page_size in PAGE_SIZES
+                       else defaults.page_size),
+            q=q or None,
+        )
+
+    @property
+    def price_range(self):
+        return [self.price_min, self.price_max]
+
+    def to_args(self):
+        """Параметры URL, отличные от значений по умолчанию"""
+        defaults = asdict(ListingFilter())
+        return {name: value for name, value in asdict(self).items()
+                if value is not None and value != defaults[name]}
 
 
 class FilterPanel:
-    def __init__(self):
-        self.price_range = [0, 1000000]
-        self.rooms = None
-        self.district = None
-        self.chart_type = "bar"
+    def __init__(self, listing_filter=None):
+        listing_filter = listing_filter or ListingFilter()
+        self.price_range = listing_filter.price_range
+        self.rooms = listing_filter.rooms
+        self.district = listing_filter.district
+        self.chart_type = listing_filter.chart_type
+        self.page_size = listing_filter.page_size
+        self.q = listing_filter.q
+        self.line_points = LINE_CHART_POINTS
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(ListingFilter.from_args(args))
+
+    @property
+    def filter(self):
+        """Снимок текущих критериев в виде неизменяемого ListingFilter"""
+        return ListingFilter(self.price_range[0], self.price_range[1],
+                             self.rooms, self.district, self.chart_type,
+                             self.page_size, self.q)
 
     def apply_filter(self, price_range=None, rooms=None, district=None,
-                     chart_type=None):
+                     chart_type=None, page_size=None):
         if price_range:
             self.price_range = price_range
         if rooms:
@@ -87,6 +379,8 @@ class FilterPanel:
             self.district = district
         if chart_type:
             self.chart_type = chart_type
+        if page_size in PAGE_SIZES:
+            self.page_size = page_size
         return self.get_filtered_data()
 
     def reset_filter(self):
@@ -94,19 +388,96 @@ class FilterPanel:
         self.rooms = None
         self.district = None
         self.chart_type = "bar"
+        self.page_size = DEFAULT_PAGE_SIZE
+        self.q = None
         return self.get_filtered_data()
 
-    def get_filtered_data(self):
-        all_data = load_data_from_db()
-        all_data.sort(key=lambda x: x['price'], reverse=True)
-        filtered = []
-        for item in all_data:
-            if (self.price_range[0] <= item["price"] <= self.price_range[1] and
-                    (self.rooms is None or item["rooms"] == self.rooms) and
-                    (self.district is None or item[
-                        "district"] == self.district)):
-                filtered.append(item)
-        return filtered
+    def get_filtered_data(self, limit=None, offset=0, after=None):
+        return query_listings(self.price_range, self.rooms, self.district,
+                              limit=limit, offset=offset, after=after,
+                              q=self.q)
+
+    def _store_mask(self, after=None):
+        """Хранилище в памяти и маска строк под фильтр или (None, None)"""
+        store = get_listing_store()
+        if store is None:
+            return None, None
+        bits = store.mask(self.price_range, self.rooms, self.district, after)
+        if self.q:
+            bits &= search_mask(store, self.q)
+        return store, bits
+
+    def get_page(self, after=None):
+        """Страница выдачи по курсору; возвращает (строки, курсор следующей)"""
+        store, bits = self._store_mask(after)
+        if store is not None:
+            rows = listings_by_ids(store.top_ids(bits, self.page_size + 1))
+            ROWS_SCANNED.inc(store.count(bits), source="store")
+        else:
+            rows = self.get_filtered_data(limit=self.page_size + 1,
+                                          after=after)
+            ROWS_SCANNED.inc(len(rows), source="sql")
+        ROWS_RETURNED.inc(min(len(rows), self.page_size),
+                          source="store" if store is not None else "sql")
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            return rows, make_cursor(rows[-1])
+        return rows, None
+
+    def get_counts(self, column):
+        """Число объявлений под фильтр, включая поиск, по значениям column"""
+        store, bits = self._store_mask()
+        if store is not None:
+            return store.count_by(column, bits)
+        return count_groups(column, self.price_range, self.rooms,
+                            self.district, self.q)
+
+    def get_price_curve(self):
+        """Кривая цен: по сводке, а с поиском по адресу - по выборке"""
+        if self.q:
+            store, bits = self._store_mask()
+            if store is not None:
+                return {"prices": downsample_sorted(store.prices_of(bits),
+                                                    self.line_points)}
+        return price_curve(self.price_range, self.rooms, self.district,
+                           self.line_points)
+
+    def get_price_stats(self):
+        """Статистика цен по районам, а внутри выбранного района - по комнатам.
+
+        Скетчи ведутся по району и комнатам, поэтому фильтры цены и поиска
+        по адресу на статистику не влияют.
+        """
+        group = "rooms" if self.district else "district"
+        return {"group": group,
+                "rows": price_stats(group, self.rooms, self.district)}
+
+    def get_chart_data(self, page_rows=None):
+        """Данные для текущего типа диаграммы: сводка, страница или выборка"""
+        if self.chart_type == "bar":
+            return self.get_counts("district")
+        if self.chart_type == "pie":
+            return self.get_counts("rooms")
+        if self.chart_type == "line":
+            return self.get_price_curve()
+        if self.chart_type == "stats":
+            return self.get_price_stats()
+        if self.chart_type == "table" and page_rows is not None:
+            return page_rows
+        return self.get_filtered_data()
+
+    def districts(self):
+        """Районы для выпадающего списка формы"""
+        store = get_listing_store()
+        names = [name for name in store.district_names if name] if store else []
+        return sorted(names) or list(DEFAULT_DISTRICTS)
+
+    def count_filtered(self):
+        store, bits = self._store_mask()
+        if store is not None:
+            return store.count(bits)
+        return count_listings(self.price_range, self.rooms, self.district,
+                              self.q)
 
 
 class ChartView:
@@ -114,19 +485,28 @@ class ChartView:
         self.chart_type = "bar"
         self.data = []
 
-    def draw_chart(self, data, chart_type="bar"):
+    def draw_chart(self, data, chart_type="bar", version=None):
+        return "".join(self.iter_chart(data, chart_type, version))
+
+    def iter_chart(self, data, chart_type="bar", version=None):
+        """То же, что draw_chart, но HTML отдается кусками.
+
+        version - версия данных для кэша строк таблицы.
+        """
         self.data = data
         self.chart_type = chart_type
         if chart_type == "bar":
-            return render_bar_chart(data)
+            return iter_bar_chart(data)
         elif chart_type == "pie":
-            return render_pie_chart(data)
+            return iter_pie_chart(data)
         elif chart_type == "line":
-            return render_line_chart(data)
+            return iter_line_chart(data)
         elif chart_type == "table":
-            return render_table(data)
+            return iter_table(data, version)
+        elif chart_type == "stats":
+            return iter_stats_table(data)
         else:
-            return "<p>Неизвестный тип диаграммы</p>"
+            return iter(["<p>Неизвестный тип диаграммы</p>"])
 
     def update_chart(self, data):
         self.data = data
@@ -137,9 +517,21 @@ class MapView:
     def __init__(self):
         self.markers = []
 
-    def render(self, data):
+    def render(self, data, version=None):
         self.markers = data
-        return render_map(data)
+        return render_map(data, version)
+
+    def iter_render(self, data, version=None):
+        self.markers = data
+        return iter_map(data, version)
+
+    def iter_clusters(self, filter_panel, bbox=None, zoom=10):
+        """Кластеры вместо отдельных маркеров для заданной области карты"""
+        clusters = map_clusters(bbox, zoom, filter_panel.price_range,
+                                filter_panel.rooms, filter_panel.district,
+                                filter_panel.q)
+        self.markers = clusters
+        return iter_map_clusters(clusters)
 
     def update_markers(self, data):
         self.markers = data
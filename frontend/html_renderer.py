@@ -1,180 +1,198 @@
 # frontend/html_renderer.py
+import hashlib
 import math
+import os
 
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup
 
-def render_bar_chart(data):
-    districts = {}
-    for item in data:
-        district = item["district"]
-        districts[district] = districts.get(district, 0) + 1
-
-    chart_html = """
-    <div class="chart-container">
-        <h3>Распределение объявлений по районам</h3>
-        <div class="bar-chart">
-    """
-    for district, count in districts.items():
-        width = count * 50
-        chart_html += f"""
-            <div class="bar-item">
-                <div class="bar-label">{district}</div>
-                <div class="bar" style="width: {width}px;">
-                    <span class="bar-value">{count}</span>
-                </div>
-            </div>
-        """
-    chart_html += "</div></div>"
-    return chart_html
+from backend.aggregates import downsample_sorted
+from frontend.cache import chart_cache, fragment_cache
 
+# Каждая функция iter_* отдает HTML кусками, render_* склеивает их в строку.
+# Генераторы нужны для потоковой отдачи страницы без буферизации целиком.
+#
+# Разметка - макросы templates/fragments.html с автоэкранированием. Шаблон
+# компилируется один раз при импорте; строки таблицы и маркеры карты
+# запоминаются по (id объявления, версия данных), диаграммы - по хешу
+# данных, поэтому при неизменных данных повторно ничего не рисуется.
 
-def render_pie_chart(data):
-    rooms_count = {}
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "templates")
+
+PIE_COLORS = ("#ff6384", "#36a2eb", "#ffce56", "#4bc0c0", "#9966ff",
+              "#ff9f40", "#8ac6d1", "#ff6b6b")
+PIE_CENTER = (100, 100)
+PIE_RADIUS = 80
+
+
+def money(value):
+    return f"{value:,}" if value is not None else "—"
+
+
+_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True,
+                   trim_blocks=True, lstrip_blocks=True)
+_env.filters["money"] = money
+_fragments = _env.get_template("fragments.html").module
+
+# Неизменные части таблицы и карты
+_TABLE_HEAD = _fragments.table_head()
+_TABLE_FOOT = _fragments.table_foot()
+_MAP_HEAD = _fragments.map_head()
+_MAP_FOOT = _fragments.map_foot()
+_MAP_EMPTY = _fragments.map_empty()
+
+
+def count_values(data, key):
+    counts = {}
     for item in data:
-        rooms = item["rooms"]
-        rooms_count[rooms] = rooms_count.get(rooms, 0) + 1
+        value = item[key]
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def aggregate_key(kind, data):
+    """Ключ кэша диаграммы: тип и хеш данных, по которым она рисуется"""
+    digest = hashlib.sha1(repr(data).encode("utf-8")).hexdigest()
+    return kind, digest
 
-    if not rooms_count:
-        return "<div class='chart-container'><h3>Распределение по количеству комнат</h3><p>Нет данных для отображения</p></div>"
 
+def _cached_chart(kind, data, render):
+    key = aggregate_key(kind, data)
+    html = chart_cache.get(key)
+    if html is None:
+        html = chart_cache.put(key, render(data))
+    return html
+
+
+def _listing_fragment(kind, item, version, render):
+    """Фрагмент одного объявления из кэша или свежий; без версии - без кэша"""
+    if version is None:
+        return render(item)
+    key = (kind, item["id"])
+    html = fragment_cache.get(key, version)
+    if html is None:
+        html = fragment_cache.put(key, render(item), version)
+    return html
+
+
+def iter_bar_chart(data):
+    # data - список объявлений или готовая сводка {район: количество}
+    if isinstance(data, dict):
+        districts = data
+    else:
+        districts = count_values(data, "district")
+    yield _cached_chart("bar", districts, _fragments.bar_chart)
+
+
+def render_bar_chart(data):
+    return "".join(iter_bar_chart(data))
+
+
+def pie_slices(rooms_count):
+    """Секторы круговой диаграммы: путь SVG (или None для круга) и легенда"""
     total = sum(rooms_count.values())
-    colors = ["#ff6384", "#36a2eb", "#ffce56", "#4bc0c0", "#9966ff",
-              "#ff9f40", "#8ac6d1", "#ff6b6b"]
-
-    chart_html = """
-    <div class="chart-container">
-        <h3>Распределение по количеству комнат</h3>
-        <div class="pie-chart-container">
-            <div class="pie-svg-container">
-                <svg width="200" height="200" viewBox="0 0 200 200" class="pie-svg">
-    """
+    center_x, center_y = PIE_CENTER
+    slices = []
     current_angle = 0
-    center_x, center_y = 100, 100
-    radius = 80
-
     for i, (rooms, count) in enumerate(rooms_count.items()):
-        percentage = count / total
-        angle = percentage * 360
-        color = colors[i % len(colors)]
-
-        if angle == 360:
-            chart_html += f'<circle cx="{center_x}" cy="{center_y}" r="{radius}" fill="{color}" />'
-        else:
-            start_angle = current_angle
-            end_angle = current_angle + angle
-            start_rad = (start_angle - 90) * math.pi / 180
-            end_rad = (end_angle - 90) * math.pi / 180
-            start_x = center_x + radius * math.cos(start_rad)
-            start_y = center_y + radius * math.sin(start_rad)
-            end_x = center_x + radius * math.cos(end_rad)
-            end_y = center_y + radius * math.sin(end_rad)
+        angle = count / total * 360
+        path = None
+        if angle != 360:
+            start_rad = math.radians(current_angle - 90)
+            end_rad = math.radians(current_angle + angle - 90)
+            start_x = center_x + PIE_RADIUS * math.cos(start_rad)
+            start_y = center_y + PIE_RADIUS * math.sin(start_rad)
+            end_x = center_x + PIE_RADIUS * math.cos(end_rad)
+            end_y = center_y + PIE_RADIUS * math.sin(end_rad)
             large_arc_flag = 1 if angle > 180 else 0
-            chart_html += f'''
-            <path d="M {center_x} {center_y} L {start_x} {start_y} A {radius} {radius} 0 {large_arc_flag} 1 {end_x} {end_y} Z" 
-                  fill="{color}" stroke="white" stroke-width="2" />
-            '''
+            path = (f"M {center_x} {center_y} L {start_x} {start_y} "
+                    f"A {PIE_RADIUS} {PIE_RADIUS} 0 {large_arc_flag} 1 "
+                    f"{end_x} {end_y} Z")
+        slices.append({"rooms": rooms, "count": count, "path": path,
+                       "color": PIE_COLORS[i % len(PIE_COLORS)],
+                       "percentage": count / total * 100})
         current_angle += angle
+    return slices
 
-    chart_html += """
-                </svg>
-            </div>
-            <div class="pie-legend">
-    """
-    for i, (rooms, count) in enumerate(rooms_count.items()):
-        percentage = (count / total) * 100
-        color = colors[i % len(colors)]
-        chart_html += f"""
-            <div class="pie-legend-item">
-                <div class="pie-color" style="background-color: {color};"></div>
-                <span>{rooms} комн.: {count} ({percentage:.1f}%)</span>
-            </div>
-        """
-    chart_html += """
-            </div>
-        </div>
-    </div>
-    """
-    return chart_html
 
+def iter_pie_chart(data):
+    # data - список объявлений или готовая сводка {комнат: количество}
+    if isinstance(data, dict):
+        rooms_count = data
+    else:
+        rooms_count = count_values(data, "rooms")
+    yield _cached_chart(
+        "pie", rooms_count,
+        lambda counts: _fragments.pie_chart(pie_slices(counts) if counts
+                                            else []))
 
-def render_line_chart(data):
-    prices = sorted([item["price"] for item in data])
-    chart_html = """
-    <div class="chart-container">
-        <h3>Динамика цен</h3>
-        <div class="line-chart">
-    """
-    if prices:
-        max_price = max(prices)
-        if max_price > 0:
-            for i, price in enumerate(prices):
-                height = (price / max_price) * 100
-                chart_html += f"""
-                    <div class="line-point" style="height: {height}px; border" title="{price:,} руб.">
-                        <span class="point-value">{price}</span>
-                    </div>
-                """
-        else:
-            # Все цены — ноль или отрицательные
-            chart_html += "<p>Нет корректных данных о ценах</p>"
+
+def render_pie_chart(data):
+    return "".join(iter_pie_chart(data))
+
+
+def iter_line_chart(data):
+    # data - список объявлений или готовая кривая {"prices": [...]};
+    # число точек ограничено, сколько бы объявлений ни было в выборке
+    if isinstance(data, dict):
+        prices = data["prices"]
     else:
-        chart_html += "<p>Нет данных для отображения</p>"
-    chart_html += "</div></div>"
-    return chart_html
-
-
-def render_table(data):
-    chart_html = """
-    <div class="chart-container">
-        <h3>Таблица данных</h3>
-        <table class="data-table">
-            <thead>
-                <tr>
-                    <th>ID</th>
-                    <th>Цена</th>
-                    <th>Комнат</th>
-                    <th>Район</th>
-                    <th>Адрес</th>
-                </tr>
-            </thead>
-            <tbody>
-    """
+        prices = downsample_sorted(sorted([item["price"] for item in data]))
+    yield _cached_chart("line", prices, _fragments.line_chart)
+
+
+def render_line_chart(data):
+    return "".join(iter_line_chart(data))
+
+
+def iter_table(data, version=None):
+    # version - версия данных; с ней строки берутся из кэша фрагментов
+    yield _TABLE_HEAD
     for item in data:
-        chart_html += f"""
-            <tr>
-                <td>{item['id']}</td>
-                <td>{item['price']:,} руб.</td>
-                <td>{item['rooms']}</td>
-                <td>{item['district']}</td>
-                <td>{item['address']}</td>
-            </tr>
-        """
-    chart_html += """
-            </tbody>
-        </table>
-    </div>
-    """
-    return chart_html
-
-
-def render_map(data):
-    map_html = """
-    <div class="map-container">
-        <h3>Карта объявлений</h3>
-        <div class="simple-map">
-    """
+        yield _listing_fragment("row", item, version, _fragments.table_row)
+    yield _TABLE_FOOT
+
+
+def render_table(data, version=None):
+    return "".join(iter_table(data, version))
+
+
+def iter_stats_table(data):
+    # data - {"group": "district" | "rooms", "rows": [...]} из price_stats
+    yield _cached_chart("stats", data, _fragments.stats_table)
+
+
+def render_stats_table(data):
+    return "".join(iter_stats_table(data))
+
+
+def iter_map(data, version=None):
+    yield _MAP_HEAD
+    empty = True
     for marker in data:
-        map_html += f"""
-            <div class="map-marker">
-                <div class="marker-dot"></div>
-                <div class="marker-info">
-                    <strong>{marker['price']:,} руб.</strong><br>
-                    {marker['rooms']} комн.<br>
-                    {marker['district']}<br>
-                    <small>{marker['address']}</small>
-                </div>
-            </div>
-        """
-    if not data:
-        map_html += "<p>Нет данных для отображения</p>"
-    map_html += "</div></div>"
-    return map_html
+        empty = False
+        yield _listing_fragment("marker", marker, version,
+                                _fragments.map_marker)
+    if empty:
+        yield _MAP_EMPTY
+    yield _MAP_FOOT
+
+
+def render_map(data, version=None):
+    return "".join(iter_map(data, version))
+
+
+def iter_map_clusters(clusters):
+    def render(clusters):
+        if not clusters:
+            return _MAP_HEAD + _MAP_EMPTY + _MAP_FOOT
+        return (_MAP_HEAD +
+                Markup("").join(_fragments.map_cluster(cluster)
+                                for cluster in clusters) + _MAP_FOOT)
+
+    yield _cached_chart("clusters", clusters, render)
+
+
+def render_map_clusters(clusters):
+    return "".join(iter_map_clusters(clusters))
@@ -0,0 +1,59 @@
+# frontend/query_builder.py
+from backend.filter_sql import build_where
+
+LISTING_COLUMNS = ("id", "price", "rooms", "district", "lat", "lon", "address")
+EXPORT_COLUMNS = ("id", "address", "price", "area", "rooms", "floor",
+                  "floors_count", "district", "underground", "url", "lat",
+                  "lon", "created_at")
+
+
+def build_filter_query(price_range=None, rooms=None, district=None,
+                       limit=None, offset=0, after=None, q=None):
+    """Запрос объявлений по фильтру, от дорогих к дешевым.
+
+    after - курсор (price, id) последней строки предыдущей страницы:
+    выборка продолжается сразу после нее без OFFSET.
+    """
+    where, params = build_where(price_range, rooms, district, q)
+    if after is not None:
+        after_price, after_id = after
+        keyset = "(price < ? OR (price = ? AND id < ?))"
+        where = f"{where} AND {keyset}" if where else f" WHERE {keyset}"
+        params.extend([after_price, after_price, after_id])
+    sql = (f"SELECT {', '.join(LISTING_COLUMNS)} FROM listings{where} "
+           f"ORDER BY price DESC, id DESC")
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+    elif offset:
+        sql += " LIMIT -1 OFFSET ?"
+        params.append(offset)
+    return sql, params
+
+
+def build_export_query(price_range=None, rooms=None, district=None, q=None):
+    """Запрос всех объявлений по фильтру для выгрузки, в порядке выдачи"""
+    where, params = build_where(price_range, rooms, district, q)
+    return (f"SELECT {', '.join(EXPORT_COLUMNS)} FROM listings{where} "
+            f"ORDER BY price DESC, id DESC"), params
+
+
+def build_count_query(price_range=None, rooms=None, district=None, q=None):
+    """Запрос количества объявлений, подходящих под фильтр"""
+    where, params = build_where(price_range, rooms, district, q)
+    return f"SELECT COUNT(*) FROM listings{where}", params
+
+
+def parse_cursor(value):
+    """Курсор страницы из строки вида 'price:id'; None, если он некорректен"""
+    if not value:
+        return None
+    try:
+        price, listing_id = value.split(":")
+        return int(price), int(listing_id)
+    except ValueError:
+        return None
+
+
+def make_cursor(item):
+    return f"{item['price']}:{item['id']}"
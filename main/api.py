@@ -0,0 +1,210 @@
+# main/api.py
+from flask import Blueprint, current_app, request
+import gzip
+import hashlib
+import json
+
+from frontend.filters import (
+    FilterPanel,
+    ListingFilter,
+    query_listings,
+    count_listings,
+    count_groups,
+    map_clusters,
+    price_stats,
+    suggest_addresses,
+    current_data_version)
+from frontend.query_builder import LISTING_COLUMNS, parse_cursor, make_cursor
+from backend.analytics import STATS_GROUPS
+from backend.spatial import parse_bbox
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+MAX_LIMIT = 1000
+DEFAULT_LIMIT = 100
+MAX_SUGGESTIONS = 20
+# Маленькие ответы сжимать невыгодно
+MIN_COMPRESS_SIZE = 1024
+CACHE_MAX_AGE = 60
+
+GROUPS = ("district", "rooms", "price_bucket")
+
+
+def _columns(rows, columns):
+    """Список словарей -> параллельные массивы по колонкам"""
+    return {column: [row[column] for row in rows] for column in columns}
+
+
+def _etag():
+    version = current_data_version()
+    if version is None:
+        return None
+    raw = f"{version}|{request.path}|{request.query_string.decode()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _not_modified(etag):
+    """Совпавший с If-None-Match вариант ETag или None"""
+    if etag is None:
+        return None
+    # Сжатые представления получают ETag с суффиксом кодировки
+    for tag in (etag, f"{etag}-gzip", f"{etag}-br"):
+        if tag in request.if_none_match:
+            return tag
+    return None
+
+
+def _compress(body):
+    accepted = request.accept_encodings
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    if brotli is not None and accepted["br"]:
+        return brotli.compress(body), "br"
+    if accepted["gzip"]:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+def _json_response(payload, etag):
+    body = json.dumps(payload, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+    body, encoding = _compress(body)
+    response = current_app.response_class(body,
+                                          mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if etag:
+        response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+        response.headers["Cache-Control"] = f"public, max-age={CACHE_MAX_AGE}"
+    return response
+
+
+def _not_modified_response(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@api.route('/listings')
+def listings():
+    """Страница объявлений по фильтру; курсор next ведет на следующую"""
+    etag = _etag()
+    matched = _not_modified(etag)
+    if matched:
+        return _not_modified_response(matched)
+
+    listing_filter = ListingFilter.from_args(request.args)
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1),
+                MAX_LIMIT)
+    after = parse_cursor(request.args.get('after'))
+    rows = query_listings(listing_filter.price_range, listing_filter.rooms,
+                          listing_filter.district, limit=limit + 1,
+                          after=after, q=listing_filter.q)
+    next_cursor = make_cursor(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+    payload = {
+        "total": count_listings(listing_filter.price_range,
+                                listing_filter.rooms, listing_filter.district,
+                                listing_filter.q),
+        "next": next_cursor,
+        "columns": list(LISTING_COLUMNS),
+        "data": _columns(rows, LISTING_COLUMNS),
+    }
+    return _json_response(payload, etag)
+
+
+@api.route('/aggregates')
+def aggregates():
+    """Счетчики по районам, комнатам и ценовым интервалам плюс кривая цен"""
+    etag = _etag()
+    matched = _not_modified(etag)
+    if matched:
+        return _not_modified_response(matched)
+
+    listing_filter = ListingFilter.from_args(request.args)
+    groups = request.args.getlist('group') or ["district", "rooms"]
+    # Поиск по адресу сводка не покрывает - тогда считает FilterPanel
+    panel = FilterPanel(listing_filter) if listing_filter.q else None
+    payload = {}
+    for group in groups:
+        if group not in GROUPS:
+            continue
+        if panel:
+            counts = panel.get_counts(group)
+        else:
+            counts = count_groups(group, listing_filter.price_range,
+                                  listing_filter.rooms,
+                                  listing_filter.district)
+        keys = sorted(counts, key=lambda key: (key is None, key))
+        payload[group] = {"keys": keys,
+                          "counts": [counts[key] for key in keys]}
+    if request.args.get('curve'):
+        payload["price_curve"] = (FilterPanel(listing_filter)
+                                  .get_price_curve()["prices"])
+    return _json_response(payload, etag)
+
+
+@api.route('/stats')
+def stats():
+    """Медиана, p10/p90 и средние цена и цена за м² по районам или комнатам.
+
+    group=district|rooms; фильтры rooms и district сужают выборку, цена и
+    поиск по адресу не учитываются. Последняя строка (key = null) - итог.
+    """
+    etag = _etag()
+    matched = _not_modified(etag)
+    if matched:
+        return _not_modified_response(matched)
+
+    listing_filter = ListingFilter.from_args(request.args)
+    group = request.args.get('group', 'district')
+    if group not in STATS_GROUPS:
+        group = 'district'
+    rows = price_stats(group, listing_filter.rooms, listing_filter.district)
+    return _json_response({"group": group, "rows": rows}, etag)
+
+
+@api.route('/map')
+def map_markers():
+    """Кластеры маркеров для области bbox=south,west,north,east и zoom"""
+    etag = _etag()
+    matched = _not_modified(etag)
+    if matched:
+        return _not_modified_response(matched)
+
+    listing_filter = ListingFilter.from_args(request.args)
+    bbox = parse_bbox(request.args.get('bbox'))
+    zoom = request.args.get('zoom', 10, type=int)
+    clusters = map_clusters(bbox, zoom, listing_filter.price_range,
+                            listing_filter.rooms, listing_filter.district,
+                            listing_filter.q)
+    columns = ("lat", "lon", "count", "avg_price", "id")
+    payload = {"zoom": zoom, "columns": list(columns),
+               "data": _columns(clusters, columns)}
+    return _json_response(payload, etag)
+
+
+@api.route('/suggest')
+def suggest():
+    """Подсказки адресов по префиксу q с учетом остальных фильтров"""
+    etag = _etag()
+    matched = _not_modified(etag)
+    if matched:
+        return _not_modified_response(matched)
+
+    listing_filter = ListingFilter.from_args(request.args)
+    limit = min(max(request.args.get('limit', 10, type=int), 1),
+                MAX_SUGGESTIONS)
+    suggestions = suggest_addresses(listing_filter.q, limit,
+                                    listing_filter.price_range,
+                                    listing_filter.rooms,
+                                    listing_filter.district)
+    return _json_response({"q": listing_filter.q, "suggestions": suggestions},
+                          etag)
@@ -1,10 +1,24 @@
 # main/app.py
-from flask import Flask, render_template, request
+from flask import Flask, request, redirect, url_for, stream_template
+import hashlib
 import os
 
-from frontend.filters import FilterPanel, ChartView, MapView
-
-app = Flask(__name__)
+from frontend.cache import listings_cache
+from frontend.filters import (
+    FilterPanel,
+    ChartView,
+    MapView,
+    ListingFilter,
+    PAGE_SIZES,
+    CHART_TYPES,
+    DB_PATH,
+    current_data_version)
+from frontend.query_builder import parse_cursor
+from backend.db import prepare_database
+from backend.spatial import parse_bbox
+from api import api
+from export import export
+from instrumentation import init_app, phase, timed_iter
 
 template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                             '../frontend/templates')
@@ -13,42 +27,129 @@ static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../fronte
 app = Flask(__name__,
             template_folder=template_dir,
             static_folder=static_dir)
+app.register_blueprint(api)
+app.register_blueprint(export)
+init_app(app)
+
+# Сколько секунд браузеры и прокси могут не перепроверять страницу
+CACHE_MAX_AGE = 60
+
+
+def _remember(version, key, chunks):
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    listings_cache.put(DB_PATH, version, key, "".join(parts))
 
-filter_panel = FilterPanel()
-chart_view = ChartView()
-map_view = MapView()
+
+def cached_fragment(version, key, make_chunks):
+    """HTML-фрагмент из кэша версии данных или свежий, с запоминанием"""
+    if version is None:
+        return make_chunks()
+    cached = listings_cache.get(DB_PATH, version, key)
+    if cached is not None:
+        return [cached]
+    return _remember(version, key, make_chunks())
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
 
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        action = request.form.get('action')
-
-        if action == 'apply_filters':
-            price_min = request.form.get('price_min', type=int)
-            price_max = request.form.get('price_max', type=int)
-            rooms = request.form.get('rooms', type=int)
-            district = request.form.get('district')
-            chart_type = request.form.get('chart_type', 'bar')
-
-            filtered_data = filter_panel.apply_filter(
-                price_range=[price_min or 0, price_max or 1000000],
-                rooms=rooms if rooms else None,
-                district=district if district else None,
-                chart_type=chart_type
-            )
-        elif action == 'reset_filters':
-            filtered_data = filter_panel.reset_filter()
-        else:
-            filtered_data = filter_panel.get_filtered_data()
+        # Старые формы с POST переводим на адрес с GET-параметрами
+        if request.form.get('action') == 'reset_filters':
+            return redirect(url_for('index'), code=303)
+        listing_filter = ListingFilter.from_args(request.form)
+        return redirect(url_for('index', **listing_filter.to_args()),
+                        code=303)
+
+    listing_filter = ListingFilter.from_args(request.args)
+    after = parse_cursor(request.args.get('after'))
+    bbox = parse_bbox(request.args.get('bbox'))
+    zoom = request.args.get('zoom', type=int)
+
+    with phase("version"):
+        version = current_data_version()
+    etag = None
+    if version is not None:
+        etag = make_etag(version, listing_filter, after, bbox, zoom)
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}'
+            return response
+
+    filter_panel = FilterPanel(listing_filter)
+    chart_view = ChartView()
+    map_view = MapView()
+
+    # Таблица и карта показывают только текущую страницу (keyset по цене/id)
+    with phase("page"):
+        page_rows, next_cursor = filter_panel.get_page(after)
+    with phase("count"):
+        results_count = filter_panel.count_filtered()
+
+    # От страницы зависит только табличный вид диаграммы
+    chart_page = after if listing_filter.chart_type == 'table' else None
+    chart_chunks = timed_iter("chart", cached_fragment(
+        version, ("chart", listing_filter, chart_page),
+        lambda: chart_view.iter_chart(filter_panel.get_chart_data(page_rows),
+                                      listing_filter.chart_type, version)))
+
+    # С областью карты и масштабом карта показывает кластеры, а не страницу
+    if bbox or zoom is not None:
+        map_chunks = cached_fragment(
+            version, ("clusters", listing_filter, bbox, zoom),
+            lambda: map_view.iter_clusters(
+                filter_panel, bbox, zoom if zoom is not None else 10))
     else:
-        filtered_data = filter_panel.get_filtered_data()
+        map_chunks = cached_fragment(
+            version, ("map", listing_filter, after),
+            lambda: map_view.iter_render(page_rows, version))
+    map_chunks = timed_iter("map", map_chunks)
+
+    page_args = dict(listing_filter.to_args())
+    if bbox:
+        page_args['bbox'] = request.args.get('bbox')
+    if zoom is not None:
+        page_args['zoom'] = zoom
+
+    # Шаблон и фрагменты отдаются потоком по мере генерации; их время
+    # попадает в /metrics, а в Server-Timing - только фазы до отдачи
+    response = app.response_class(timed_iter("render", stream_template(
+        'index.html',
+        chart_chunks=chart_chunks,
+        map_chunks=map_chunks,
+        current_filters=filter_panel,
+        page_sizes=PAGE_SIZES,
+        page_args=page_args,
+        is_first_page=after is None,
+        next_cursor=next_cursor,
+        results_count=results_count)))
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}'
+    return response
+
 
-    chart_html = chart_view.draw_chart(filtered_data, filter_panel.chart_type)
-    map_html = map_view.render(filtered_data)
+def warm_up():
+    """Готовит схему базы, шаблоны и кэши до первого запроса.
 
-    return render_template('index.html',
-                           chart_html=chart_html,
-                           map_html=map_html,
-                           current_filters=filter_panel,
-                           results_count=len(filtered_data))
+    Возвращает версию данных или None, если базы еще нет.
+    """
+    if not os.path.exists(DB_PATH):
+        return None
+    # Миграции идут на соединении записи, дальше веб читает в режиме ro
+    prepare_database(DB_PATH)
+    version = current_data_version()
+    if version is None:
+        return None
+    with app.test_client() as client:
+        for chart_type in CHART_TYPES:
+            client.get('/', query_string={'chart_type': chart_type})
+        client.get('/api/aggregates')
+    return version
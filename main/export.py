@@ -0,0 +1,103 @@
+# main/export.py
+from flask import Blueprint, current_app, request
+import csv
+import io
+import json
+import os
+import zlib
+
+from backend.db import open_read_connection
+from backend.metrics import ROWS_RETURNED
+from frontend.filters import DB_PATH, ListingFilter
+from frontend.query_builder import EXPORT_COLUMNS, build_export_query
+
+export = Blueprint('export', __name__)
+
+# Строк за одно обращение к курсору и в одном отправляемом куске
+EXPORT_CHUNK = 1000
+# Заголовок gzip (wbits=31) - такой поток понимают и браузеры, и gunzip
+GZIP_WBITS = 31
+
+
+def iter_rows(listing_filter, db_path=DB_PATH):
+    """Строки выгрузки пачками прямо из курсора SQLite"""
+    sql, params = build_export_query(listing_filter.price_range,
+                                     listing_filter.rooms,
+                                     listing_filter.district,
+                                     listing_filter.q)
+    conn = open_read_connection(db_path, check_same_thread=False)
+    exported = 0
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK)
+            if not rows:
+                break
+            exported += len(rows)
+            yield rows
+    finally:
+        conn.close()
+        ROWS_RETURNED.inc(exported, source="export")
+
+
+def iter_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(tuple(row) for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(batches):
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False,
+                       separators=(",", ":")) + "\n"
+            for row in rows).encode("utf-8")
+
+
+def iter_gzip(chunks):
+    """Сжимает поток по кускам; каждый кусок сразу уходит клиенту"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _export_response(make_chunks, mimetype, filename):
+    listing_filter = ListingFilter.from_args(request.args)
+    if not os.path.exists(DB_PATH):
+        return current_app.response_class(status=404)
+    chunks = make_chunks(iter_rows(listing_filter))
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-store",
+    }
+    # gzip=0 отключает сжатие, например для отладки
+    if request.accept_encodings["gzip"] and request.args.get("gzip") != "0":
+        chunks = iter_gzip(chunks)
+        headers["Content-Encoding"] = "gzip"
+    # Без Content-Length сервер отдает ответ кусками (chunked)
+    return current_app.response_class(chunks, mimetype=mimetype,
+                                      headers=headers)
+
+
+@export.route('/export.csv')
+def export_csv():
+    """Все объявления по фильтру в CSV, потоком"""
+    return _export_response(iter_csv, "text/csv", "listings.csv")
+
+
+@export.route('/export.ndjson')
+def export_ndjson():
+    """Все объявления по фильтру построчно в JSON, потоком"""
+    return _export_response(iter_ndjson, "application/x-ndjson",
+                            "listings.ndjson")
@@ -0,0 +1,201 @@
+# main/instrumentation.py
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+from flask import g, request
+from werkzeug.middleware.profiler import ProfilerMiddleware
+
+from backend.metrics import REGISTRY, Counter, Gauge, Histogram
+from backend.scheduler import job_totals
+from frontend.cache import chart_cache, fragment_cache, listings_cache
+from frontend.filters import DB_PATH
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds",
+                            "Время ответа до отдачи последнего байта")
+PHASE_SECONDS = Histogram("http_request_phase_seconds",
+                          "Время отдельных фаз обработки запроса")
+REQUESTS = Counter("http_requests_total", "Запросы по обработчику и коду")
+
+
+def _hit_ratio():
+    total = listings_cache.hits + listings_cache.misses
+    return listings_cache.hits / total if total else 0.0
+
+
+Gauge("listings_cache_hits", "Попадания в кэш выборок",
+      func=lambda: listings_cache.hits)
+Gauge("listings_cache_misses", "Промахи кэша выборок",
+      func=lambda: listings_cache.misses)
+Gauge("listings_cache_hit_ratio", "Доля попаданий в кэш выборок",
+      func=_hit_ratio)
+Gauge("fragment_cache_hits", "Строки таблицы и маркеры из кэша фрагментов",
+      func=lambda: fragment_cache.hits)
+Gauge("fragment_cache_misses", "Строки таблицы и маркеры, отрисованные заново",
+      func=lambda: fragment_cache.misses)
+Gauge("chart_cache_hits", "Диаграммы из кэша по хешу данных",
+      func=lambda: chart_cache.hits)
+Gauge("chart_cache_misses", "Диаграммы, отрисованные заново",
+      func=lambda: chart_cache.misses)
+
+
+# Фоновая загрузка - отдельный процесс, и ее счетчики в памяти веб-части
+# всегда нулевые. Метрики загрузки читаются из журнала ingest_jobs при
+# опросе /metrics; итоги запоминаются на секунду, чтобы все метрики одного
+# опроса обошлись одним чтением журнала.
+INGEST_TOTALS_TTL = 1.0
+_ingest_totals = {"at": None, "value": None}
+_ingest_lock = threading.Lock()
+
+
+def _read_ingest_totals():
+    with _ingest_lock:
+        now = time.monotonic()
+        if (_ingest_totals["at"] is None
+                or now - _ingest_totals["at"] >= INGEST_TOTALS_TTL):
+            value = None
+            if os.path.exists(DB_PATH):
+                try:
+                    value = job_totals(DB_PATH)
+                except sqlite3.OperationalError:
+                    # Журнала еще нет: база не мигрирована
+                    pass
+            _ingest_totals.update(at=now, value=value)
+        return _ingest_totals["value"]
+
+
+def _ingest_value(name, default=0):
+    totals = _read_ingest_totals()
+    if totals is None or totals[name] is None:
+        return default
+    return totals[name]
+
+
+Gauge("ingest_jobs", "Запуски фоновой загрузки по статусу, из ingest_totals",
+      func=lambda: {(status,): count for status, count
+                    in _ingest_value("jobs", {}).items()},
+      labels=("status",))
+Gauge("ingest_job_rows", "Строки фоновой загрузки по результату записи",
+      func=lambda: {(result,): count for result, count
+                    in _ingest_value("rows", {}).items()},
+      labels=("result",))
+Gauge("ingest_job_write_seconds", "Суммарное время записи фоновой загрузки",
+      func=lambda: _ingest_value("write_seconds"))
+Gauge("ingest_last_job_rows_per_second",
+      "Скорость записи последней успешной фоновой загрузки, строк/с",
+      func=lambda: _ingest_value("last_rows_per_second"))
+Gauge("ingest_last_job_finished_seconds",
+      "Время окончания последней успешной фоновой загрузки, unix-время",
+      func=lambda: _ingest_value("last_finished"))
+
+
+@contextmanager
+def phase(name):
+    """Замер фазы запроса: попадает в Server-Timing и в гистограмму фаз"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        PHASE_SECONDS.observe(elapsed, phase=name)
+        phases = g.get("phases")
+        if phases is not None:
+            phases.append((name, elapsed))
+
+
+def timed_iter(name, chunks):
+    """Замер фазы, которая выполняется во время потоковой отдачи.
+
+    Заголовки к этому моменту уже отправлены, поэтому время идет только в
+    гистограмму фаз, а не в Server-Timing.
+    """
+    elapsed = 0.0
+    iterator = iter(chunks)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield chunk
+    finally:
+        PHASE_SECONDS.observe(elapsed, phase=name)
+
+
+class SamplingProfiler:
+    """Профилирует отдельные запросы через cProfile.
+
+    Запрос профилируется, если в адресе есть параметр _profile или с
+    вероятностью sample_rate. Файлы .prof пишутся в profile_dir.
+    """
+
+    def __init__(self, wsgi_app, profile_dir, sample_rate=0.0):
+        os.makedirs(profile_dir, exist_ok=True)
+        self.app = wsgi_app
+        self.profiled = ProfilerMiddleware(wsgi_app, stream=None,
+                                           profile_dir=profile_dir)
+        self.sample_rate = sample_rate
+
+    def __call__(self, environ, start_response):
+        query = parse_qs(environ.get("QUERY_STRING", ""),
+                         keep_blank_values=True)
+        if "_profile" in query or random.random() < self.sample_rate:
+            return self.profiled(environ, start_response)
+        return self.app(environ, start_response)
+
+
+def metrics_view():
+    return REGISTRY.render(), 200, {
+        "Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+def init_app(app):
+    """Подключает замеры фаз, Server-Timing, /metrics и профилировщик.
+
+    Профилировщик включается переменной окружения PROFILE_DIR; доля
+    случайно профилируемых запросов - PROFILE_SAMPLE_RATE (0..1).
+    """
+
+    @app.before_request
+    def start_timer():
+        g.started = time.perf_counter()
+        g.phases = []
+        g.endpoint_name = request.endpoint or "unknown"
+
+    @app.after_request
+    def add_server_timing(response):
+        started = g.get("started")
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        entries = [f"{name};dur={seconds * 1000:.2f}"
+                   for name, seconds in g.phases]
+        entries.append(f"app;dur={elapsed * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+
+        endpoint = g.endpoint_name
+        status = response.status_code
+
+        def finish():
+            # Для потоковых ответов вызывается после отдачи последнего куска
+            REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                    endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=status)
+
+        response.call_on_close(finish)
+        return response
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+    profile_dir = os.environ.get("PROFILE_DIR")
+    if profile_dir:
+        app.wsgi_app = SamplingProfiler(
+            app.wsgi_app, profile_dir,
+            float(os.environ.get("PROFILE_SAMPLE_RATE", "0")))
@@ -1,9 +1,72 @@
 # main/main.py
-from app import *
+import argparse
+import os
+import subprocess
+import sys
+import time
 
+from app import app, warm_up
 
-def main():
-    app.run(debug=True, host='0.0.0.0', port=5000)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Запуск веб-приложения аналитики недвижимости")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8,
+                        help="рабочих потоков waitress")
+    parser.add_argument("--connection-limit", type=int, default=200,
+                        help="максимум одновременных соединений")
+    parser.add_argument("--channel-timeout", type=int, default=30,
+                        help="секунд простоя до закрытия соединения")
+    parser.add_argument("--backlog", type=int, default=1024,
+                        help="очередь входящих соединений сокета")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="не прогревать базу и кэш перед стартом")
+    parser.add_argument("--ingest-config",
+                        help="JSON источников: фоновая загрузка в отдельном "
+                             "процессе")
+    parser.add_argument("--dev", action="store_true",
+                        help="отладочный сервер Flask вместо waitress")
+    return parser.parse_args(argv)
+
+
+def start_ingest(config):
+    """Запускает планировщик загрузки отдельным процессом рядом с сервером"""
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen([sys.executable, "-m", "backend.scheduler",
+                             os.path.abspath(config)], cwd=project_dir)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    ingest = start_ingest(args.ingest_config) if args.ingest_config else None
+
+    if not args.no_warmup:
+        started = time.perf_counter()
+        version = warm_up()
+        elapsed = (time.perf_counter() - started) * 1000
+        if version is None:
+            print("База данных не найдена, прогрев пропущен")
+        else:
+            print(f"Прогрев завершен за {elapsed:.0f} мс "
+                  f"(версия данных {version})")
+
+    try:
+        if args.dev:
+            app.run(debug=True, host=args.host, port=args.port)
+            return
+
+        from waitress import serve
+        print(f"Сервер waitress на {args.host}:{args.port}, "
+              f"потоков: {args.threads}")
+        serve(app, host=args.host, port=args.port, threads=args.threads,
+              connection_limit=args.connection_limit,
+              channel_timeout=args.channel_timeout, backlog=args.backlog)
+    finally:
+        if ingest:
+            ingest.terminate()
+            ingest.wait()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,122 @@
+# tests/test_aggregates.py
+"""Сводка listing_stats: приращения при записи против полного пересчета.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.aggregates import count_by, rebuild_stats  # noqa: E402
+from backend.DataFetcher import DataFetcher  # noqa: E402
+from backend.listing_store import ListingStore  # noqa: E402
+
+DISTRICTS = ("Центральный", "Северный", "Южный")
+STATS_SQL = ("SELECT district, rooms, price_bucket, count, price_sum "
+             "FROM listing_stats ORDER BY district, rooms, price_bucket")
+
+
+def random_listings(rng, numbers):
+    return [{"url": f"https://example.test/{number}",
+             "address": f"ул. Сводная, {number}",
+             "price": f"{rng.randrange(10, 200) * 37000} руб.",
+             "rooms": rng.randrange(1, 5),
+             "district": rng.choice(DISTRICTS)}
+            for number in numbers]
+
+
+class ListingStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="aggregates-test-")
+        self.db_path = os.path.join(self.directory, "data.db")
+        rng = random.Random(7)
+        # Три загрузки: новые объявления, смена цены, района и комнат у
+        # части старых, повтор без изменений
+        batches = [random_listings(rng, range(0, 120)),
+                   random_listings(rng, range(60, 180)),
+                   random_listings(rng, range(150, 180))]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for batch in batches:
+                DataFetcher("", db_path=self.db_path).save_to_db(batch)
+                DataFetcher("", db_path=self.db_path).save_to_db(batch)
+        self.conn = sqlite3.connect(self.db_path)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_incremental_stats_match_rebuild(self):
+        incremental = self.conn.execute(STATS_SQL).fetchall()
+        self.assertTrue(incremental)
+        with self.conn:
+            rebuild_stats(self.conn)
+        self.assertEqual(self.conn.execute(STATS_SQL).fetchall(), incremental)
+
+    def test_count_by_matches_group_by(self):
+        ranges = (None, (0, 10 ** 9), (1000000, 3000000), (1234567, 1300000),
+                  (450000, 5550001), (None, 2000000), (3000000, None))
+        for price_range in ranges:
+            for column in ("district", "rooms"):
+                for rooms, district in ((None, None), (2, None),
+                                        (None, "Южный")):
+                    clauses = ["1"]
+                    params = []
+                    low, high = price_range or (None, None)
+                    if low is not None:
+                        clauses.append("price >= ?")
+                        params.append(low)
+                    if high is not None:
+                        clauses.append("price <= ?")
+                        params.append(high)
+                    if rooms is not None:
+                        clauses.append("rooms = ?")
+                        params.append(rooms)
+                    if district is not None:
+                        clauses.append("district = ?")
+                        params.append(district)
+                    expected = dict(self.conn.execute(
+                        f"SELECT {column}, COUNT(*) FROM listings "
+                        f"WHERE {' AND '.join(clauses)} GROUP BY {column}",
+                        params))
+                    with self.subTest(price_range=price_range, column=column,
+                                      rooms=rooms, district=district):
+                        self.assertEqual(count_by(self.conn, column,
+                                                  price_range, rooms,
+                                                  district), expected)
+
+    def test_search_counts_only_matching_addresses(self):
+        price_range = (500000, 5000000)
+        expected = {}
+        for address, price in self.conn.execute(
+                "SELECT address, price FROM listings"):
+            terms = re.findall(r"\w+", address.lower())
+            if (price_range[0] <= price <= price_range[1] and
+                    any(term.startswith("1") for term in terms)):
+                bucket = price // 100000
+                expected[bucket] = expected.get(bucket, 0) + 1
+        self.assertTrue(expected)
+        self.assertEqual(count_by(self.conn, "price_bucket", price_range,
+                                  q="сводная 1"), expected)
+
+    def test_store_counts_price_buckets_like_summary(self):
+        store = ListingStore.from_connection(self.conn)
+        price_range = (450000, 5550001)
+        self.assertEqual(
+            store.count_by("price_bucket", store.mask(price_range)),
+            count_by(self.conn, "price_bucket", price_range))
+
+
+if __name__ == "__main__":
+    unittest.main()
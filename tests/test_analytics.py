@@ -0,0 +1,114 @@
+# tests/test_analytics.py
+"""Скетчи price_sketch: приращения против пересчета и точность квантилей.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.analytics import (  # noqa: E402
+    RELATIVE_ACCURACY,
+    QuantileSketch,
+    price_stats,
+    rebuild_sketches)
+from backend.DataFetcher import DataFetcher  # noqa: E402
+
+DISTRICTS = ("Центральный", "Северный", "Южный")
+SKETCH_SQL = ("SELECT district, rooms, metric, bucket, count, total "
+              "FROM price_sketch ORDER BY district, rooms, metric, bucket")
+
+
+def random_listings(rng, numbers):
+    return [{"url": f"https://example.test/{number}",
+             "address": f"ул. Квантильная, {number}",
+             "price": f"{rng.randrange(20, 400) * 25000} руб.",
+             "area": rng.choice((None, rng.randrange(25, 120))),
+             "rooms": rng.randrange(1, 5),
+             "district": rng.choice(DISTRICTS)}
+            for number in numbers]
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(3)
+        values = [rng.lognormvariate(15, 0.6) for _ in range(5000)]
+        sketch = QuantileSketch()
+        for value in values:
+            sketch.add(value)
+        for q in (0.1, 0.5, 0.9):
+            exact = exact_quantile(values, q)
+            self.assertLessEqual(abs(sketch.quantile(q) - exact) / exact,
+                                 RELATIVE_ACCURACY)
+
+    def test_removed_value_leaves_no_trace(self):
+        sketch = QuantileSketch()
+        sketch.add(1000000)
+        sketch.add(2000000)
+        sketch.add(2000000, weight=-1)
+        self.assertEqual(sketch.count, 1)
+        self.assertAlmostEqual(sketch.quantile(0.5) / 1000000, 1,
+                               delta=RELATIVE_ACCURACY)
+
+
+class PriceSketchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="analytics-test-")
+        self.db_path = os.path.join(self.directory, "data.db")
+        rng = random.Random(11)
+        batches = [random_listings(rng, range(0, 150)),
+                   random_listings(rng, range(100, 220))]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for batch in batches:
+                DataFetcher("", db_path=self.db_path).save_to_db(batch)
+        self.conn = sqlite3.connect(self.db_path)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def sketch_rows(self):
+        return [row[:5] + (round(row[5], 2),)
+                for row in self.conn.execute(SKETCH_SQL)]
+
+    def test_incremental_sketches_match_rebuild(self):
+        incremental = self.sketch_rows()
+        self.assertTrue(incremental)
+        with self.conn:
+            rebuild_sketches(self.conn)
+        self.assertEqual(self.sketch_rows(), incremental)
+
+    def test_median_by_district_is_close_to_exact(self):
+        rows = {row["key"]: row for row in price_stats(self.conn)}
+        total = rows.pop(None)
+        self.assertEqual(total["price"]["count"], 220)
+        for district in DISTRICTS:
+            prices = [price for (price,) in self.conn.execute(
+                "SELECT price FROM listings WHERE district = ?",
+                (district,))]
+            exact = exact_quantile(prices, 0.5)
+            median = rows[district]["price"]["median"]
+            self.assertEqual(rows[district]["price"]["count"], len(prices))
+            self.assertLessEqual(abs(median - exact) / exact,
+                                 RELATIVE_ACCURACY + 1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# tests/test_cache.py
+"""Кэш выборок: вытеснение LRU и сброс при смене версии данных.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.DataFetcher import DataFetcher  # noqa: E402
+from frontend.cache import ListingsCache, listings_cache  # noqa: E402
+from frontend.filters import count_listings, query_listings  # noqa: E402
+
+
+def make_listings(start, count):
+    return [{"price": f"{(start + i) * 100000} руб.",
+             "address": f"ул. Кэшевая, {start + i}"}
+            for i in range(count)]
+
+
+class ListingsCacheTest(unittest.TestCase):
+
+    def test_new_version_drops_old_entries(self):
+        cache = ListingsCache()
+        cache.put("a.db", 1, "key", [1, 2, 3])
+        self.assertEqual(cache.get("a.db", 1, "key"), [1, 2, 3])
+
+        self.assertIsNone(cache.get("a.db", 2, "key"))
+        self.assertIsNone(cache.get("a.db", 1, "key"))
+
+    def test_versions_of_different_databases_are_independent(self):
+        cache = ListingsCache()
+        cache.put("a.db", 1, "key", ["a"])
+        cache.put("b.db", 5, "key", ["b"])
+        self.assertIsNone(cache.get("b.db", 6, "key"))
+        self.assertEqual(cache.get("a.db", 1, "key"), ["a"])
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ListingsCache(max_entries=2)
+        cache.put("a.db", 1, "first", [1])
+        cache.put("a.db", 1, "second", [2])
+        cache.get("a.db", 1, "first")
+        cache.put("a.db", 1, "third", [3])
+
+        self.assertEqual(cache.get("a.db", 1, "first"), [1])
+        self.assertIsNone(cache.get("a.db", 1, "second"))
+        self.assertEqual(cache.get("a.db", 1, "third"), [3])
+
+    def test_row_limit_bounds_memory(self):
+        cache = ListingsCache(max_rows=5)
+        cache.put("a.db", 1, "big", list(range(4)))
+        cache.put("a.db", 1, "small", list(range(3)))
+        self.assertIsNone(cache.get("a.db", 1, "big"))
+        # Выборка больше лимита не кэшируется вовсе
+        self.assertEqual(cache.put("a.db", 1, "huge", list(range(6))),
+                         list(range(6)))
+        self.assertIsNone(cache.get("a.db", 1, "huge"))
+
+
+class DataVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="cache-test-")
+        self.db_path = os.path.join(self.directory, "data.db")
+        listings_cache.clear()
+
+    def tearDown(self):
+        listings_cache.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def save(self, listings):
+        with contextlib.redirect_stdout(io.StringIO()):
+            DataFetcher("", db_path=self.db_path).save_to_db(listings)
+
+    def test_ingest_is_visible_on_next_request(self):
+        self.save(make_listings(10, 3))
+        price_range = [0, 10 ** 9]
+        self.assertEqual(len(query_listings(price_range,
+                                            db_path=self.db_path)), 3)
+        self.assertEqual(count_listings(price_range, db_path=self.db_path), 3)
+
+        hits = listings_cache.hits
+        query_listings(price_range, db_path=self.db_path)
+        self.assertEqual(listings_cache.hits, hits + 1)
+
+        self.save(make_listings(20, 2))
+        self.assertEqual(len(query_listings(price_range,
+                                            db_path=self.db_path)), 5)
+        self.assertEqual(count_listings(price_range, db_path=self.db_path), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
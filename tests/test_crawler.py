@@ -0,0 +1,197 @@
+# tests/test_crawler.py
+"""Crawler против локального ThreadingHTTPServer со страницами с ETag.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.crawler import Crawler  # noqa: E402
+from backend.fetch_meta import FetchMetaStore  # noqa: E402
+
+LISTINGS_PER_PAGE = 3
+# Задержка ответа: без параллельной загрузки запросы не пересекутся
+RESPONSE_DELAY = 0.2
+
+
+def render_page(page):
+    items = "".join(
+        f'<div class="listing-item"><span class="price">'
+        f'{(page * 10 + i) * 100000} руб.</span><span class="address">'
+        f'ул. Тестовая, {page}, кв. {i}</span></div>'
+        for i in range(LISTINGS_PER_PAGE))
+    return f"<html><body>{items}</body></html>".encode("utf-8")
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    """/page/N - страница с ETag; /plain/N - без ETag; /flaky/N - первые
+    ответы 503"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(RESPONSE_DELAY)
+            kind, _, page = self.path.strip("/").partition("/")
+            if kind == "flaky":
+                with server.lock:
+                    failures = server.failures.get(self.path, 0)
+                    server.failures[self.path] = failures + 1
+                if failures < server.fail_times:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+            etag = f'"{kind}-{page}-v1"' if kind != "plain" else None
+            if etag and self.headers.get("If-None-Match") == etag:
+                with server.lock:
+                    server.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            body = render_page(int(page))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CrawlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ListingHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.not_modified = 0
+        self.server.failures = {}
+        self.server.fail_times = 2
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.directory = tempfile.mkdtemp(prefix="crawler-test-")
+        self.db_path = os.path.join(self.directory, "data.db")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def crawl(self, paths, **kwargs):
+        options = {"max_workers": 4, "per_host": 4, "rate": 0,
+                   "backoff": 0, "timeout": 5}
+        options.update(kwargs)
+        urls = [self.base_url + path for path in paths]
+        with contextlib.redirect_stdout(io.StringIO()):
+            return Crawler(urls, db_path=self.db_path, **options).run()
+
+    def test_fetches_pages_concurrently(self):
+        pages = [f"/page/{page}" for page in range(1, 9)]
+        started = time.monotonic()
+        totals = self.crawl(pages)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(totals["pages"], len(pages))
+        self.assertEqual(totals["failed"], 0)
+        self.assertEqual(totals["inserted"], len(pages) * LISTINGS_PER_PAGE)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+        self.assertLess(elapsed, len(pages) * RESPONSE_DELAY)
+
+    def test_per_host_limit_caps_concurrency(self):
+        pages = [f"/page/{page}" for page in range(1, 7)]
+        totals = self.crawl(pages, per_host=2)
+
+        self.assertEqual(totals["pages"], len(pages))
+        self.assertLessEqual(self.server.max_in_flight, 2)
+
+    def test_retries_server_errors(self):
+        totals = self.crawl(["/flaky/1", "/flaky/2"], retries=3)
+
+        self.assertEqual(totals["pages"], 2)
+        self.assertEqual(totals["failed"], 0)
+        self.assertEqual(totals["inserted"], 2 * LISTINGS_PER_PAGE)
+        # Два ответа 503 и один успешный на каждую страницу
+        self.assertEqual(self.server.failures,
+                         {"/flaky/1": 3, "/flaky/2": 3})
+
+    def test_gives_up_after_retries(self):
+        self.server.fail_times = 10
+        totals = self.crawl(["/flaky/1"], retries=2)
+
+        self.assertEqual(totals["pages"], 0)
+        self.assertEqual(totals["failed"], 1)
+        self.assertEqual(self.server.failures, {"/flaky/1": 3})
+
+    def test_unchanged_pages_are_skipped_by_etag(self):
+        pages = [f"/page/{page}" for page in range(1, 5)]
+        first = self.crawl(pages)
+        second = self.crawl(pages)
+
+        self.assertEqual(first["inserted"], len(pages) * LISTINGS_PER_PAGE)
+        self.assertEqual(second["skipped"], len(pages))
+        self.assertEqual(second["pages"], 0)
+        self.assertEqual(second["inserted"] + second["updated"], 0)
+        self.assertEqual(self.server.not_modified, len(pages))
+
+    def test_unchanged_pages_are_skipped_by_content_hash(self):
+        pages = [f"/plain/{page}" for page in range(1, 4)]
+        self.crawl(pages)
+        second = self.crawl(pages)
+
+        self.assertEqual(second["skipped"], len(pages))
+        self.assertEqual(second["unchanged"], 0)
+        self.assertEqual(self.server.not_modified, 0)
+
+    def test_fetch_meta_is_written_by_calling_thread(self):
+        pages = ["/page/1", "/plain/1", "/plain/2"]
+        self.crawl(pages)
+        writers = []
+        save = FetchMetaStore.save
+
+        def recording_save(store, source, meta):
+            writers.append(threading.current_thread())
+            return save(store, source, meta)
+
+        FetchMetaStore.save = recording_save
+        try:
+            second = self.crawl(pages)
+        finally:
+            FetchMetaStore.save = save
+
+        self.assertEqual(second["skipped"], len(pages))
+        # Хеш совпал у двух страниц без ETag - их метаданные обновлены
+        self.assertEqual(len(writers), 2)
+        self.assertEqual(set(writers), {threading.current_thread()})
+
+
+if __name__ == "__main__":
+    unittest.main()
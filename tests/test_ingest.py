@@ -0,0 +1,97 @@
+# tests/test_ingest.py
+"""Пакетная запись save_to_db: счетчики, UPSERT и отсутствие дубликатов.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.DataFetcher import DataFetcher  # noqa: E402
+from backend.queries import SELECT_DATA_VERSION  # noqa: E402
+
+
+def listing(number, price, **extra):
+    item = {"price": f"{price} руб.", "address": f"ул. Загрузочная, {number}",
+            "rooms": 2}
+    item.update(extra)
+    return item
+
+
+class SaveToDbTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ingest-test-")
+        self.db_path = os.path.join(self.directory, "data.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def save(self, listings):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return DataFetcher("", db_path=self.db_path).save_to_db(listings)
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def data_version(self):
+        return self.query(SELECT_DATA_VERSION)[0][0]
+
+    def test_counts_inserted_updated_unchanged(self):
+        first = [listing(1, 5000000, url="https://example.test/1"),
+                 listing(2, 6000000, url="https://example.test/2"),
+                 listing(3, 7000000)]
+        self.assertEqual(self.save(first),
+                         {"inserted": 3, "updated": 0, "unchanged": 0})
+
+        second = [listing(1, 5500000, url="https://example.test/1"),
+                  listing(2, 6000000, url="https://example.test/2"),
+                  listing(3, 7000000),
+                  listing(4, 8000000)]
+        self.assertEqual(self.save(second),
+                         {"inserted": 1, "updated": 1, "unchanged": 2})
+        self.assertEqual(
+            self.query("SELECT price FROM listings "
+                       "WHERE url = 'https://example.test/1'"),
+            [(5500000,)])
+
+    def test_rerun_does_not_duplicate_rows(self):
+        page = [listing(number, 1000000 * number) for number in range(1, 6)]
+        self.save(page)
+        version = self.data_version()
+
+        self.assertEqual(self.save(page),
+                         {"inserted": 0, "updated": 0, "unchanged": 5})
+        self.assertEqual(self.query("SELECT COUNT(*) FROM listings"), [(5,)])
+        # Без изменений версия данных не меняется и кэши не сбрасываются
+        self.assertEqual(self.data_version(), version)
+
+    def test_last_duplicate_in_batch_wins(self):
+        url = "https://example.test/7"
+        stats = self.save([listing(7, 3000000, url=url),
+                           listing(7, 3100000, url=url)])
+
+        self.assertEqual(stats, {"inserted": 1, "updated": 0, "unchanged": 0})
+        self.assertEqual(self.query("SELECT price FROM listings"),
+                         [(3100000,)])
+
+    def test_empty_batch_writes_nothing(self):
+        self.assertEqual(self.save([]),
+                         {"inserted": 0, "updated": 0, "unchanged": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
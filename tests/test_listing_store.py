@@ -0,0 +1,72 @@
+# tests/test_listing_store.py
+"""Хранилище в памяти: отдается только версии, совпадающей с базой.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.DataFetcher import DataFetcher  # noqa: E402
+from frontend.filters import (  # noqa: E402
+    current_data_version,
+    get_listing_store)
+
+
+def make_listings(start, count):
+    return [{"price": f"{(start + i) * 100000} руб.",
+             "address": f"ул. Колоночная, {start + i}"}
+            for i in range(count)]
+
+
+def wait_for_refresh():
+    for thread in threading.enumerate():
+        if thread.name == "listing-store":
+            thread.join(10)
+
+
+class ListingStoreVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="store-test-")
+        self.db_path = os.path.join(self.directory, "data.db")
+        self.save(make_listings(1, 5))
+
+    def tearDown(self):
+        wait_for_refresh()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def save(self, listings):
+        with contextlib.redirect_stdout(io.StringIO()):
+            DataFetcher("", db_path=self.db_path).save_to_db(listings)
+
+    def test_first_store_is_built_for_current_version(self):
+        store = get_listing_store(self.db_path)
+
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store.version, current_data_version(self.db_path))
+
+    def test_stale_store_is_not_served_after_ingest(self):
+        old = get_listing_store(self.db_path)
+        self.save(make_listings(6, 3))
+
+        # Пока новое хранилище собирается, запросы идут в SQLite
+        self.assertIsNone(get_listing_store(self.db_path))
+        wait_for_refresh()
+        store = get_listing_store(self.db_path)
+        self.assertIsNot(store, old)
+        self.assertEqual(len(store), 8)
+        self.assertEqual(store.version, current_data_version(self.db_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+# tests/test_migrations.py
+"""Цепочка миграций PRAGMA user_version от исходной схемы с ценами-строками.
+
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.aggregates import rebuild_stats  # noqa: E402
+from backend.analytics import rebuild_sketches  # noqa: E402
+from backend.Listing import content_hash, listing_key  # noqa: E402
+from backend.migrations import SCHEMA_VERSION, get_version, migrate  # noqa: E402
+from backend.queries import LISTING_FIELDS  # noqa: E402
+
+# Таблица в том виде, в каком ее создавал DataFetcher.save_to_db до миграций
+BASELINE_SCHEMA = """
+CREATE TABLE listings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT,
+    price TEXT,
+    rooms INTEGER DEFAULT 0,
+    district TEXT DEFAULT 'Неизвестный',
+    lat REAL DEFAULT 0.0,
+    lon REAL DEFAULT 0.0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+BASELINE_ROWS = [
+    (7, "ул. Ленина, 1", "5 500 000 ₽", 2, "Центральный", 55.75, 37.61),
+    (9, "пр. Мира, 12", "12 000 000 руб.", 3, "Северный", 55.80, 37.63),
+    (12, "ул. Садовая, 3", "", 1, "Южный", 0.0, 0.0),
+]
+
+
+class MigrationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="migrations-test-")
+        self.conn = sqlite3.connect(os.path.join(self.directory, "data.db"))
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def load_baseline(self):
+        self.conn.execute(BASELINE_SCHEMA)
+        self.conn.executemany(
+            "INSERT INTO listings (id, address, price, rooms, district, lat, "
+            "lon) VALUES (?, ?, ?, ?, ?, ?, ?)", BASELINE_ROWS)
+        self.conn.commit()
+
+    def test_baseline_table_is_migrated_to_typed_schema(self):
+        self.load_baseline()
+
+        applied = migrate(self.conn)
+
+        self.assertEqual(applied, SCHEMA_VERSION)
+        self.assertEqual(get_version(self.conn), SCHEMA_VERSION)
+        rows = self.conn.execute(
+            "SELECT id, address, price, typeof(price), rooms, district, lat, "
+            "lon FROM listings ORDER BY id").fetchall()
+        self.assertEqual(rows, [
+            (7, "ул. Ленина, 1", 5500000, "integer", 2, "Центральный",
+             55.75, 37.61),
+            (9, "пр. Мира, 12", 12000000, "integer", 3, "Северный",
+             55.80, 37.63),
+            (12, "ул. Садовая, 3", 0, "integer", 1, "Южный", 0.0, 0.0),
+        ])
+
+    def test_migrated_keys_match_ingest(self):
+        self.load_baseline()
+        migrate(self.conn)
+
+        # Повторная загрузка тех же объявлений должна узнать их по ключу
+        for row in self.conn.execute(
+                f"SELECT {', '.join(LISTING_FIELDS)}, listing_key, "
+                f"content_hash FROM listings"):
+            values = tuple(row[:len(LISTING_FIELDS)])
+            self.assertEqual(row[-2:], (listing_key(values),
+                                        content_hash(values)))
+
+    def test_migrated_summary_matches_rebuild(self):
+        self.load_baseline()
+        migrate(self.conn)
+        sql = "SELECT * FROM listing_stats ORDER BY district, price_bucket"
+        migrated = self.conn.execute(sql).fetchall()
+
+        self.assertEqual(len(migrated), 3)
+        with self.conn:
+            rebuild_stats(self.conn)
+        self.assertEqual(self.conn.execute(sql).fetchall(), migrated)
+
+    def test_migrated_sketches_match_rebuild(self):
+        self.load_baseline()
+        self.conn.execute("ALTER TABLE listings ADD COLUMN area TEXT")
+        self.conn.execute("UPDATE listings SET area = '54,5 м²' WHERE id = 7")
+        self.conn.commit()
+        migrate(self.conn)
+        sql = ("SELECT * FROM price_sketch "
+               "ORDER BY district, rooms, metric, bucket")
+        migrated = self.conn.execute(sql).fetchall()
+
+        # Цена за м² есть только у объявления с площадью
+        self.assertEqual([row[2] for row in migrated],
+                         ["price", "price", "price_m2"])
+        with self.conn:
+            rebuild_sketches(self.conn)
+        self.assertEqual(self.conn.execute(sql).fetchall(), migrated)
+
+    def test_empty_database_gets_current_schema(self):
+        self.assertEqual(migrate(self.conn), SCHEMA_VERSION)
+        columns = [row[1] for row in
+                   self.conn.execute("PRAGMA table_info(listings)")]
+        self.assertIn("price", columns)
+        self.assertIn("area", columns)
+
+    def test_migrate_is_idempotent(self):
+        migrate(self.conn)
+        self.assertEqual(migrate(self.conn), 0)
+        self.assertEqual(get_version(self.conn), SCHEMA_VERSION)
+
+
+if __name__ == "__main__":
+    unittest.main()
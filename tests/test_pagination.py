@@ -0,0 +1,95 @@
+# tests/test_pagination.py
+"""Постраничная выдача по курсору (price, id) без OFFSET.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.DataFetcher import DataFetcher  # noqa: E402
+from frontend.cache import listings_cache  # noqa: E402
+from frontend.filters import query_listings  # noqa: E402
+from frontend.query_builder import (  # noqa: E402
+    build_filter_query,
+    make_cursor,
+    parse_cursor)
+
+PRICE_RANGE = [0, 10 ** 9]
+
+
+class CursorTest(unittest.TestCase):
+
+    def test_cursor_round_trip(self):
+        cursor = make_cursor({"price": 5500000, "id": 42})
+        self.assertEqual(parse_cursor(cursor), (5500000, 42))
+
+    def test_invalid_cursor_is_ignored(self):
+        for value in (None, "", "abc", "1:2:3", "price:id"):
+            self.assertIsNone(parse_cursor(value))
+
+    def test_keyset_condition_replaces_offset(self):
+        sql, params = build_filter_query(PRICE_RANGE, limit=10,
+                                         after=(5000000, 7))
+        self.assertIn("(price < ? OR (price = ? AND id < ?))", sql)
+        self.assertEqual(params[-5:], [5000000, 5000000, 7, 10, 0])
+
+
+class KeysetPagingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="pagination-test-")
+        self.db_path = os.path.join(self.directory, "data.db")
+        listings_cache.clear()
+        # Много одинаковых цен: порядок внутри цены задает id
+        listings = [{"price": f"{(number % 7 + 1) * 1000000} руб.",
+                     "address": f"ул. Страничная, {number}"}
+                    for number in range(53)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            DataFetcher("", db_path=self.db_path).save_to_db(listings)
+
+    def tearDown(self):
+        listings_cache.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def page(self, page_size, after):
+        rows = query_listings(PRICE_RANGE, limit=page_size + 1, after=after,
+                              db_path=self.db_path)
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            return rows, parse_cursor(make_cursor(rows[-1]))
+        return rows, None
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = [(row["price"], row["id"]) for row in
+                    query_listings(PRICE_RANGE, db_path=self.db_path)]
+        self.assertEqual(expected, sorted(expected, reverse=True))
+
+        seen = []
+        after = None
+        pages = 0
+        while True:
+            rows, after = self.page(10, after)
+            seen.extend((row["price"], row["id"]) for row in rows)
+            pages += 1
+            if after is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 6)
+
+    def test_last_full_page_has_no_next_cursor(self):
+        rows, after = self.page(53, None)
+        self.assertEqual(len(rows), 53)
+        self.assertIsNone(after)
+
+
+if __name__ == "__main__":
+    unittest.main()
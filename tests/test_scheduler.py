@@ -0,0 +1,101 @@
+# tests/test_scheduler.py
+"""Журнал фоновой загрузки: итоги по статусам и очистка старых строк.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from backend.scheduler import (  # noqa: E402
+    JOB_RETENTION,
+    IngestScheduler,
+    SourceJob,
+    job_totals)
+
+PAGE = ('<div class="listing-item"><span class="price">{price} руб.</span>'
+        '<span class="address">ул. Плановая, {number}</span></div>')
+TOTALS_SQL = ("SELECT status, jobs, inserted FROM ingest_totals "
+              "ORDER BY status")
+
+
+class IngestJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="scheduler-test-")
+        self.db_path = os.path.join(self.directory, "data.db")
+        self.page = os.path.join(self.directory, "page.html")
+        with open(self.page, "w", encoding="utf-8") as file:
+            file.write("".join(PAGE.format(price=number * 1000000,
+                                           number=number)
+                               for number in range(1, 4)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def run_once(self):
+        """Один запуск источника: планировщик останавливается после записи"""
+        job = SourceJob(self.page, interval=3600, jitter=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = IngestScheduler([job], db_path=self.db_path,
+                                        workers=1).start()
+            deadline = time.monotonic() + 10
+            while job.last_finished is None and time.monotonic() < deadline:
+                time.sleep(0.02)
+            scheduler.stop()
+        return job
+
+    def query(self, sql, params=()):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def test_totals_accumulate_per_status(self):
+        self.assertEqual(self.run_once().last_status, "ok")
+        self.assertEqual(self.run_once().last_status, "not_modified")
+
+        self.assertEqual(self.query(TOTALS_SQL),
+                         [("not_modified", 1, 0), ("ok", 1, 3)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM ingest_jobs"),
+                         [(2,)])
+
+    def test_old_journal_rows_are_pruned(self):
+        self.run_once()
+        self.query("UPDATE ingest_jobs SET started_at = started_at - ?",
+                   (JOB_RETENTION + 60,))
+        self.run_once()
+
+        # Из журнала ушел первый запуск, а итоги его помнят
+        self.assertEqual(self.query("SELECT status FROM ingest_jobs"),
+                         [("not_modified",)])
+        self.assertEqual(self.query(TOTALS_SQL),
+                         [("not_modified", 1, 0), ("ok", 1, 3)])
+
+    def test_job_totals_survive_pruning(self):
+        self.run_once()
+        self.query("UPDATE ingest_jobs SET started_at = started_at - ?",
+                   (JOB_RETENTION + 60,))
+        self.run_once()
+
+        totals = job_totals(self.db_path)
+        self.assertEqual(totals["jobs"], {"ok": 1, "not_modified": 1})
+        self.assertEqual(totals["rows"],
+                         {"inserted": 3, "updated": 0, "unchanged": 0})
+        self.assertIsNotNone(totals["last_finished"])
+
+
+if __name__ == "__main__":
+    unittest.main()